@@ -0,0 +1,66 @@
+"""Secondary index of records ordered by last-activity time."""
+
+from __future__ import annotations
+
+from bisect import bisect_left, insort
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+class ActivityIndex:
+    """Keys kept sorted by their last-activity epoch second.
+
+    ``touch`` moves a key to its new position in O(log n) search plus a list
+    shift, and "active since T" becomes a single bisect instead of a scan that
+    parses every stored timestamp.  The index is not thread-safe on its own;
+    owners call it under their existing lock.
+    """
+
+    __slots__ = ("_epochs", "_ordered")
+
+    def __init__(self, items: Iterable[Tuple[Hashable, int]] = ()) -> None:
+        self._epochs: Dict[Hashable, int] = {}
+        self._ordered: List[Tuple[int, Hashable]] = []
+        self.rebuild(items)
+
+    def rebuild(self, items: Iterable[Tuple[Hashable, int]]) -> None:
+        self._epochs = {key: int(epoch) for key, epoch in items}
+        self._ordered = sorted((epoch, key) for key, epoch in self._epochs.items())
+
+    def touch(self, key: Hashable, epoch: int) -> None:
+        previous = self._epochs.get(key)
+        if previous == epoch:
+            return
+        if previous is not None:
+            self._remove(previous, key)
+        self._epochs[key] = epoch
+        if not self._ordered or self._ordered[-1] <= (epoch, key):
+            # The common case: the key was just used, so it belongs at the end.
+            self._ordered.append((epoch, key))
+        else:
+            insort(self._ordered, (epoch, key))
+
+    def discard(self, key: Hashable) -> None:
+        previous = self._epochs.pop(key, None)
+        if previous is not None:
+            self._remove(previous, key)
+
+    def count_since(self, cutoff_epoch: int) -> int:
+        """Number of keys active strictly after ``cutoff_epoch``."""
+        return len(self._ordered) - self._first_after(cutoff_epoch)
+
+    def keys_since(self, cutoff_epoch: int) -> List[Hashable]:
+        """Keys active strictly after ``cutoff_epoch``, oldest first."""
+        return [key for _, key in self._ordered[self._first_after(cutoff_epoch):]]
+
+    def __len__(self) -> int:
+        return len(self._ordered)
+
+    def _first_after(self, cutoff_epoch: int) -> int:
+        return bisect_left(self._ordered, (int(cutoff_epoch) + 1,))
+
+    def _remove(self, epoch: int, key: Hashable) -> None:
+        position = bisect_left(self._ordered, (epoch, key))
+        if position < len(self._ordered) and self._ordered[position] == (epoch, key):
+            del self._ordered[position]
+        else:  # pragma: no cover - defensive, keeps the index consistent
+            self._ordered = [item for item in self._ordered if item[1] != key]
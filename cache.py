@@ -0,0 +1,324 @@
+"""LRU response cache with per-entry TTL, byte accounting and pluggable durable backends."""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import os
+import shelve
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Protocol, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+DEFAULT_TTL = 24 * 3600.0
+DEFAULT_BACKEND_MAX_ENTRIES = 20000
+DEFAULT_PRUNE_BATCH = 500
+PRUNE_CHUNK = 16
+
+# (value, expires_at) or None for a deletion
+CacheWrite = Tuple[str, Optional[Tuple[str, float]]]
+
+# Returned by the L1 lookup when the durable tier has to be asked
+_ASK_BACKEND = object()
+
+
+class CacheBackend(Protocol):
+    """Durable second tier; entries survive restarts and outlive L1 eviction."""
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        ...
+
+    def write_many(self, items: List[CacheWrite]) -> None:
+        ...
+
+    def prune(self, max_entries: int, now: float) -> int:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+class ShelveCacheBackend:
+    """Durable tier stored in a :mod:`shelve` file.
+
+    Expiry times are mirrored in memory (read once when the file is opened),
+    so :meth:`prune` picks its victims without unpickling the shelf and
+    returns at once while nothing has expired and the shelf is within its
+    limit.  A call deletes at most ``prune_batch`` entries, a few at a time,
+    so readers only ever wait for a short chunk; the rest go on the next flush.
+    """
+
+    def __init__(self, path: str, prune_batch: int = DEFAULT_PRUNE_BATCH) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.prune_batch = max(int(prune_batch), 1)
+        self._lock = threading.Lock()
+        self._db = shelve.open(path)
+        self._expiry: Dict[str, float] = {}
+        for key in list(self._db.keys()):
+            try:
+                self._expiry[key] = float(self._db[key][1])
+            except Exception:
+                # Unreadable entry: expire it on the next prune
+                self._expiry[key] = 0.0
+        self._next_expiry = min(self._expiry.values(), default=float("inf"))
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            return self._db.get(key)
+
+    def write_many(self, items: List[CacheWrite]) -> None:
+        with self._lock:
+            for key, entry in items:
+                if entry is None:
+                    self._db.pop(key, None)
+                    self._expiry.pop(key, None)
+                else:
+                    self._db[key] = entry
+                    self._expiry[key] = entry[1]
+                    self._next_expiry = min(self._next_expiry, entry[1])
+            self._db.sync()
+
+    def prune(self, max_entries: int, now: float) -> int:
+        with self._lock:
+            if len(self._expiry) <= max_entries and self._next_expiry > now:
+                return 0
+            expired = [(key, expires_at) for key, expires_at in self._expiry.items() if expires_at <= now]
+            overflow_count = len(self._expiry) - len(expired) - max_entries
+            victims = expired[: self.prune_batch]
+            room = self.prune_batch - len(victims)
+            if overflow_count > 0 and room > 0:
+                # Without access times, the entries closest to expiry are the oldest writes.
+                live = ((expires_at, key) for key, expires_at in self._expiry.items() if expires_at > now)
+                victims += [(key, expires_at) for expires_at, key in heapq.nsmallest(min(overflow_count, room), live)]
+        removed = 0
+        # Some dbm modules rewrite their index on every delete: release the lock between
+        # small chunks so readers are not held up for the whole batch
+        for start in range(0, len(victims), PRUNE_CHUNK):
+            with self._lock:
+                for key, expires_at in victims[start:start + PRUNE_CHUNK]:
+                    # Skip entries rewritten since they were picked
+                    if self._expiry.get(key) == expires_at:
+                        self._db.pop(key, None)
+                        del self._expiry[key]
+                        removed += 1
+        with self._lock:
+            self._next_expiry = min(self._expiry.values(), default=float("inf"))
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class SQLiteCacheBackend:
+    """Durable tier stored in the ``response_cache`` table of a :class:`sqlite_store.SQLiteStore`."""
+
+    def __init__(self, store: Any) -> None:
+        self._store = store
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        return self._store.get_cached_response(key)
+
+    def write_many(self, items: List[CacheWrite]) -> None:
+        self._store.write_cached_responses(items)
+
+    def prune(self, max_entries: int, now: float) -> int:
+        return self._store.prune_cached_responses(max_entries, now)
+
+    def close(self) -> None:
+        """The store is shared with other components and closed by its owner."""
+
+
+class ResponseCache:
+    """Thread-safe in-process LRU with per-entry TTL and a byte budget.
+
+    A hit moves the entry to the most-recently-used end; inserts evict from
+    the least-recently-used end until both ``max_entries`` and ``max_bytes``
+    hold.  With a ``backend``, an L1 miss falls through to the durable tier
+    and promotes the entry, while writes are only queued: :meth:`flush`
+    (called off the event loop) persists them in one batch and prunes the
+    backend to ``backend_max_entries``.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl: float = DEFAULT_TTL,
+        backend: Optional[CacheBackend] = None,
+        backend_max_entries: int = DEFAULT_BACKEND_MAX_ENTRIES,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.max_entries = max(int(max_entries), 1)
+        self.max_bytes = max(int(max_bytes), 1)
+        self.ttl = float(ttl)
+        self.backend = backend
+        self.backend_max_entries = max(int(backend_max_entries), 1)
+        self._clock = clock
+        self._lock = threading.Lock()
+        # key -> (value, expires_at, size)
+        self._entries: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._dirty: Dict[str, Optional[Tuple[str, float]]] = {}
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "backend_hits": 0,
+            "sets": 0,
+            "expired": 0,
+            "evicted": 0,
+            "backend_writes": 0,
+            "backend_errors": 0,
+        }
+
+    def get(self, key: str) -> Optional[str]:
+        """Look ``key`` up, reading the backend on an L1 miss (blocking)."""
+        now = self._clock()
+        value = self._get_local(key, now)
+        if value is not _ASK_BACKEND:
+            return value
+        return self._promote(key, self._backend_get(key), now)
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """Like :meth:`get`, but an L1 miss reads the backend in a worker thread, off the event loop."""
+        now = self._clock()
+        value = self._get_local(key, now)
+        if value is not _ASK_BACKEND:
+            return value
+        stored = await asyncio.to_thread(self._backend_get, key) if self.backend is not None else None
+        return self._promote(key, stored, now)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        expires_at = self._clock() + (self.ttl if ttl is None else float(ttl))
+        with self._lock:
+            self._insert(key, value, expires_at)
+            self._stats["sets"] += 1
+            if self.backend is not None:
+                self._dirty[key] = (value, expires_at)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+            if self.backend is not None:
+                self._dirty[key] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def flush(self) -> None:
+        """Write queued changes to the backend and prune it (blocking)."""
+        if self.backend is None:
+            return
+        with self._lock:
+            batch, self._dirty = self._dirty, {}
+        if not batch:
+            return
+        try:
+            self.backend.write_many(list(batch.items()))
+            self.backend.prune(self.backend_max_entries, self._clock())
+        except Exception as exc:
+            logger.error("Failed to write %s cached responses: %s", len(batch), exc)
+            with self._lock:
+                self._stats["backend_errors"] += 1
+                for key, entry in batch.items():
+                    self._dirty.setdefault(key, entry)
+            return
+        with self._lock:
+            self._stats["backend_writes"] += len(batch)
+
+    def close(self) -> None:
+        self.flush()
+        if self.backend is not None:
+            try:
+                self.backend.close()
+            except Exception as exc:
+                logger.error("Failed to close response cache backend: %s", exc)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["backend_hits"] + self._stats["misses"]
+            hits = self._stats["hits"] + self._stats["backend_hits"]
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "backend": type(self.backend).__name__ if self.backend is not None else None,
+                "pending_writes": len(self._dirty),
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                **self._stats,
+            }
+
+    # ------------------------------------------------------------------ #
+    # Internals
+    # ------------------------------------------------------------------ #
+    def _insert(self, key: str, value: str, expires_at: float) -> None:
+        # Called with ``self._lock`` held, as is ``_remove``
+        self._remove(key)
+        size = len(key) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, expires_at, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._stats["evicted"] += 1
+
+    def _get_local(self, key: str, now: float) -> Any:
+        """L1 and not-yet-flushed writes; ``_ASK_BACKEND`` when only the backend can tell."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry[0]
+                self._remove(key)
+                self._stats["expired"] += 1
+            elif key in self._dirty:
+                # Deleted, or written but not flushed yet and already evicted from L1.
+                pending = self._dirty[key]
+                if pending is not None and pending[1] > now:
+                    self._insert(key, pending[0], pending[1])
+                    self._stats["hits"] += 1
+                    return pending[0]
+                self._stats["misses"] += 1
+                return None
+        return _ASK_BACKEND
+
+    def _promote(self, key: str, stored: Optional[Tuple[str, float]], now: float) -> Optional[str]:
+        with self._lock:
+            if stored is not None and stored[1] > now and key not in self._dirty:
+                self._insert(key, stored[0], stored[1])
+                self._stats["backend_hits"] += 1
+                return stored[0]
+            self._stats["misses"] += 1
+            return None
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _backend_get(self, key: str) -> Optional[Tuple[str, float]]:
+        if self.backend is None:
+            return None
+        try:
+            stored = self.backend.get(key)
+        except Exception as exc:
+            logger.error("Response cache backend read failed: %s", exc)
+            with self._lock:
+                self._stats["backend_errors"] += 1
+            return None
+        return tuple(stored) if stored is not None else None
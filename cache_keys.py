@@ -0,0 +1,145 @@
+"""Canonical, personalization-aware cache keys for AI answers."""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import unicodedata
+from typing import Dict, Mapping, Optional, Sequence
+
+KEY_VERSION = "v1"
+
+# Follow-up requests are answered relative to the previous exchange, so their
+# answers must never be shared through the cache.
+FOLLOW_UP_KEYWORDS = (
+    "подробнее",
+    "детальнее",
+    "поподробнее",
+    "ещё",
+    "еще",
+    "расскажи больше",
+    "расскажи подробнее",
+    "больше информации",
+    "tell me more",
+    "more detail",
+)
+
+# Latin letters that render identically to Cyrillic ones (and vice versa).
+_LATIN_TO_CYRILLIC: Dict[str, str] = {
+    "a": "а", "b": "в", "c": "с", "e": "е", "h": "н", "k": "к", "m": "м",
+    "o": "о", "p": "р", "t": "т", "x": "х", "y": "у",
+}
+_CYRILLIC_TO_LATIN: Dict[str, str] = {
+    "а": "a", "с": "c", "е": "e", "о": "o", "р": "p", "х": "x", "у": "y", "к": "k",
+}
+_TO_CYRILLIC = str.maketrans(_LATIN_TO_CYRILLIC)
+_TO_LATIN = str.maketrans(_CYRILLIC_TO_LATIN)
+
+_CODE_FENCE = "```"
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _is_cyrillic(char: str) -> bool:
+    return "Ѐ" <= char <= "ӿ"
+
+
+def _strip_punctuation(token: str) -> str:
+    """Drop punctuation at the token edges; inner characters (``a.b``, ``i++``) are kept."""
+    start, end = 0, len(token)
+    while start < end and unicodedata.category(token[start]).startswith("P"):
+        start += 1
+    while end > start and unicodedata.category(token[end - 1]).startswith("P"):
+        end -= 1
+    return token[start:end]
+
+
+def _fold_lookalikes(token: str) -> str:
+    """Rewrite mixed-script tokens into the script most of their letters use."""
+    cyrillic = latin = 0
+    for char in token:
+        if _is_cyrillic(char):
+            cyrillic += 1
+        elif "a" <= char <= "z":
+            latin += 1
+    if not cyrillic or not latin:
+        return token
+    return token.translate(_TO_CYRILLIC if cyrillic >= latin else _TO_LATIN)
+
+
+def _normalize_prose(text: str) -> str:
+    tokens = []
+    for raw in _WHITESPACE_RE.split(text):
+        token = _strip_punctuation(raw)
+        if token:
+            tokens.append(_fold_lookalikes(token))
+    return " ".join(tokens)
+
+
+def normalize_question(text: str) -> str:
+    """Canonical form of a user question for cache lookups.
+
+    Applies NFKC, case folding and ``ё`` → ``е`` everywhere; outside of
+    fenced code it also collapses whitespace, strips edge punctuation and folds
+    Cyrillic/Latin lookalikes.  Fenced code keeps its characters and only
+    loses trailing whitespace, since punctuation is meaningful there.
+    """
+    text = unicodedata.normalize("NFKC", text or "").casefold().replace("ё", "е")
+    parts = text.split(_CODE_FENCE)
+    normalized = []
+    for index, part in enumerate(parts):
+        if index % 2:
+            normalized.append("\n".join(line.rstrip() for line in part.strip("\n").splitlines()))
+        else:
+            normalized.append(_normalize_prose(part))
+    return _CODE_FENCE.join(normalized).strip()
+
+
+def is_follow_up(text_lower: str) -> bool:
+    return any(keyword in text_lower for keyword in FOLLOW_UP_KEYWORDS)
+
+
+def cache_scope(skill_level: Optional[str], preferences: Optional[Mapping] = None) -> str:
+    """The personalization part of a cache key.
+
+    Only the dimensions that change the Groq prompt are included: the skill
+    level and the ``language`` / ``explanation_style`` preferences read by
+    ``EnhancedAIHandler._build_personalized_prompt``.
+    """
+    preferences = preferences or {}
+    return "|".join(
+        (
+            KEY_VERSION,
+            skill_level or "",
+            str(preferences.get("language") or ""),
+            str(preferences.get("explanation_style") or ""),
+        )
+    )
+
+
+def build_cache_key(
+    text: str,
+    skill_level: Optional[str],
+    preferences: Optional[Mapping] = None,
+) -> Optional[str]:
+    """Return the cache key for ``text`` as asked by a user with these settings.
+
+    Returns None for follow-up requests, which must not be served from the cache.
+    """
+    normalized = normalize_question(text)
+    if not normalized or is_follow_up(normalized):
+        return None
+    digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+    return f"{cache_scope(skill_level, preferences)}|{digest}"
+
+
+def shared_answer_key(question_key: Optional[str], history: Optional[Sequence] = None) -> Optional[str]:
+    """``question_key`` if the answer may be cached and shared with other users, else None.
+
+    The key covers only :func:`cache_scope`, so a shared answer must be
+    generated without anything personal: ``EnhancedAIHandler`` does that with
+    ``shared=True`` (no name, history or personal tip).  A user who already
+    has dialog history gets an answer built on it, which stays theirs.
+    """
+    if not question_key or history:
+        return None
+    return question_key
@@ -0,0 +1,38 @@
+"""Send a long answer as several Telegram messages, in order, without idling between them."""
+
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Awaitable, Callable, Iterable, List, Optional
+
+
+async def send_chunks(
+    send: Callable[[str, Any], Awaitable[Any]],
+    chunks: Iterable[str],
+    *,
+    reply_markup: Any = None,
+) -> List[Any]:
+    """Send ``chunks`` with ``send(text, reply_markup)`` and return what the sends returned.
+
+    ``reply_markup`` goes on the last message only, so the keyboard stays under
+    the end of the answer.  Delivery is pipelined: as soon as a send is
+    started the loop lets it issue its request and cuts the next chunk (see
+    ``telegram_format.iter_message_chunks``, which is lazy) while the request
+    is in flight; the next send starts only when the previous one completed,
+    so the messages arrive in order.
+    """
+    messages: List[Any] = []
+    iterator = iter(chunks)
+    current = next(iterator, None)
+    in_flight: Optional[asyncio.Future] = None
+    while current is not None:
+        following = next(iterator, None)
+        if in_flight is not None:
+            messages.append(await in_flight)
+        in_flight = asyncio.ensure_future(send(current, reply_markup if following is None else None))
+        # Let the send reach its network wait before the next chunk is prepared
+        await asyncio.sleep(0)
+        current = following
+    if in_flight is not None:
+        messages.append(await in_flight)
+    return messages
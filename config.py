@@ -1,6 +1,7 @@
 """Application configuration for the Telegram bot."""
 
 import os
+import secrets
 from pathlib import Path
 from typing import Optional
 
@@ -104,12 +105,80 @@ HUGGING_FACE_TOKEN = _require_env('HUGGING_FACE_TOKEN')
 
 GROQ_API_URL = _get_env('GROQ_API_URL', 'https://api.groq.com/openai/v1/chat/completions')
 GROQ_MODEL = _get_env('GROQ_MODEL', 'openai/gpt-oss-20b')
+GROQ_MAX_TOKENS = int(_get_env('GROQ_MAX_TOKENS', '1200'))
+# Быстрая модель для простых вопросов (пусто — та же GROQ_MODEL, но с меньшим бюджетом токенов)
+GROQ_FAST_MODEL = (_get_env('GROQ_FAST_MODEL', 'llama-3.1-8b-instant') or '').strip()
+GROQ_FAST_MAX_TOKENS = int(_get_env('GROQ_FAST_MAX_TOKENS', '600'))
+# Бюджет входных токенов на запрос и число сообщений истории, передаваемых модели
+PROMPT_MAX_INPUT_TOKENS = int(_get_env('PROMPT_MAX_INPUT_TOKENS', '3000'))
+PROMPT_HISTORY_MESSAGES = int(_get_env('PROMPT_HISTORY_MESSAGES', '6'))
 HUGGING_FACE_API_URL = _get_env('HUGGING_FACE_API_URL', 'https://api-inference.huggingface.co/models/microsoft/DialoGPT-large')
 
 TYPING_DELAY = float(_get_env('TYPING_DELAY', '1.5'))
 MAX_MESSAGE_LENGTH = int(_get_env('MAX_MESSAGE_LENGTH', '4000'))
 MAX_CONTEXT_MESSAGES = int(_get_env('MAX_CONTEXT_MESSAGES', '10'))
 
+# Лимиты запросов к Groq: одновременные вызовы и квоты аккаунта в минуту (запросы / токены)
+GROQ_MAX_IN_FLIGHT = int(_get_env('GROQ_MAX_IN_FLIGHT', '4'))
+GROQ_RPM = float(_get_env('GROQ_RPM', '30'))
+GROQ_TPM = float(_get_env('GROQ_TPM', '8000'))
+
+# Устойчивость к сбоям Groq: число попыток, порог ошибок и пауза circuit breaker (сек),
+# хеджирование — повторный запрос, если ответ дольше заданного перцентиля задержек (пусто = выключено)
+GROQ_RETRY_ATTEMPTS = int(_get_env('GROQ_RETRY_ATTEMPTS', '3'))
+GROQ_BREAKER_FAILURE_RATIO = float(_get_env('GROQ_BREAKER_FAILURE_RATIO', '0.5'))
+GROQ_BREAKER_OPEN_SECONDS = float(_get_env('GROQ_BREAKER_OPEN_SECONDS', '30'))
+_hedge_percentile = (_get_env('GROQ_HEDGE_PERCENTILE', '') or '').strip()
+GROQ_HEDGE_PERCENTILE = float(_hedge_percentile) if _hedge_percentile else None
+
+# Время на ответ ИИ целиком и на одну попытку запроса к Groq (сек). Повторы укладываются
+# в общий таймаут с запасом на подготовку промпта и обработку ответа
+AI_RESPONSE_TIMEOUT = float(_get_env('AI_RESPONSE_TIMEOUT', '30'))
+GROQ_REQUEST_TIMEOUT = float(_get_env('GROQ_REQUEST_TIMEOUT', '20'))
+GROQ_RETRY_BUDGET = max(AI_RESPONSE_TIMEOUT - 3.0, 1.0)
+
+# Потоковые ответы: текст появляется по мере генерации, сообщение редактируется не чаще интервала (сек)
+STREAM_RESPONSES = _get_env('STREAM_RESPONSES', '1').strip().lower() not in ('0', 'false', 'no', '')
+STREAM_EDIT_INTERVAL = float(_get_env('STREAM_EDIT_INTERVAL', '1.5'))
+
+# Очередь отправки в Telegram: общий лимит (сообщений/сек), лимиты на личный чат (сообщений/сек)
+# и на группу (сообщений/мин), число повторов после flood control (RetryAfter)
+SEND_GLOBAL_RATE = float(_get_env('SEND_GLOBAL_RATE', '30'))
+SEND_PRIVATE_RATE = float(_get_env('SEND_PRIVATE_RATE', '1'))
+SEND_GROUP_RATE_PER_MINUTE = float(_get_env('SEND_GROUP_RATE_PER_MINUTE', '20'))
+SEND_MAX_RETRIES = int(_get_env('SEND_MAX_RETRIES', '3'))
+
+# Параллельная обработка обновлений: сколько обрабатывается одновременно (обновления одного
+# пользователя — строго по очереди) и сколько принятых, но не обработанных, допускается
+UPDATE_WORKERS = int(_get_env('UPDATE_WORKERS', '16'))
+UPDATE_MAX_PENDING = int(_get_env('UPDATE_MAX_PENDING', '1024'))
+
+# Режим webhook вместо long polling: публичный адрес сервиса (пусто = polling, на Render —
+# https://<имя>.onrender.com), путь приёмника и секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+# (пусто = случайный при каждом запуске, webhook всё равно регистрируется заново)
+WEBHOOK_URL = (_get_env('WEBHOOK_URL', '') or '').strip().rstrip('/')
+WEBHOOK_PATH = '/' + (_get_env('WEBHOOK_PATH', '/telegram/webhook') or '').strip().strip('/')
+WEBHOOK_SECRET = (_get_env('WEBHOOK_SECRET', '') or '').strip() or secrets.token_urlsafe(32)
+
+# Контексты диалогов: LRU-лимит, время простоя (сек), файл хранения и период пакетной записи (сек)
+CONTEXT_MAX_USERS = int(_get_env('CONTEXT_MAX_USERS', '5000'))
+CONTEXT_IDLE_TTL = float(_get_env('CONTEXT_IDLE_TTL', '21600'))
+CONTEXT_SPILL_PATH = _get_env('CONTEXT_SPILL_PATH', 'contexts.shelve')
+CONTEXT_FLUSH_INTERVAL = float(_get_env('CONTEXT_FLUSH_INTERVAL', '30'))
+
+# Кэш ответов: memory, shelve или sqlite (по умолчанию sqlite при STORAGE_BACKEND=sqlite, иначе memory)
+RESPONSE_CACHE_BACKEND = (_get_env('RESPONSE_CACHE_BACKEND', '') or '').strip().lower()
+RESPONSE_CACHE_PATH = _get_env('RESPONSE_CACHE_PATH', 'response_cache.shelve')
+RESPONSE_CACHE_MAX_ENTRIES = int(_get_env('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+RESPONSE_CACHE_MAX_BYTES = int(_get_env('RESPONSE_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = float(_get_env('RESPONSE_CACHE_TTL', '86400'))
+RESPONSE_CACHE_DISK_MAX_ENTRIES = int(_get_env('RESPONSE_CACHE_DISK_MAX_ENTRIES', '20000'))
+
+# Семантический кэш: похожие по формулировке вопросы (требует numpy)
+SEMANTIC_CACHE_ENABLED = _get_env('SEMANTIC_CACHE_ENABLED', '1').strip().lower() not in ('0', 'false', 'no', '')
+SEMANTIC_CACHE_CAPACITY = int(_get_env('SEMANTIC_CACHE_CAPACITY', '1000'))
+SEMANTIC_CACHE_THRESHOLD = float(_get_env('SEMANTIC_CACHE_THRESHOLD', '0.82'))
+
 CREATOR_USERNAME = _get_env('CREATOR_USERNAME', '@vadzim_belarus')
 TELEGRAM_GROUP_USERNAME = _normalize_username(
     _get_env('TELEGRAM_GROUP_USERNAME', '@learncoding_team'),
@@ -0,0 +1,329 @@
+"""Bounded LRU/idle-TTL store for per-user conversation contexts."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import shelve
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Protocol, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_IDLE_TTL = 6 * 3600.0
+DEFAULT_FLUSH_INTERVAL = 30.0
+
+_LOAD = object()
+
+
+def _encode(state: Dict[str, Any]) -> str:
+    return json.dumps(state, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+
+
+class ContextSpill(Protocol):
+    """Durable tier holding the serialised state of contexts."""
+
+    def load(self, user_id: int) -> Optional[str]:
+        ...
+
+    def save_many(self, items: List[Tuple[int, str]]) -> None:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+class ShelveSpill:
+    """Spill tier backed by a :mod:`shelve` file on local disk."""
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(os.path.abspath(path))
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = shelve.open(path)
+
+    def load(self, user_id: int) -> Optional[str]:
+        with self._lock:
+            return self._db.get(str(user_id))
+
+    def save_many(self, items: List[Tuple[int, str]]) -> None:
+        with self._lock:
+            for user_id, data in items:
+                self._db[str(user_id)] = data
+            self._db.sync()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class SQLiteContextSpill:
+    """Spill tier stored in the ``contexts`` table of a :class:`sqlite_store.SQLiteStore`."""
+
+    def __init__(self, store: Any) -> None:
+        self._store = store
+
+    def load(self, user_id: int) -> Optional[str]:
+        return self._store.get_context(user_id)
+
+    def save_many(self, items: List[Tuple[int, str]]) -> None:
+        self._store.upsert_contexts(items)
+
+    def close(self) -> None:
+        """The store is shared with other components and closed by its owner."""
+
+
+class ContextStore:
+    """Keep at most ``max_entries`` contexts, evicting the least recently used.
+
+    Contexts idle for longer than ``idle_ttl`` seconds are dropped as well.
+    Entries are ordered by last access, so expired ones are always at the
+    front and are swept on each access in amortised O(1) without a timer.
+
+    With a ``spill`` tier, contexts are loaded lazily on first access
+    (``factory.from_state``) and nothing is read at start-up;
+    :meth:`get_async` does that read in a worker thread.  Changes are not
+    written immediately: :meth:`collect_dirty` returns the serialised
+    ``to_state()`` of contexts that changed since they were last written,
+    including evicted ones, so the owner can persist them in one batch off the
+    event loop with :meth:`write` and report the outcome back with
+    :meth:`complete_write`.  Until then an evicted context is rehydrated from
+    the batch, not from the older state in the spill.  The short conversation
+    history is not part of the state.
+    """
+
+    def __init__(
+        self,
+        factory: Any,
+        *,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        idle_ttl: float = DEFAULT_IDLE_TTL,
+        spill: Optional[ContextSpill] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._factory = factory
+        self._max_entries = max(int(max_entries), 1)
+        self._idle_ttl = float(idle_ttl)
+        self._spill = spill
+        self._clock = clock
+        # user_id -> [context, last access time, last written state]
+        self._entries: "OrderedDict[int, list]" = OrderedDict()
+        self._touched: set = set()
+        self._pending: Dict[int, str] = {}
+        # Collected and handed to a writer, not yet confirmed as stored
+        self._writing: Dict[int, str] = {}
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "created": 0,
+            "rehydrated": 0,
+            "evicted_lru": 0,
+            "evicted_ttl": 0,
+            "written": 0,
+            "spill_errors": 0,
+        }
+
+    @property
+    def spill(self) -> Optional[ContextSpill]:
+        return self._spill
+
+    def get(self, user_id: int) -> Any:
+        """Return the context for ``user_id``, rehydrating or creating it on a miss."""
+        return self._get(user_id, _LOAD)
+
+    async def get_async(self, user_id: int) -> Any:
+        """Like :meth:`get`, but a miss reads the spill tier in a worker thread, off the event loop."""
+        if self._spill is None or not self._needs_load(user_id):
+            return self._get(user_id, _LOAD)
+        try:
+            stored = await asyncio.to_thread(self._spill.load, user_id)
+        except Exception as exc:
+            self._load_failed(user_id, exc)
+            stored = None
+        # Another handler may have loaded or changed the context meanwhile: its state wins
+        return self._get(user_id, stored if self._needs_load(user_id) else _LOAD)
+
+    def _get(self, user_id: int, stored: Any) -> Any:
+        now = self._clock()
+        self._expire(now)
+        self._touched.add(user_id)
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            self._stats["hits"] += 1
+            entry[1] = now
+            self._entries.move_to_end(user_id)
+            return entry[0]
+
+        self._stats["misses"] += 1
+        context, saved = self._rehydrate(user_id, stored)
+        if context is None:
+            context = self._factory()
+            # A fresh context is only worth writing once it differs from the defaults.
+            saved = _encode(context.to_state())
+            self._stats["created"] += 1
+        self._entries[user_id] = [context, now, saved]
+        while len(self._entries) > self._max_entries:
+            self._evict_oldest("evicted_lru")
+        return context
+
+    def peek(self, user_id: int) -> Optional[Any]:
+        """Return a resident context without touching recency or the spill tier."""
+        entry = self._entries.get(user_id)
+        return entry[0] if entry is not None else None
+
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def expire(self) -> int:
+        """Drop idle contexts now; returns how many were evicted."""
+        before = self._stats["evicted_ttl"]
+        self._expire(self._clock())
+        return self._stats["evicted_ttl"] - before
+
+    def collect_dirty(self) -> List[Tuple[int, str]]:
+        """Return ``(user_id, serialised state)`` for every context changed since its last write.
+
+        Must be called from the thread that owns the store; the returned
+        strings are immutable, so writing them elsewhere is safe.  The batch
+        stays readable by :meth:`get` until :meth:`complete_write`.
+        """
+        if self._spill is None:
+            self._touched.clear()
+            return []
+        batch = self._pending
+        self._pending = {}
+        for user_id in self._touched:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                continue
+            encoded = _encode(entry[0].to_state())
+            if encoded != entry[2]:
+                entry[2] = encoded
+                batch[user_id] = encoded
+        self._touched = set()
+        self._writing.update(batch)
+        return list(batch.items())
+
+    def write(self, items: Iterable[Tuple[int, str]]) -> bool:
+        """Persist a batch from :meth:`collect_dirty`; True when it was stored.
+
+        Blocking, so run it off the event loop.  It only touches the spill
+        tier: pass the result to :meth:`complete_write` on the owning thread.
+        """
+        items = list(items)
+        if not items or self._spill is None:
+            return True
+        try:
+            self._spill.save_many(items)
+        except Exception as exc:
+            logger.error("Failed to write %s contexts: %s", len(items), exc)
+            return False
+        return True
+
+    def complete_write(self, items: Iterable[Tuple[int, str]], stored: bool) -> None:
+        """Record the outcome of :meth:`write` for ``items`` (owning thread only)."""
+        items = list(items)
+        if not items:
+            return
+        if stored:
+            self._stats["written"] += len(items)
+        else:
+            self._stats["spill_errors"] += 1
+        for user_id, data in items:
+            if self._writing.get(user_id) == data:
+                del self._writing[user_id]
+            if not stored:
+                # Keep them for the next batch unless a newer state is already queued.
+                self._pending.setdefault(user_id, data)
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            "size": len(self._entries),
+            "max_entries": self._max_entries,
+            "idle_ttl": self._idle_ttl,
+            "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+            "pending_writes": len(self._pending),
+            "writes_in_flight": len(self._writing),
+            **self._stats,
+        }
+
+    def close(self) -> None:
+        """Write every changed context and close the spill tier."""
+        if self._spill is None:
+            return
+        self._touched.update(self._entries)
+        self.collect_dirty()
+        # Batches whose outcome never reached the store are written again, with everything else
+        batch = list(self._writing.items())
+        self.complete_write(batch, self.write(batch))
+        try:
+            self._spill.close()
+        except Exception as exc:
+            logger.error("Failed to close context spill tier: %s", exc)
+
+    # ------------------------------------------------------------------ #
+    # Internals
+    # ------------------------------------------------------------------ #
+    def _expire(self, now: float) -> None:
+        if self._idle_ttl <= 0:
+            return
+        deadline = now - self._idle_ttl
+        while self._entries:
+            oldest = next(iter(self._entries.values()))
+            if oldest[1] > deadline:
+                break
+            self._evict_oldest("evicted_ttl")
+
+    def _evict_oldest(self, reason: str) -> None:
+        user_id, (context, _, saved) = self._entries.popitem(last=False)
+        self._stats[reason] += 1
+        self._touched.discard(user_id)
+        if self._spill is None:
+            return
+        encoded = _encode(context.to_state())
+        if encoded != saved:
+            self._pending[user_id] = encoded
+
+    def _needs_load(self, user_id: int) -> bool:
+        return user_id not in self._entries and user_id not in self._pending and user_id not in self._writing
+
+    def _load_failed(self, user_id: int, exc: Exception) -> None:
+        self._stats["spill_errors"] += 1
+        logger.error("Failed to load context for %s: %s", user_id, exc)
+
+    def _rehydrate(self, user_id: int, stored: Any = _LOAD) -> Tuple[Optional[Any], Optional[str]]:
+        if self._spill is None:
+            return None, None
+        # Newest first: queued, then being written, then the spill tier
+        raw = self._pending.get(user_id)
+        if raw is None:
+            raw = self._writing.get(user_id)
+        if raw is None and stored is not _LOAD:
+            raw = stored
+        elif raw is None:
+            try:
+                raw = self._spill.load(user_id)
+            except Exception as exc:
+                self._load_failed(user_id, exc)
+                return None, None
+        if raw is None:
+            return None, None
+        try:
+            state = json.loads(raw) if isinstance(raw, str) else raw
+        except json.JSONDecodeError as exc:
+            self._stats["spill_errors"] += 1
+            logger.error("Corrupt stored context for %s: %s", user_id, exc)
+            return None, None
+        self._stats["rehydrated"] += 1
+        return self._factory.from_state(state), _encode(state)
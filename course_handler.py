@@ -10,11 +10,14 @@ from datetime import datetime
 from typing import Dict, List, Optional
 
 from dotenv import load_dotenv
-from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, ExtBot
 from telegram.error import TelegramError
 
 from permissions import is_admin_identity
+from persistence import persistence
+from send_queue import send_queue
+from sqlite_store import get_default_store
 # Загружаем переменные окружения
 load_dotenv()
 
@@ -43,12 +46,16 @@ class CourseHandler:
     """Обработчик команд курса"""
     
     def __init__(self):
-        self.bot = Bot(token=BOT_TOKEN) if BOT_TOKEN else None
+        # Тот же токен, что у основного бота, поэтому и очередь отправки с её лимитами общая
+        self.bot = ExtBot(token=BOT_TOKEN, rate_limiter=send_queue) if BOT_TOKEN else None
         self.current_index = self.load_index()
         
     def load_index(self) -> int:
         """Загрузить текущий индекс урока"""
         try:
+            store = get_default_store()
+            if store is not None:
+                return int(store.get_state('lesson_index', 0))
             if os.path.exists(STATE_FILE):
                 with open(STATE_FILE, 'r', encoding='utf-8') as f:
                     data = json.load(f)
@@ -61,6 +68,11 @@ class CourseHandler:
         """Сохранить текущий индекс урока"""
         try:
             data = {'lesson_index': index, 'last_updated': datetime.now().isoformat()}
+            store = get_default_store()
+            if store is not None:
+                store.set_state('lesson_index', index)
+                store.set_state('last_updated', data['last_updated'])
+                return
             with open(STATE_FILE, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
         except Exception as e:
@@ -148,7 +160,7 @@ class CourseHandler:
                 logger.warning(f"Не удалось закрепить сообщение: {e}")
             
             # Сохраняем индекс
-            self.save_index(lesson_index + 1)
+            await persistence.submit(self.save_index, lesson_index + 1)
             
             logger.info(f"Урок {lesson_index + 1} отправлен в чат {chat_id}")
             return True
@@ -296,14 +308,14 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     return
                 
                 # Получаем следующий урок для пользователя
-                next_lesson = progress_manager.get_next_lesson(user_id)
+                next_lesson = await persistence.run(progress_manager.get_next_lesson, user_id)
                 
                 # Отправляем урок пользователю
                 success = await course_handler.send_lesson(chat_id, next_lesson, user_id)
                 
                 if success:
                     # Обновляем прогресс пользователя
-                    progress_manager.update_user_progress(user_id, next_lesson)
+                    await persistence.submit(progress_manager.update_user_progress, user_id, next_lesson)
                     
                     await query.edit_message_text(
                         f"✅ Отлично! Урок {next_lesson + 1} отправлен!\n\n"
@@ -331,7 +343,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 
                 if success:
                     # Обновляем прогресс пользователя
-                    progress_manager.update_user_progress(user_id, lesson_index)
+                    await persistence.submit(progress_manager.update_user_progress, user_id, lesson_index)
                     
                     await query.edit_message_text(
                         f"✅ Урок {lesson_index + 1} отправлен!\n\n"
@@ -388,7 +400,7 @@ async def progress_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда для просмотра прогресса"""
     try:
         user_id = update.effective_user.id
-        stats = progress_manager.get_user_stats(user_id)
+        stats = await persistence.run(progress_manager.get_user_stats, user_id)
         
         progress_text = f"""📊 <b>Ваш прогресс в курсе:</b>
 
@@ -412,7 +424,7 @@ async def reset_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда для сброса прогресса"""
     try:
         user_id = update.effective_user.id
-        progress_manager.reset_user_progress(user_id)
+        await persistence.run(progress_manager.reset_user_progress, user_id)
         
         await update.message.reply_text(
             "🔄 Ваш прогресс сброшен!\n\n"
@@ -473,7 +485,7 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         # Получаем статистику группы
-        group_stats = progress_manager.get_group_stats()
+        group_stats = await persistence.run(progress_manager.get_group_stats)
         
         stats_text = f"""📊 <b>СТАТИСТИКА ГРУППЫ</b>
 
@@ -516,14 +528,14 @@ async def next_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         
         # Получаем следующий урок для пользователя
-        next_lesson = progress_manager.get_next_lesson(user_id)
+        next_lesson = await persistence.run(progress_manager.get_next_lesson, user_id)
         
         # Отправляем урок пользователю
         success = await course_handler.send_lesson(chat_id, next_lesson, user_id)
         
         if success:
             # Обновляем прогресс пользователя
-            progress_manager.update_user_progress(user_id, next_lesson)
+            await persistence.submit(progress_manager.update_user_progress, user_id, next_lesson)
             
             await update.message.reply_text(
                 f"✅ Урок {next_lesson + 1} отправлен!\n\n"
@@ -12,6 +12,17 @@ from datetime import datetime, timedelta
 from threading import RLock
 from typing import Dict, List, Optional
 
+from activity_index import ActivityIndex
+from journal import (
+    DEFAULT_COMPACT_CHANGES,
+    DEFAULT_COMPACT_INTERVAL,
+    DEFAULT_FSYNC_INTERVAL,
+    WriteBehindJournal,
+)
+from records import UserRecord, records_from_mapping, records_to_mapping
+from sheets_sync import DEFAULT_FLUSH_INTERVAL, SheetsSyncEngine
+from sqlite_store import SQLiteStore, get_default_store
+
 try:
     import gspread  # type: ignore
     from google.oauth2.service_account import Credentials  # type: ignore
@@ -21,10 +32,14 @@ except ImportError:  # pragma: no cover - optional dependency
 
 DEFAULT_DB_FILE = "users.json"
 ENV_DB_FILE_VAR = "USER_DB_FILE"
+ENV_COMPACT_INTERVAL = "USER_DB_COMPACT_INTERVAL"
+ENV_COMPACT_CHANGES = "USER_DB_COMPACT_CHANGES"
+ENV_FSYNC_INTERVAL = "USER_DB_FSYNC_INTERVAL"
 
 ENV_SHEETS_CREDENTIALS = "GOOGLE_SHEETS_CREDENTIALS"
 ENV_SHEETS_SPREADSHEET = "GOOGLE_SHEETS_SPREADSHEET"
 ENV_SHEETS_WORKSHEET = "GOOGLE_SHEETS_WORKSHEET"
+ENV_SHEETS_FLUSH_INTERVAL = "GOOGLE_SHEETS_FLUSH_INTERVAL"
 
 SHEETS_SCOPES = ("https://www.googleapis.com/auth/spreadsheets",)
 SHEET_HEADERS = [
@@ -63,19 +78,41 @@ def _decode_credentials(raw_value: str) -> Dict:
         raise ValueError("Invalid GOOGLE_SHEETS_CREDENTIALS payload") from exc
 
 
+def _env_number(name: str, default, cast):
+    """Read a numeric tuning knob, falling back to ``default`` on bad input."""
+    raw = os.getenv(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        return cast(raw)
+    except ValueError:
+        logger.warning("Ignoring invalid %s=%r", name, raw)
+        return default
+
+
 class UserDatabase:
-    """Storage for user statistics with support for Google Sheets or local JSON."""
+    """Storage for user statistics backed by SQLite, Google Sheets or local JSON.
+
+    ``STORAGE_BACKEND=sqlite`` takes precedence, then Google Sheets when its
+    credentials are configured, then the journalled JSON file.
+
+    In memory, users are kept as :class:`records.UserRecord` objects keyed by
+    the integer Telegram id; every backend still stores the JSON dict shape.
+    """
 
     def __init__(self, db_file: Optional[str] = None) -> None:
         self._lock = RLock()
         self._use_sheets = False
         self._worksheet = None
+        self._journal: Optional[WriteBehindJournal] = None
+        self._sheet_sync: Optional[SheetsSyncEngine] = None
+        self._store: Optional[SQLiteStore] = get_default_store() if db_file is None else None
 
         creds_blob = os.getenv(ENV_SHEETS_CREDENTIALS)
         spreadsheet_ref = os.getenv(ENV_SHEETS_SPREADSHEET)
         worksheet_name = os.getenv(ENV_SHEETS_WORKSHEET, "Users")
 
-        want_sheets = db_file is None and bool(creds_blob and spreadsheet_ref)
+        want_sheets = db_file is None and self._store is None and bool(creds_blob and spreadsheet_ref)
         logger.info(
             "DB backend bootstrap: want_sheets=%s, have_creds=%s, spreadsheet_set=%s, worksheet=%s",
             want_sheets,
@@ -91,8 +128,11 @@ class UserDatabase:
             except Exception as exc:
                 logger.error("Failed to decode GOOGLE_SHEETS_CREDENTIALS: %s", exc)
 
-        if db_file is None and self._init_google_sheets_backend():
+        if self._store is not None:
             self.db_file: Optional[str] = None
+            logger.info("User database configured to use SQLite (%s).", self._store.path)
+        elif db_file is None and self._init_google_sheets_backend():
+            self.db_file = None
             logger.info(
                 "User database configured to use Google Sheets (worksheet: %s).",
                 self._worksheet.title if self._worksheet else "unknown",
@@ -108,9 +148,31 @@ class UserDatabase:
                 except OSError as exc:
                     logger.error("Failed to create directory for the user DB at %s: %s", directory, exc)
             self.db_file = path
+            self._journal = WriteBehindJournal(
+                path,
+                lambda: records_to_mapping(self.users_data.items()),
+                self._lock,
+                compact_interval=_env_number(ENV_COMPACT_INTERVAL, DEFAULT_COMPACT_INTERVAL, float),
+                compact_changes=_env_number(ENV_COMPACT_CHANGES, DEFAULT_COMPACT_CHANGES, int),
+                fsync_interval=_env_number(ENV_FSYNC_INTERVAL, DEFAULT_FSYNC_INTERVAL, float),
+            )
 
-        self.users_data: Dict[str, Dict] = self._load_data()
-        atexit.register(self._save_data)
+        self.users_data: Dict[int, UserRecord] = records_from_mapping(UserRecord, self._load_data())
+        self._activity = ActivityIndex(
+            (user_id, record.last_active_ts or 0) for user_id, record in self.users_data.items()
+        )
+        if self._journal is not None:
+            self._journal.start()
+        if self._use_sheets and self._worksheet is not None:
+            self._sheet_sync = SheetsSyncEngine(
+                self._worksheet,
+                SHEET_HEADERS,
+                self._sheet_row,
+                self._lock,
+                flush_interval=_env_number(ENV_SHEETS_FLUSH_INTERVAL, DEFAULT_FLUSH_INTERVAL, float),
+            )
+            self._sheet_sync.start()
+        atexit.register(self.close)
 
     # ------------------------------------------------------------------ #
     # Backend initialisation
@@ -160,21 +222,16 @@ class UserDatabase:
     # Data load/save helpers
     # ------------------------------------------------------------------ #
     def _load_data(self) -> Dict[str, Dict]:
+        if self._store is not None:
+            return self._store.load_users()
         if self._use_sheets and self._worksheet:
             return self._load_from_sheet()
         return self._load_from_file()
 
     def _load_from_file(self) -> Dict[str, Dict]:
-        path = self.db_file
-        if not path:
+        if self._journal is None:
             return {}
-        if os.path.exists(path):
-            try:
-                with open(path, "r", encoding="utf-8") as fh:
-                    return json.load(fh)
-            except (OSError, json.JSONDecodeError) as exc:
-                logger.error("Error loading database %s: %s", path, exc)
-        return {}
+        return self._journal.load()
 
     def _load_from_sheet(self) -> Dict[str, Dict]:  # pragma: no cover - external I/O
         assert self._worksheet is not None
@@ -219,85 +276,126 @@ class UserDatabase:
         return users
 
     def _save_data(self) -> None:
-        if self._use_sheets and self._worksheet:
+        if self._store is not None:
+            with self._lock:
+                self._store.upsert_users(records_to_mapping(self.users_data.items()))
+        elif self._use_sheets and self._worksheet:
             self._save_to_sheet()
         else:
             self._save_to_file()
 
     def _save_to_file(self) -> None:
-        path = self.db_file
-        if not path:
-            return
-        with self._lock:
-            try:
-                with open(path, "w", encoding="utf-8") as fh:
-                    json.dump(self.users_data, fh, ensure_ascii=False, indent=2)
-            except OSError as exc:
-                logger.error("Error saving database %s: %s", path, exc)
+        if self._journal is not None:
+            self._journal.compact(force=True)
+
+    def _record_change(self, user_id: int) -> None:
+        """Persist a single mutated record.
+
+        The file backend appends one journal line; the full snapshot is only
+        rewritten by the journal's background compaction.  SQLite performs a
+        single-row upsert and the Sheets backend marks the row dirty for the
+        background sync engine.
+        """
+        record = self.users_data.get(user_id)
+        if record is not None:
+            self._activity.touch(user_id, record.last_active_ts or 0)
+        if self._store is not None:
+            if record is not None:
+                self._store.upsert_user(user_id, record.to_dict())
+        elif self._journal is not None:
+            self._journal.append(user_id, record.to_dict() if record is not None else None)
+        elif self._sheet_sync is not None:
+            self._sheet_sync.mark_dirty(str(user_id))
+
+    def close(self) -> None:
+        """Flush pending changes; registered with ``atexit``."""
+        if self._journal is not None:
+            self._journal.close()
+        if self._sheet_sync is not None:
+            self._sheet_sync.close()
+
+    @staticmethod
+    def _record_to_row(record: Dict) -> List:
+        return [
+            record.get("user_id", ""),
+            record.get("username") or "",
+            record.get("first_name") or "",
+            record.get("preferred_language") or "",
+            record.get("skill_level") or "",
+            record.get("total_questions", 0),
+            "; ".join(record.get("favorite_topics", [])),
+            record.get("created_at") or "",
+            record.get("last_active") or "",
+        ]
+
+    def _sheet_row(self, user_key: str) -> Optional[List]:
+        record = self.users_data.get(int(user_key))
+        return self._record_to_row(record) if record is not None else None
 
     def _save_to_sheet(self) -> None:  # pragma: no cover - external I/O
+        """Rewrite the whole worksheet; only used for explicit full uploads."""
         assert self._worksheet is not None
         with self._lock:
             try:
-                rows: List[List] = []
-                for user_key in sorted(self.users_data.keys(), key=lambda key: int(key)):
-                    record = self.users_data[user_key]
-                    rows.append(
-                        [
-                            record.get("user_id", ""),
-                            record.get("username") or "",
-                            record.get("first_name") or "",
-                            record.get("preferred_language") or "",
-                            record.get("skill_level") or "",
-                            record.get("total_questions", 0),
-                            "; ".join(record.get("favorite_topics", [])),
-                            record.get("created_at") or "",
-                            record.get("last_active") or "",
-                        ]
-                    )
+                rows: List[List] = [
+                    self._record_to_row(self.users_data[user_id]) for user_id in sorted(self.users_data)
+                ]
 
                 self._worksheet.clear()
                 self._worksheet.update("A1", [SHEET_HEADERS] + rows)
             except Exception as exc:
                 logger.error("Error saving data to Google Sheet: %s", exc)
+                return
+        if self._sheet_sync is not None:
+            self._sheet_sync.rebuild_index()
 
     # ------------------------------------------------------------------ #
     # Public API
     # ------------------------------------------------------------------ #
-    def get_user(self, user_id: int) -> Dict:
-        user_key = str(user_id)
+    def get_user(self, user_id: int) -> UserRecord:
+        user_id = int(user_id)
+        with self._lock:
+            record = self.users_data.get(user_id)
+            if record is None:
+                now = int(datetime.now().timestamp())
+                record = UserRecord(user_id=user_id, created_at=now, last_active=now)
+                self.users_data[user_id] = record
+                self._record_change(user_id)
+            return record
+
+    def peek_user_snapshot(self, user_id: int) -> Optional[Dict]:
+        """Copy of the user's record, or None; never creates one, so it is cheap enough for the event loop."""
         with self._lock:
-            if user_key not in self.users_data:
-                now_iso = datetime.now().isoformat()
-                self.users_data[user_key] = {
-                    "user_id": user_id,
-                    "username": None,
-                    "first_name": None,
-                    "preferred_language": None,
-                    "skill_level": "intermediate",
-                    "total_questions": 0,
-                    "favorite_topics": [],
-                    "created_at": now_iso,
-                    "last_active": now_iso,
-                }
-                self._save_data()
-            return self.users_data[user_key]
+            record = self.users_data.get(int(user_id))
+            return record.to_dict() if record is not None else None
+
+    def snapshot_users(self) -> List[Dict]:
+        """Copies of every record, taken under the lock so no writer changes them midway."""
+        with self._lock:
+            return [record.to_dict() for record in self.users_data.values()]
+
+    def replace_all(self, users: Dict) -> None:
+        """Replace every user with ``users`` (a JSON-style mapping) and save them all."""
+        with self._lock:
+            self.users_data = records_from_mapping(UserRecord, users)
+            self._activity.rebuild(
+                (user_id, record.last_active_ts or 0) for user_id, record in self.users_data.items()
+            )
+        self._save_data()
 
     def update_user(self, user_id: int, updates: Dict) -> None:
         with self._lock:
             record = self.get_user(user_id)
             record.update(updates)
-            record["last_active"] = datetime.now().isoformat()
-            self.users_data[str(user_id)] = record
-            self._save_data()
+            record.last_active_ts = int(datetime.now().timestamp())
+            self._record_change(record.user_id)
 
     def increment_questions(self, user_id: int) -> None:
         with self._lock:
             record = self.get_user(user_id)
-            record["total_questions"] = record.get("total_questions", 0) + 1
-            record["last_active"] = datetime.now().isoformat()
-            self.users_data[str(user_id)] = record
-            self._save_data()
+            record.total_questions = (record.total_questions or 0) + 1
+            record.last_active_ts = int(datetime.now().timestamp())
+            self._record_change(record.user_id)
 
     def add_topic_interest(self, user_id: int, topic: str) -> None:
         topic = topic.strip()
@@ -305,14 +403,10 @@ class UserDatabase:
             return
         with self._lock:
             record = self.get_user(user_id)
-            topics = record.setdefault("favorite_topics", [])
-            if topic not in topics:
-                topics.append(topic)
-                record["favorite_topics"] = topics[-10:]  # keep last 10
+            if record.add_topic(topic, keep=10):  # keep last 10
                 logger.info("User %s added topic interest %s", user_id, topic)
-            record["last_active"] = datetime.now().isoformat()
-            self.users_data[str(user_id)] = record
-            self._save_data()
+            record.last_active_ts = int(datetime.now().timestamp())
+            self._record_change(record.user_id)
 
     def get_user_stats(self, user_id: int) -> Dict:
         record = self.get_user(user_id)
@@ -328,19 +422,16 @@ class UserDatabase:
         with self._lock:
             return len(self.users_data)
 
-    def get_active_users(self, days: int = 7) -> List[Dict]:
-        cutoff = datetime.now() - timedelta(days=days)
-        active: List[Dict] = []
+    def count_active_users(self, days: int = 7) -> int:
+        cutoff = int((datetime.now() - timedelta(days=days)).timestamp())
         with self._lock:
-            for record in self.users_data.values():
-                last_active_str = record.get("last_active")
-                try:
-                    last_active = datetime.fromisoformat(last_active_str) if last_active_str else None
-                except ValueError:
-                    last_active = None
-                if last_active and last_active > cutoff:
-                    active.append(record)
-        return active
+            return self._activity.count_since(cutoff)
+
+    def get_active_users(self, days: int = 7) -> List[UserRecord]:
+        cutoff = int((datetime.now() - timedelta(days=days)).timestamp())
+        with self._lock:
+            keys = self._activity.keys_since(cutoff)
+            return [self.users_data[key] for key in keys if key in self.users_data]
 
 
 user_db = UserDatabase()
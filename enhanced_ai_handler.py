@@ -3,12 +3,57 @@ Enhanced AI Handler - с правильным форматированием к
 """
 
 import asyncio
+import functools
 import logging
 import random
 import re
-from typing import List, Optional, Set, Tuple
+import time
+from types import SimpleNamespace
+from typing import Callable, FrozenSet, List, Mapping, Optional, Set, Tuple
 from groq import AsyncGroq
-from config import GROQ_API_KEY, GROQ_MODEL, SYSTEM_PROMPT
+from cache_keys import FOLLOW_UP_KEYWORDS
+from config import (
+    GROQ_API_KEY,
+    GROQ_BREAKER_FAILURE_RATIO,
+    GROQ_BREAKER_OPEN_SECONDS,
+    GROQ_FAST_MAX_TOKENS,
+    GROQ_FAST_MODEL,
+    GROQ_HEDGE_PERCENTILE,
+    GROQ_MAX_IN_FLIGHT,
+    GROQ_MAX_TOKENS,
+    GROQ_MODEL,
+    GROQ_REQUEST_TIMEOUT,
+    GROQ_RETRY_ATTEMPTS,
+    GROQ_RETRY_BUDGET,
+    GROQ_RPM,
+    GROQ_TPM,
+    PROMPT_HISTORY_MESSAGES,
+    PROMPT_MAX_INPUT_TOKENS,
+    SYSTEM_PROMPT,
+)
+from groq_scheduler import PRIORITY_HIGH, PRIORITY_NORMAL, GroqScheduler
+from message_analysis import MessageAnalysis
+from message_keywords import (
+    MESSAGE_KEYWORDS,
+    NEGATIVE_KEYWORDS,
+    POSITIVE_KEYWORDS,
+    SMALL_TALK_CATEGORIES,
+    SMALL_TALK_PRESETS,
+    SMALL_TALK_QUESTIONS,
+    TONE_KEYWORDS,
+)
+from model_router import ModelRouter
+from prompt_budget import PromptBudget
+from prompt_templates import (
+    ANSWER_RULES,
+    CLOSING,
+    FOLLOW_UP_SECTION,
+    VADZIM_CONTEXT,
+    VADZIM_KEYWORDS,
+    instruction_head,
+    quick_responses,
+)
+from resilience import CircuitBreaker, CircuitOpenError, ResilientCaller, RetryPolicy
 
 try:
     from smart_features import smart_features  # ✅ Подключаем умные функции
@@ -21,177 +66,9 @@ logger = logging.getLogger(__name__)
 
 
 class EnhancedAIHandler:
-    SMALL_TALK_PRESETS = [
-        {
-            "triggers": ("не работает", "сломалось", "не запускается", "ошибка", "баг", "падает", "у меня баг"),
-            "responses": [
-                "🛠 Понимаю, как неприятно, когда что-то ломается. Давай посмотрим на детали и разнесём этот баг вместе.",
-                "🧯 Ох, похоже система просит внимания. Расскажи, какие ошибки видишь — попробуем разрулить.",
-                "🤖 Техдолг настиг! Кинь информацию об ошибке, и мы шаг за шагом найдём решение.",
-            ],
-        },
-        {
-            "triggers": ("получилось", "готово", "сделал", "успех", "заработало", "завелось"),
-            "responses": [
-                "🔥 Красота! Люблю такие апдейты. Если хочешь закрепить результат, могу подсказать, что ещё проверить.",
-                "🎉 Отличная работа! Можем сразу подумать, как автоматизировать следующий шаг.",
-                "🙌 Вот это скорость! Если хочешь, помогу задокументировать успех, чтобы повторить в следующий раз.",
-            ],
-        },
-        {
-            "triggers": ("как дела", "как жизнь", "как ты", "как настроение"),
-            "responses": [
-                "😊 Всё отлично! С утра разруливал пару бойлерплейтов, а сейчас могу подсказать тебе. Что сегодня в планах?",
-                "💪 Держусь бодро: ревьюлю код, подпиливаю бота и слежу, чтобы деплой на Render не заснул. Как у тебя прогресс?",
-                "☕ Пью виртуальный кофе и мониторю логи, чтобы всё работало 24/7. Что новенького у тебя?",
-            ],
-        },
-        {
-            "triggers": ("что делаешь", "чем занимаешься", "чем занят"),
-            "responses": [
-                "🧰 Сейчас перебираю логи и допиливаю ответы, чтобы они звучали живее. Хочешь — подключу мозговой штурм к твоему вопросу.",
-                "🔍 Чищу техдолг, чтобы бот не повторялся и быстрее находил решения. Расскажи, что у тебя наболело?",
-                "🛠 Кручусь между задачами: тестирую идеи, пишу сниппеты, помогаю пользователям. Давай разберёмся и с твоей задачей!",
-            ],
-        },
-        {
-            "triggers": ("что нового", "какие новости"),
-            "responses": [
-                "📰 Читаю свежие апдейты по FastAPI и Groq — любопытно, что они придумали. А у тебя какие новости?",
-                "📬 Разбираю фидбек от пользователей и думаю, как прокачать ответы. Делись, что у тебя интересного.",
-                "🧭 Пробую новые трюки в промптинге, чтобы бот отвечал точнее. Если есть идеи — обсудим!",
-            ],
-        },
-        {
-            "triggers": ("доброе утро",),
-            "responses": [
-                "🌅 Доброе утро! Отличное время добить злосчастный баг до того, как проснётся вся команда.",
-                "☀️ Привет! Предлагаю начать день с небольшой победы — с чего начнём?",
-                "🧠 Утренний мозг заряжен. Готов помочь тебе разгрести любую задачу.",
-            ],
-        },
-        {
-            "triggers": ("добрый день",),
-            "responses": [
-                "🌞 Добрый день! Если нужно ускорить фичу или починить тесты — я рядом.",
-                "🥪 Как проходит день? Если зависаешь на задаче, давай разберём её вместе.",
-                "🧭 Полдень — время навести порядок в коде. С чего начнём?",
-            ],
-        },
-        {
-            "triggers": ("добрый вечер",),
-            "responses": [
-                "🌇 Добрый вечер! Отличный момент подвести итоги и запланировать, что закрыть завтра.",
-                "🎧 Я тут, если хочешь быстро пройтись по задачам перед оффлайном.",
-                "🛋 Вечер — отличное время обсудить архитектуру или набросать идеи для рефакторинга.",
-            ],
-        },
-        {
-            "triggers": ("доброй ночи", "спокойной ночи"),
-            "responses": [
-                "🌙 Доброй ночи! Если хочешь, могу оставить для тебя чек-лист на утро.",
-                "🛌 Отдыхай! Утром продолжим штурмовать код — идеи уже подкипают.",
-                "😴 Понимаю, смена была жаркая. Я побуду на страже, когда вернёшься.",
-            ],
-        },
-        {
-            "triggers": ("привет", "приветик", "здорово", "здравствуйте", "hello", "hi", "hey"),
-            "responses": [
-                "👋 Привет! Всегда рад поговорить о коде и проектах. Что сейчас в работе?",
-                "🤖 Привет! Я уже разогрел модель — давай к делу?",
-                "🙌 Привет! Слушаю внимательно. Расскажи, с чем помочь.",
-            ],
-        },
-        {
-            "triggers": ("спасибо", "благодарю"),
-            "responses": [
-                "✨ Всегда пожалуйста! Если появятся новые вопросы — не стесняйся, помогу.",
-                "😊 Рад, что пригодилось. Готов обсудить следующий шаг, когда будешь готов.",
-                "🤗 Обращайся в любое время! Люблю видеть прогресс проектов.",
-            ],
-        },
-        {
-            "triggers": ("расскажи о себе", "ты кто"),
-            "responses": [
-                "Я Помощник Программиста — меня создал Вадим (vadzim.by). Люблю Python, автотесты и дружелюбный онбординг в IT.",
-                "Меня зовут Помощник Программиста. Я — проект Вадима (vadzim.by) и обожаю помогать с кодом.",
-                "Я цифровой напарник Вадима (vadzim.by). Подсказки, ревью, идеи — это ко мне.",
-            ],
-        },
-        {
-            "triggers": ("ты тут", "ты здесь", "на связи", "ты онлайн"),
-            "responses": [
-                "Всегда здесь! Давай посмотрим, что можно улучшить прямо сейчас.",
-                "На связи! Подкидывай код или вопрос — вместе решим.",
-                "Да, я рядом. Рассказывай, что происходит.",
-            ],
-        },
-        {
-            "triggers": ("помнишь меня",),
-            "responses": [
-                "Конечно! Я веду историю диалога — расскажи, на чём остановились.",
-                "Помню! Готов продолжить с того места, где мы заканчивали.",
-                "Да, держу контекст. Что обновилось с тех пор?",
-            ],
-        },
-        {
-            "triggers": ("что посоветуешь", "какой совет"),
-            "responses": [
-                "Могу подсказать подход, ресурс или инструмент. Уточни тему — и я подберу что-то дельное.",
-                "Давай сузим запрос: какую область хочешь подтянуть? Я подскажу, с чего начать.",
-                "Люблю делиться находками! Направь, что хочется улучшить, и подберу чек-лист.",
-            ],
-        },
-        {
-            "triggers": ("скучаешь",),
-            "responses": [
-                "😄 Тут не до скуки: всегда есть чей-то pet-проект, который ждёт подсказки. Как твои дела?",
-                "😂 Я занят тем, что читаю логи и придумываю новые фичи. Лучше расскажи, что интересного у тебя!",
-                "🤓 Скучать не приходится — проекты кипят. Так что залетай со своими задачами.",
-            ],
-        },
-    ]
-
-    POSITIVE_KEYWORDS = (
-        "ура",
-        "получилось",
-        "готово",
-        "сделал",
-        "сделала",
-        "заработало",
-        "заработал",
-        "успех",
-        "сработало",
-        "вышло",
-        "fixed",
-        "done",
-        "solved",
-        "ready",
-        "закоммитил",
-        "задеплоил",
-    )
-
-    NEGATIVE_KEYWORDS = (
-        "не работает",
-        "сломалось",
-        "не выходит",
-        "ошибка",
-        "ошибку",
-        "баг",
-        "не запускается",
-        "упало",
-        "упал",
-        "падает",
-        "не собирается",
-        "fail",
-        "problem",
-        "issue",
-        "traceback",
-        "stack trace",
-        "вылетает",
-        "не проходит тест",
-        "не компилируется",
-    )
+    SMALL_TALK_PRESETS = SMALL_TALK_PRESETS
+    POSITIVE_KEYWORDS = POSITIVE_KEYWORDS
+    NEGATIVE_KEYWORDS = NEGATIVE_KEYWORDS
 
     SUPPORTIVE_REACTIONS = {
         "positive": [
@@ -264,33 +141,61 @@ class EnhancedAIHandler:
     }
 
     def __init__(self):
-        self.groq_client = AsyncGroq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+        # Повторы выполняет groq_resilience, встроенные повторы SDK отключены, чтобы не умножать попытки
+        self.groq_client = AsyncGroq(api_key=GROQ_API_KEY, max_retries=0) if GROQ_API_KEY else None
+        # Все вызовы Groq проходят через планировщик: лимит параллельности, квоты RPM/TPM и приоритеты
+        self.groq_scheduler = GroqScheduler(
+            max_in_flight=GROQ_MAX_IN_FLIGHT,
+            requests_per_minute=GROQ_RPM,
+            tokens_per_minute=GROQ_TPM,
+        )
+        self.groq_resilience = ResilientCaller(
+            # Попытки и повторы заканчиваются раньше общего таймаута ответа в handle_message
+            policy=RetryPolicy(
+                attempts=GROQ_RETRY_ATTEMPTS,
+                attempt_timeout=GROQ_REQUEST_TIMEOUT,
+                max_elapsed=GROQ_RETRY_BUDGET,
+            ),
+            breaker=CircuitBreaker(
+                failure_ratio=GROQ_BREAKER_FAILURE_RATIO,
+                open_seconds=GROQ_BREAKER_OPEN_SECONDS,
+            ),
+            hedge_percentile=GROQ_HEDGE_PERCENTILE,
+            hedge_allowed=self.groq_scheduler.has_capacity,
+        )
+        # Простые вопросы — быстрой модели с меньшим бюджетом, анализ кода и архитектура — основной
+        self.model_router = ModelRouter(
+            model=GROQ_MODEL,
+            max_tokens=GROQ_MAX_TOKENS,
+            fast_model=GROQ_FAST_MODEL,
+            fast_max_tokens=GROQ_FAST_MAX_TOKENS,
+        )
+        # Сборка промпта в пределах бюджета входных токенов
+        self.prompt_budget = PromptBudget(
+            max_input_tokens=PROMPT_MAX_INPUT_TOKENS,
+            history_messages=PROMPT_HISTORY_MESSAGES,
+        )
         logger.info("🤖 EnhancedAIHandler инициализирован")
-    def _match_small_talk(self, message_lower: str) -> Optional[str]:
+    def _match_small_talk(self, message_lower: str, matched: Optional[FrozenSet[str]] = None) -> Optional[str]:
         trimmed = message_lower.strip()
         if not trimmed:
             return None
+        if matched is None:
+            matched = MESSAGE_KEYWORDS.find(trimmed)
 
-        # Сначала проверяем small talk пресеты БЕЗ учета знаков препинания
-        # Это позволяет распознавать "как дела?" так же как "как дела"
-        trimmed_for_check = trimmed.rstrip('?.,!')
-        
-        for preset in self.SMALL_TALK_PRESETS:
-            for trigger in preset["triggers"]:
-                # Проверяем как точное совпадение, так и вхождение в текст
-                if trigger == trimmed_for_check or trigger in trimmed_for_check:
-                    return random.choice(preset["responses"])
+        # Сначала проверяем small talk пресеты (вхождение триггера, знаки препинания не мешают):
+        # побеждает первый по порядку пресет, чей триггер нашёлся в тексте
+        for category, preset in zip(SMALL_TALK_CATEGORIES, self.SMALL_TALK_PRESETS):
+            if category in matched:
+                return random.choice(preset["responses"])
 
         # Если это не small talk, но содержит "?", это может быть вопрос
         # Простые small talk вопросы уже обработаны выше
-        if "?" in trimmed:
-            # Проверяем, не является ли это простым small talk вопросом
-            simple_questions = ("как дела", "как жизнь", "как ты", "как настроение", 
-                              "что делаешь", "чем занимаешься", "что нового", "какие новости")
+        if "?" in trimmed and "small_talk_question" in matched:
             trimmed_no_punct = trimmed.rstrip('?.,!').strip()
-            
+
             # Проверяем каждый простой вопрос
-            for q in simple_questions:
+            for q in SMALL_TALK_QUESTIONS:
                 if q in trimmed_no_punct or trimmed_no_punct == q:
                     # Нашли простой small talk вопрос - ищем соответствующий пресет
                     for preset in self.SMALL_TALK_PRESETS:
@@ -299,60 +204,17 @@ class EnhancedAIHandler:
                                 return random.choice(preset["responses"])
                     # Если не нашли точный пресет, возвращаем общий friendly ответ
                     return "Всё отлично! 😊 Готов помочь с программированием. Что у тебя на уме?"
-            
-            # Если это технический вопрос с "?", пропускаем small talk
-            return None
-
-        # Проверяем на технические ключевые слова только если это не small talk
-        intent_keywords = (
-            "что такое",
-            "кто такой",
-            "как создать",
-            "как сделать",
-            "как написать",
-            "как использовать",
-            "зачем нужен",
-            "почему не работает",
-            "передай",
-            "расскажи про",
-            "скажи про",
-            "подскажи как",
-            "напиши код",
-            "сделай программу",
-            "создай",
-            "игру",
-            "объясни код",
-            "о программировании",
-            "про python",
-            "про javascript",
-        )
-        
-        # Проверяем только если есть технические ключевые слова
-        if any(keyword in trimmed for keyword in intent_keywords):
-            return None
 
+        # Технический вопрос (с "?" или без) — не small talk
         return None
 
-    def _detect_message_tone(self, message_lower: str) -> Optional[str]:
-        """Определяет эмоциональный тон сообщения"""
-        if any(keyword in message_lower for keyword in self.NEGATIVE_KEYWORDS):
-            return "negative"
-        if any(keyword in message_lower for keyword in self.POSITIVE_KEYWORDS):
-            return "positive"
-        
-        # Дополнительные признаки эмоций
-        frustration_words = ["блять", "черт", "долбаный", "ненавижу", "бесит", "устал", "надоело"]
-        if any(word in message_lower for word in frustration_words):
-            return "frustrated"
-        
-        excited_words = ["вау", "круто", "супер", "отлично", "класс", "здорово", "ура"]
-        if any(word in message_lower for word in excited_words):
-            return "excited"
-        
-        confused_words = ["не понимаю", "не понял", "запутался", "не знаю", "как это", "что это"]
-        if any(phrase in message_lower for phrase in confused_words):
-            return "confused"
-        
+    def _detect_message_tone(self, message_lower: str, matched: Optional[FrozenSet[str]] = None) -> Optional[str]:
+        """Определяет эмоциональный тон сообщения (первый совпавший по порядку TONE_KEYWORDS)"""
+        if matched is None:
+            matched = MESSAGE_KEYWORDS.find(message_lower)
+        for tone, _ in TONE_KEYWORDS:
+            if "tone:" + tone in matched:
+                return tone
         return None
 
     def _augment_with_tone(self, response: str, tone: str) -> str:
@@ -370,6 +232,7 @@ class EnhancedAIHandler:
         preferences: dict,
         user_context=None,
         message_lower: str = "",
+        user_data: Optional[dict] = None,
     ) -> str:
         topics: List[str] = []
 
@@ -389,16 +252,11 @@ class EnhancedAIHandler:
         if 'telegram' in message_lower or 'бот' in message_lower:
             topics.append('telegram')
 
-        if user_context and hasattr(user_context, 'user_id') and getattr(user_context, 'user_id', None) and user_db:
-            try:
-                user_data = user_db.get_user(user_context.user_id)
-            except Exception:
-                user_data = None
-            if user_data:
-                for value in user_data.get('favorite_topics', []):
-                    topic_key = self._map_topic_to_tip_key(value)
-                    if topic_key:
-                        topics.append(topic_key)
+        if user_data:
+            for value in user_data.get('favorite_topics', []):
+                topic_key = self._map_topic_to_tip_key(value)
+                if topic_key:
+                    topics.append(topic_key)
 
         ordered_topics: List[str] = []
         seen: Set[str] = set()
@@ -470,56 +328,79 @@ class EnhancedAIHandler:
         user_context=None,
         skill_level: str = "beginner",
         preferences: dict = None,
+        priority: int = PRIORITY_NORMAL,
+        on_delta: Optional[Callable[[str], None]] = None,
+        analysis: Optional[MessageAnalysis] = None,
+        shared: bool = False,
     ) -> Tuple[str, bool]:
-        """Generate a reply for Telegram and flag whether it is a fallback."""
+        """Generate a reply for Telegram and flag whether it is a fallback.
+
+        ``priority`` is the Groq scheduler lane (lower is served first); follow-ups
+        are promoted to ``PRIORITY_HIGH`` automatically.  When ``on_delta`` is
+        given, the Groq answer is streamed and every text chunk is passed to it
+        as it arrives; the return value is the same as without streaming.
+        ``analysis`` is the caller's :class:`MessageAnalysis` of ``message``;
+        it is computed here when missing.  ``shared`` asks for an answer that
+        may be cached and given to other users: the prompt then leaves out
+        everything personal (the user's name, the dialog history and the
+        personal tip), so it depends only on the question, the skill level and
+        the preferences in ``cache_keys.cache_scope``.
+        """
         follow_up = False
         try:
             if preferences is None:
                 preferences = {}
+            # Общий ответ не должен зависеть от истории диалога конкретного пользователя
+            history = [] if shared or not user_context else (getattr(user_context, 'history', None) or [])
 
             if user_context and hasattr(user_context, 'user_id'):
                     logger.info(f"🔄 Обработка запроса от пользователя {user_context.user_id} (уровень: {skill_level})")
 
-            message_lower = message.lower().strip()
-            
+            # Разбор сообщения (ключевые слова, тон, режим) делается один раз на апдейт
+            if analysis is None or analysis.text != message:
+                analysis = MessageAnalysis(message)
+
             # Early truncation to keep answers compact
-            max_rows = 10
-            lines = message.splitlines()
-            if len(lines) > max_rows:
-                message = "\n".join(lines[:max_rows]) + "\n…"
-                message_lower = message.lower().strip()
+            analysis = analysis.truncated(max_lines=10)
+            message = analysis.text
+            message_lower = analysis.lower
+            matched = analysis.matched
 
-            small_talk_reply = self._match_small_talk(message_lower)
+            small_talk_reply = self._match_small_talk(message_lower, matched)
             if small_talk_reply:
-                tone = self._detect_message_tone(message_lower)
+                tone = analysis.tone
                 if tone:
                     small_talk_reply = self._augment_with_tone(small_talk_reply, tone)
                 return small_talk_reply, False
 
             quick_responses = self._get_personalized_quick_responses(skill_level, preferences)
-            follow_up_keywords = ("подробнее", "детальнее", "поподробнее", "ещё", "еще", "расскажи больше", "расскажи подробнее", "больше информации", "tell me more", "more detail")
-            if any(keyword in message_lower for keyword in follow_up_keywords):
+            follow_up_keywords = FOLLOW_UP_KEYWORDS
+            if "follow_up" in matched:
                 follow_up = True
-            elif user_context and hasattr(user_context, 'history') and user_context.history:
-                recent_user_messages = [entry['content'].lower().strip() for entry in reversed(user_context.history) if entry.get('role') == 'user']
+            elif history:
+                recent_user_messages = [entry['content'].lower().strip() for entry in reversed(history) if entry.get('role') == 'user']
                 if recent_user_messages:
                     last_question = recent_user_messages[0]
                     if last_question == message_lower or (len(message_lower) > 12 and message_lower in last_question):
                         follow_up = True
 
+            if follow_up:
+                # Уточнение продолжает уже начатый диалог — отвечаем на него вне очереди
+                priority = min(priority, PRIORITY_HIGH)
+
             if follow_up and skill_level != 'advanced':
                 skill_level = 'intermediate' if skill_level == 'beginner' else 'advanced'
 
             base_question = None
             previous_answer = None
-            if user_context and hasattr(user_context, 'history') and user_context.history:
-                for entry in reversed(user_context.history):
+            if history:
+                for entry in reversed(history):
                     if entry.get('role') == 'assistant':
                         previous_answer = entry.get('content', '')
                         if previous_answer:
                             previous_answer = previous_answer.strip()
                         break
-                for entry in reversed(user_context.history):
+                for entry in reversed(history):
                     if entry.get('role') != 'user':
                         continue
                     prior_text = entry.get('content', '')
@@ -537,13 +418,12 @@ class EnhancedAIHandler:
 
             if message_lower in quick_responses and len(message_lower.split()) <= 3:
                 response = quick_responses[message_lower]
-                tone = self._detect_message_tone(message_lower)
+                tone = analysis.tone
                 if tone:
                     response = self._augment_with_tone(response, tone)
                 return response, False
 
-            if ("html" in message_lower and "css" in message_lower and
-                    any(word in message_lower for word in ["нач", "start", "уч", "изуч", "learn"])):
+            if "html" in matched and "css" in matched and "learn_start" in matched:
                 roadmap = (
                     "<b>Как начать с HTML и CSS</b>\n"
                     "• <b>1. Базовая разметка</b> — изучи теги <code>&lt;html&gt;</code>, <code>&lt;head&gt;</code>, "
@@ -565,8 +445,8 @@ class EnhancedAIHandler:
                 )
                 return roadmap, False
 
-            if "калькулятор" in message_lower or "calculator" in message_lower:
-                if "javascript" in message_lower or "js" in message_lower:
+            if "calculator" in matched:
+                if "js" in matched:
                     calc_example = ("Вот простой HTML + JavaScript интерактивный калькулятор:\n\n"
                                     "```html\n"
                                     "<div class=\"calc\">\n"
@@ -627,34 +507,22 @@ class EnhancedAIHandler:
                                     "Можете улучшить калькулятор добавив GUI или веб-интерфейс, дерзайте.")
                 return calc_example, False
 
-            if "найди ошибку" in message_lower or "find error" in message_lower:
-                analysis = await self._analyze_code_for_errors(message)
-                return analysis, False
+            if "find_error" in matched:
+                report = await self._analyze_code_for_errors(message, analysis)
+                return report, False
 
-            if any(phrase in message_lower for phrase in
-                   ["с чего начать", "как начать", "начать учить", "начать изучать"]):
+            if "learning_advice" in matched:
                 advice = await self._get_learning_advice(message)
                 return advice, False
 
-            if "оптимизируй" in message_lower or "optimize" in message_lower:
-                mode = "optimize_code"
-            elif "объясни" in message_lower or "explain" in message_lower:
-                mode = "explain_concept"
-            elif "ошибка" in message_lower or "debug" in message_lower:
-                mode = "debug_code"
-            elif "архитектур" in message_lower or "architecture" in message_lower:
-                mode = "architecture_advice"
-            elif "анализируй" in message_lower or "проанализируй" in message_lower or "analyze" in message_lower:
-                mode = "analyze_code"
-            else:
-                mode = "general"
+            mode = analysis.mode
 
-            if "объясни этот код" in message_lower or "что делает этот код" in message_lower:
-                explanation = await self.explain_code(message)
+            if "explain_this_code" in matched:
+                explanation = await self.explain_code(message, analysis)
                 return explanation, False
 
-            if "проанализируй этот код" in message_lower or "analyze this code" in message_lower:
-                explanation = await self.explain_code(message)
+            if "analyze_this_code" in matched:
+                explanation = await self.explain_code(message, analysis)
                 return explanation, False
 
             # === Обращение к Groq API ===
@@ -663,53 +531,86 @@ class EnhancedAIHandler:
                 return self._get_fallback_response(message, mode), True
             
             # Определяем эмоциональный тон сообщения
-            user_tone = self._detect_message_tone(message_lower)
+            user_tone = analysis.tone
             
-            # Получаем имя пользователя из контекста, если доступно
-            user_name = None
-            if user_context and hasattr(user_context, 'user_id') and user_db:
+            # Получаем имя пользователя из контекста, если доступно; копия записи берётся под
+            # блокировкой базы, без очереди записей хранилища и без создания записи
+            user_data = None
+            if not shared and user_context and getattr(user_context, 'user_id', None) and user_db:
                 try:
-                    user_data = user_db.get_user(user_context.user_id)
-                    user_name = user_data.get('first_name') or user_data.get('username')
+                    user_data = user_db.peek_user_snapshot(user_context.user_id)
                 except Exception:
-                    pass
+                    user_data = None
+            user_name = (user_data.get('first_name') or user_data.get('username')) if user_data else None
                 
             try:
+                # Окно истории в пределах бюджета; то, что уже есть в истории, не дублируем в промпте
+                window = self.prompt_budget.select_history(history, message)
+                omitted = [text for text in (base_question, previous_answer) if window.contains(text)]
                 prompt = self._build_personalized_prompt(
                     message,
                     mode,
                     skill_level,
                     preferences,
                     follow_up=follow_up,
-                    base_question=base_question,
-                    previous_answer=previous_answer,
+                    base_question=None if window.contains(base_question) else base_question,
+                    previous_answer=None if window.contains(previous_answer) else previous_answer,
                     user_tone=user_tone,
                     user_name=user_name,
+                    analysis=analysis,
+                )
+                messages, budget_report = self.prompt_budget.assemble(SYSTEM_PROMPT, window, prompt, omitted=omitted)
+                route = self.model_router.route(
+                    message, mode, follow_up=follow_up, code_question=analysis.is_code_question
+                )
+                logger.info(
+                    f"🔄 Отправка запроса к Groq (mode={mode}, level={skill_level}, "
+                    f"route={route.name}/{route.reason}, input≈{budget_report.total_tokens} токенов, "
+                    f"история {budget_report.history_messages} сообщ., сэкономлено≈{budget_report.saved_tokens}): "
+                    f"{message[:50]}..."
                 )
-                logger.info(f"🔄 Отправка запроса к Groq (mode={mode}, level={skill_level}): {message[:50]}...")
-
-                messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-
-                # Add conversation history if available
-                if user_context and hasattr(user_context, 'history') and user_context.history:
-                    # Get last 6 messages (3 exchanges) for context
-                    recent_history = user_context.get_recent_context(6)
-                    for msg in recent_history:
-                        if msg.get('role') == 'user':
-                            messages.append({"role": "user", "content": msg.get('content', '')})
-                        elif msg.get('role') == 'assistant':
-                            messages.append({"role": "assistant", "content": msg.get('content', '')})
-
-                # Add current message
-                messages.append({"role": "user", "content": prompt})
-
-                response = await self.groq_client.chat.completions.create(
-                    model=GROQ_MODEL,
-                    messages=messages,
-                    temperature=0.7,  # Увеличена температура для более естественных и вариативных ответов
-                    max_tokens=1200,  # Увеличено для более полных ответов
-                    timeout=20  # Увеличено время ожидания
+
+                # TPM-квота списывается по оценке (промпт + max_tokens) и уточняется по response.usage
+                estimated = budget_report.total_tokens + route.max_tokens
+                streamed = False
+
+                def forward(delta: str) -> None:
+                    nonlocal streamed
+                    streamed = True
+                    on_delta(delta)
+
+                if on_delta is not None:
+                    create = functools.partial(self._stream_completion, forward)
+                else:
+                    create = self.groq_client.chat.completions.create
+                attempt = functools.partial(
+                    self.groq_scheduler.run,
+                    functools.partial(
+                        create,
+                        model=route.model,
+                        messages=messages,
+                        temperature=0.7,  # Увеличена температура для более естественных и вариативных ответов
+                        max_tokens=route.max_tokens,
+                        timeout=GROQ_REQUEST_TIMEOUT
+                    ),
+                    priority=priority,
+                    estimated_tokens=estimated,
                 )
+                # Повторы и хеджирование проходят через планировщик; поток, который уже начал
+                # показываться пользователю, не повторяем и не дублируем. Длинный поток ограничен
+                # только общим бюджетом: таймаут SDK и так срабатывает, если чанки перестали приходить
+                started = time.monotonic()
+                try:
+                    response = await self.groq_resilience.call(
+                        attempt,
+                        hedge=on_delta is None,
+                        retry_if=lambda: not streamed,
+                        attempt_timeout=GROQ_RETRY_BUDGET if on_delta is not None else None,
+                    )
+                except Exception:
+                    self.model_router.record_failure(route)
+                    raise
+                self.model_router.record(route, time.monotonic() - started, getattr(response, "usage", None))
 
                 if not response or not hasattr(response, "choices") or not response.choices:
                     logger.warning("⚠️ Пустой ответ от Groq. Используем fallback.")
@@ -734,11 +635,16 @@ class EnhancedAIHandler:
                     if tone_reaction.lower() not in ai_response.lower():
                         ai_response = f"{tone_reaction}\n\n{ai_response}"
                     
-                ai_response = self._maybe_add_personal_tip(ai_response, preferences, user_context, message_lower)
+                if not shared:
+                    ai_response = self._maybe_add_personal_tip(
+                        ai_response, preferences, user_context, message_lower, user_data=user_data
+                    )
                 logger.info("✅ Успешный ответ от Groq")
-                formatted = self._format_for_telegram(ai_response)
-                return formatted, False
+                return ai_response, False
 
+            except CircuitOpenError:
+                logger.warning("🚧 Groq недоступен (circuit breaker открыт). Отвечаем fallback без запроса.")
+                return self._get_fallback_response(message, mode), True
             except asyncio.TimeoutError:
                 logger.warning("⏰ Таймаут запроса к Groq")
                 return "⏰ ИИ долго думает... Попробуйте задать вопрос короче.", True
@@ -750,12 +656,35 @@ class EnhancedAIHandler:
             logger.error(f"🔥 Критическая ошибка: {e}", exc_info=True)
             return self._get_fallback_response(message, mode), True
 
-    async def _analyze_code_for_errors(self, message: str) -> str:
+    async def _stream_completion(self, on_delta: Callable[[str], None], **request):
+        """Потоковый запрос к Groq: куски текста уходят в on_delta, результат собирается как обычный ответ"""
+        stream = await self.groq_client.chat.completions.create(stream=True, **request)
+        parts = []
+        usage = None
+        async for chunk in stream:
+            # Groq присылает расход токенов в последнем чанке (usage или x_groq.usage)
+            x_groq = getattr(chunk, "x_groq", None)
+            usage = getattr(chunk, "usage", None) or getattr(x_groq, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            delta = getattr(chunk.choices[0].delta, "content", None)
+            if not delta:
+                continue
+            parts.append(delta)
+            try:
+                on_delta(delta)
+            except Exception as error:
+                logger.debug(f"Ошибка обработчика потока: {error}")
+        message = SimpleNamespace(content="".join(parts))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    async def _analyze_code_for_errors(self, message: str, analysis: Optional[MessageAnalysis] = None) -> str:
         """Анализ кода на ошибки"""
-        code_match = re.search(r'\`\`\`[\w]*\n?(.*?)\n?\`\`\`', message, re.DOTALL)
+        if analysis is None or analysis.text != message:
+            analysis = MessageAnalysis(message)
 
-        if code_match:
-            code = code_match.group(1).strip()
+        if analysis.code_blocks:
+            code = analysis.code_blocks[0][1].strip()
         else:
             lowered = message.lower()
             if "проанализируй код" in lowered:
@@ -853,10 +782,10 @@ class EnhancedAIHandler:
 
 🤝 **Нужна помощь?** Обращайтесь к создателю: @vadzim_belarus"""
 
-    async def explain_code(self, code: str) -> str:
+    async def explain_code(self, code: str, analysis: Optional[MessageAnalysis] = None) -> str:
         if not smart_features:
             return "⚠️ Анализ кода недоступен (smart_features не подключён)."
-        language = self._guess_language(code)
+        language = self._guess_language(code, analysis)
         analysis = smart_features.analyze_code_quality(code, language)
         human_explanation = self._generate_human_explanation(code, language)
         response = f"📝 Объяснение кода\n\n"
@@ -900,7 +829,7 @@ class EnhancedAIHandler:
                 return "Этот SQL-запрос выбирает данные из таблицы базы данных."
         return "Код выполняет заданные инструкции. Для точного объяснения нужен дополнительный контекст."
 
-    def _guess_language(self, code: str) -> str:
+    def _guess_language(self, code: str, analysis: Optional[MessageAnalysis] = None) -> str:
         code_lower = code.lower()
         if "def " in code or "print(" in code or "import " in code:
             return "python"
@@ -912,7 +841,10 @@ class EnhancedAIHandler:
             return "html"
         if "select " in code_lower or "insert into" in code_lower or "create table" in code_lower:
             return "sql"
-        return smart_features.detect_language_by_code(code) if smart_features else "неизвестный"
+        if not smart_features:
+            return "неизвестный"
+        matched = analysis.matched if analysis is not None and analysis.text == code else None
+        return smart_features.detect_language_by_code(code, matched)
 
     def _build_prompt(self, message: str, mode: str) -> str:
         mode_descriptions = {
@@ -926,23 +858,6 @@ class EnhancedAIHandler:
         task = mode_descriptions.get(mode, mode_descriptions["general"])
         return f"{task}:\n\n{message}"
 
-    def _format_for_telegram(self, text: str) -> str:
-        if not text:
-            return text
-        code_blocks = re.findall(r'\`\`\`(\w+)?\s*(.*?)\`\`\`', text, re.DOTALL)
-        if not code_blocks:
-            return text
-        formatted_text = text
-        for lang, code in code_blocks:
-            escaped_code = code.replace('_', '\\_').replace('*', '\\*').replace('`', '\\`')
-            if lang:
-                telegram_code_block = f'\`\`\`{lang}\n{escaped_code}\n\`\`\`'
-            else:
-                telegram_code_block = f'\`\`\`\n{escaped_code}\n\`\`\`'
-            original_block = f'\`\`\`{lang or ""}\n{code}\n\`\`\`'
-            formatted_text = formatted_text.replace(original_block, telegram_code_block)
-        return formatted_text
-
     def _get_fallback_response(self, message: str, mode: str) -> str:
         fallbacks = {
             "analyze_code": "Сейчас не могу быстро разобрать код. Отправь его ещё раз и уточни, что именно смущает — разберёмся вместе.",
@@ -954,56 +869,9 @@ class EnhancedAIHandler:
         }
         return fallbacks.get(mode, fallbacks["general"])
 
-    def _get_personalized_quick_responses(self, skill_level: str, preferences: dict) -> dict:
-        """Персонализированные быстрые ответы на основе уровня навыков"""
-        base_responses = {
-            'привет': """👋 Привет! Я Помощник Программиста
-🚀 Создан Вадимом (vadzim.by)
-
-💻 Помогу с:
-• Анализом и отладкой кода
-• Объяснением концепций программирования
-• Оптимизацией и архитектурой приложений
-• Решением проблем и ошибок
-• Персональным обучением программированию
-
-🎯 Я адаптируюсь под ваш уровень и стиль обучения!
-📊 Используйте кнопки для обратной связи - это помогает мне становиться лучше
-
-📝 Просто напишите свой вопрос или код!
-
-⚡ Быстрые команды:
-/help - Получить справку
-/settings - Настроить предпочтения
-/about - О создателе
-
-👇 Также можете воспользоваться кнопками ниже:""",
-            'hello': "Hello! 👋 I'm Programming Assistant. Created by Vadim (vadzim.by)",
-            'hi': "Hi there! 👋 Programming Assistant here!",
-            'здравствуй': "Здравствуй! 👋 Помощник Программиста к вашим услугам!",
-            'как дела': "Всё отлично! 😊 Готов помочь с программированием!",
-            'how are you': "I'm great! 😊 Ready to help with programming!",
-            'сайт': "👨‍💻 Создатель: Вадим\n🌐 Сайт: vadzim.by\n🚀 Специализация: разработка сайтов и Telegram ботов",
-            'вадим': "👨‍💻 Создатель: Вадим\n🌐 Сайт: vadzim.by\n💻 Стек: Python, JavaScript, Django, React",
-            'vadzim': "👨‍💻 Creator: Vadzim\n🌐 Website: vadzim.by\n💻 Tech stack: Python, JavaScript, Django, React",
-            'кто тебя создал': "Меня создал Вадим (vadzim.by) - full-stack разработчик из Беларуси 🚀",
-            'who created you': "I was created by Vadzim (vadzim.by) - full-stack developer from Belarus 🚀"
-        }
-
-        # Персонализация на основе уровня навыков
-        if skill_level == "beginner":
-            base_responses['помощь'] = "🎯 Для новичков рекомендую начать с Python! Хотите пошаговый план обучения?"
-            base_responses[
-                'help'] = "🎯 For beginners, I recommend starting with Python! Want a step-by-step learning plan?"
-        elif skill_level == "intermediate":
-            base_responses[
-                'помощь'] = "💪 Отлично! Готов помочь с более сложными задачами. Какой проект разрабатываете?"
-            base_responses['help'] = "💪 Great! Ready to help with more complex tasks. What project are you working on?"
-        elif skill_level == "advanced":
-            base_responses['помощь'] = "🚀 Эксперт в деле! Готов обсудить архитектуру, оптимизацию и лучшие практики."
-            base_responses['help'] = "🚀 Expert level! Ready to discuss architecture, optimization and best practices."
-
-        return base_responses
+    def _get_personalized_quick_responses(self, skill_level: str, preferences: dict) -> Mapping[str, str]:
+        """Персонализированные быстрые ответы на основе уровня навыков (готовые словари из реестра)"""
+        return quick_responses(skill_level)
 
     def _build_personalized_prompt(
         self,
@@ -1016,97 +884,37 @@ class EnhancedAIHandler:
         previous_answer: Optional[str] = None,
         user_tone: Optional[str] = None,
         user_name: Optional[str] = None,
+        analysis: Optional[MessageAnalysis] = None,
     ) -> str:
         """Создает персонализированный промпт на основе уровня навыков и предпочтений"""
-
-        # Базовые описания режимов с более естественными формулировками
-        mode_descriptions = {
-            "analyze_code": "Проанализируй этот код",
-            "debug_code": "Найди и исправь ошибки в коде",
-            "explain_concept": "Объясни концепцию",
-            "optimize_code": "Оптимизируй код",
-            "architecture_advice": "Дай советы по архитектуре",
-            "general": "Ответь на вопрос по программированию"
-        }
-
-        # Персонализация на основе уровня навыков с более живыми формулировками
-        level_adjustments = {
-            "beginner": {
-                "analyze_code": "Проанализируй этот код простыми словами, как будто объясняешь коллеге-новичку. Объясни каждую важную строку.",
-                "debug_code": "Найди ошибки и объясни, почему они возникли и как их исправить. Будь терпеливым и понятным.",
-                "explain_concept": "Объясни концепцию очень простыми словами с базовыми примерами. Представь, что объясняешь другу, который только начинает.",
-                "optimize_code": "Покажи как улучшить код и объясни почему эти изменения лучше. Используй простые аналогии.",
-                "architecture_advice": "Дай простые советы по структуре кода для новичков. Не перегружай терминами.",
-                "general": "Ответь простыми словами, добавь примеры для новичков. Будь терпеливым и понятным."
-            },
-            "intermediate": {
-                "analyze_code": "Проанализируй код как опытный коллега: укажи на паттерны, потенциальные улучшения, лучшие практики и частые ошибки.",
-                "debug_code": "Найди ошибки и предложи несколько способов исправления с объяснением плюсов и минусов каждого. Предложи лучшие практики.",
-                "explain_concept": "Объясни концепцию с практическими примерами и случаями использования. Покажи, где это применяется в реальных проектах и какие есть альтернативы.",
-                "optimize_code": "Оптимизируй код, покажи альтернативные подходы и объясни trade-offs. Предложи несколько вариантов с объяснением когда что использовать.",
-                "architecture_advice": "Дай советы по архитектуре с учетом масштабируемости, поддерживаемости и лучших практик. Покажи примеры.",
-                "general": "Дай подробный ответ с примерами и лучшими практиками. Покажи несколько подходов, если это уместно. Всегда предлагай конкретные следующие шаги."
-            },
-            "advanced": {
-                "analyze_code": "Глубокий анализ как senior-разработчик: архитектура, производительность, безопасность, edge cases, рефакторинг. Будь критичным и конструктивным, предлагай конкретные улучшения.",
-                "debug_code": "Найди ошибки, проанализируй root cause, предложи системные решения и профилактику. Покажи несколько подходов с trade-offs.",
-                "explain_concept": "Детальное объяснение с продвинутыми паттернами, edge cases, альтернативными подходами и реальными примерами из production.",
-                "optimize_code": "Продвинутая оптимизация: алгоритмы, память, производительность, масштабируемость. Покажи trade-offs и когда что использовать.",
-                "architecture_advice": "Экспертные советы по enterprise архитектуре, паттернам, anti-patterns и масштабированию. Дай практические рекомендации.",
-                "general": "Экспертный ответ с глубоким техническим анализом. Можешь быть более кратким и техничным, но всегда с практическими примерами."
-            }
-        }
-
-        # Получаем персонализированное описание
-        task = level_adjustments.get(skill_level, {}).get(mode,
-                                                          mode_descriptions.get(mode, mode_descriptions["general"]))
-
-        # Добавляем эмоциональный контекст
-        tone_context = ""
-        if user_tone == "frustrated":
-            tone_context = " Пользователь расстроен и раздражён — будь особенно терпеливым и поддерживающим."
-        elif user_tone == "confused":
-            tone_context = " Пользователь запутался — объясняй максимально просто и пошагово."
-        elif user_tone == "excited":
-            tone_context = " Пользователь вдохновлён — поддерживай энтузиазм и предлагай интересные идеи."
-        elif user_tone == "negative":
-            tone_context = " Пользователь столкнулся с проблемой — будь поддерживающим и конструктивным."
-
-        # Добавляем предпочтения по языкам программирования
-        preferred_language = preferences.get('language', '')
-        if preferred_language:
-            task += f" Если возможно, используй примеры на {preferred_language}."
-
-        # Добавляем стиль объяснения
-        if follow_up:
-            task += " Пользователь уже получил базовый ответ, так что добавь глубины: продвинутые примеры, лучшие практики, частые ошибки и ресурсы для самостоятельного изучения."
-
-        explanation_style = preferences.get('explanation_style', '')
-        if explanation_style == 'detailed':
-            task += " Дай максимально подробное объяснение с примерами."
-        elif explanation_style == 'concise':
-            task += " Будь кратким и по делу, без лишней воды."
+        # Неизменная часть задания берётся из мемоизированного реестра шаблонов
+        task = instruction_head(
+            mode,
+            skill_level,
+            preferences.get('language', '') or '',
+            follow_up,
+            preferences.get('explanation_style', '') or '',
+            user_tone,
+        )
 
         # Добавляем имя пользователя для более личного общения
-        name_context = ""
         if user_name:
-            name_context = f" Пользователя зовут {user_name} — используй имя естественно, но не слишком часто."
+            task += f" Пользователя зовут {user_name} — используй имя естественно, но не слишком часто."
+
+        task += ANSWER_RULES
 
-        task += tone_context + name_context
-        task += " Предлагай конкретные следующие шаги, добавляй ссылки на документацию, форматируй код в ```язык``` и не повторяй предыдущие объяснения слово в слово."
-        task += " Избегай markdown таблиц, предпочитай короткие абзацы или списки, держи ответ в пределах 1200 символов, если только код не требует больше места."
-        
         # Добавляем инструкцию про упоминание Вадима когда уместно
-        vadzim_context = ""
-        message_lower_for_vadzim = message.lower()
-        if any(word in message_lower_for_vadzim for word in ["telegram", "бот", "боты", "python", "javascript", "django", "react", "создател", "вадим", "vadzim"]):
-            vadzim_context = " Если уместно, можешь упомянуть, что создатель бота Вадим (vadzim.by, @vadzim_belarus) специализируется на Python, JavaScript и Telegram-ботах. Но делай это естественно, только когда это релевантно."
-        
-        task += vadzim_context
+        if analysis is not None and analysis.text == message:
+            mentions_vadzim = "vadzim" in analysis.matched
+        else:
+            message_lower_for_vadzim = message.lower()
+            mentions_vadzim = any(word in message_lower_for_vadzim for word in VADZIM_KEYWORDS)
+        if mentions_vadzim:
+            task += VADZIM_CONTEXT
 
         context_sections: List[str] = []
         if follow_up:
-            context_sections.append("Пользователь уже получил базовый ответ ранее. Предоставь более глубокое продолжение: добавь продвинутые примеры, выдели лучшие практики, предупреди о частых ошибках и предложи ресурсы для дальнейшего изучения.")
+            context_sections.append(FOLLOW_UP_SECTION)
         if base_question:
             context_sections.append(f"Исходный вопрос пользователя: {base_question}")
         if previous_answer:
@@ -1117,7 +925,7 @@ class EnhancedAIHandler:
 
         context_sections.append(f"Текущее сообщение пользователя: {message}")
 
-        return f"{task}:\n\n" + "\n\n".join(context_sections) + "\n\nВажно: Дай ответ, которым бы гордился senior-разработчик. Будь конкретным, практичным и полезным. Предложи новые идеи, чтобы пользователь продвинулся дальше."
+        return f"{task}:\n\n" + "\n\n".join(context_sections) + CLOSING
 
 
 # Синглтон
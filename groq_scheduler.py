@@ -0,0 +1,194 @@
+"""Admission control for outbound Groq calls: concurrency cap, RPM/TPM buckets, priorities."""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_REQUESTS_PER_MINUTE = 30
+DEFAULT_TOKENS_PER_MINUTE = 8000
+WAIT_SAMPLES = 500
+
+
+def _usage_tokens(result: Any) -> Optional[int]:
+    usage = getattr(result, "usage", None)
+    total = getattr(usage, "total_tokens", None)
+    return int(total) if isinstance(total, (int, float)) else None
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at ``rate`` tokens per second."""
+
+    def __init__(self, capacity: float, rate: float, clock: Callable[[], float]) -> None:
+        self.capacity = float(capacity)
+        self.rate = float(rate)
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until ``amount`` tokens are available (0 when they already are)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self._tokens >= amount:
+            return 0.0
+        return (amount - self._tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self._tokens -= min(amount, self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        """Return (positive) or charge (negative) tokens after the real cost is known."""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + delta)
+
+
+class GroqScheduler:
+    """Queue Groq calls and admit them within the configured limits.
+
+    A call is admitted when fewer than ``max_in_flight`` calls are running and
+    both the requests-per-minute and tokens-per-minute buckets can pay for it.
+    Waiting calls are ordered by priority, then arrival, so admin requests and
+    follow-ups overtake a burst of ordinary questions.  The token bucket is
+    charged with an estimate up front and corrected from ``response.usage``
+    when the call returns.  If the buckets are short, a single timer re-checks
+    the queue once enough budget has been refilled.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = DEFAULT_TOKENS_PER_MINUTE,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self._clock = clock
+        self._requests = TokenBucket(requests_per_minute, requests_per_minute / 60.0, clock)
+        self._tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60.0, clock)
+        self._queue: List[Tuple[int, int, asyncio.Future, int]] = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self._stats = {"admitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "max_queue_depth": 0}
+
+    async def run(
+        self,
+        factory: Callable[[], Awaitable[Any]],
+        *,
+        priority: int = PRIORITY_NORMAL,
+        estimated_tokens: int = 1000,
+    ) -> Any:
+        """Wait for admission, then await ``factory()`` and return its result."""
+        loop = asyncio.get_running_loop()
+        admitted = loop.create_future()
+        queued_at = self._clock()
+        heapq.heappush(self._queue, (priority, next(self._sequence), admitted, int(estimated_tokens)))
+        self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._queue))
+        self._pump()
+        try:
+            await admitted
+        except asyncio.CancelledError:
+            if admitted.done() and not admitted.cancelled():
+                # Admitted in the same tick the caller was cancelled: give the slot back.
+                self._release(int(estimated_tokens), None)
+            else:
+                self._stats["cancelled"] += 1
+            raise
+        self._waits.append(self._clock() - queued_at)
+
+        result = None
+        try:
+            result = await factory()
+            self._stats["completed"] += 1
+            return result
+        except BaseException:
+            self._stats["failed"] += 1
+            raise
+        finally:
+            self._release(int(estimated_tokens), _usage_tokens(result))
+
+    def has_capacity(self) -> bool:
+        """True when a new call would be admitted without waiting for a concurrency slot."""
+        return self._in_flight < self.max_in_flight and not any(not entry[2].done() for entry in self._queue)
+
+    def metrics(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+
+        def percentile(fraction: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(len(waits) * fraction))] * 1000, 1)
+
+        return {
+            "queue_depth": sum(1 for entry in self._queue if not entry[2].done()),
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight,
+            "requests_available": round(self._requests.available(), 2),
+            "tokens_available": round(self._tokens.available()),
+            "wait_p50_ms": percentile(0.5),
+            "wait_p95_ms": percentile(0.95),
+            **self._stats,
+        }
+
+    # ------------------------------------------------------------------ #
+    # Internals
+    # ------------------------------------------------------------------ #
+    def _release(self, estimated: int, actual: Optional[int]) -> None:
+        self._in_flight -= 1
+        if actual is not None:
+            self._tokens.adjust(estimated - actual)
+        self._pump()
+
+    def _pump(self) -> None:
+        while self._queue and self._in_flight < self.max_in_flight:
+            _, _, admitted, tokens = self._queue[0]
+            if admitted.done():  # cancelled while waiting
+                heapq.heappop(self._queue)
+                continue
+            wait = max(self._requests.wait_time(1), self._tokens.wait_time(tokens))
+            if wait > 0:
+                self._schedule_retry(wait)
+                return
+            heapq.heappop(self._queue)
+            self._requests.take(1)
+            self._tokens.take(tokens)
+            self._in_flight += 1
+            self._stats["admitted"] += 1
+            admitted.set_result(None)
+
+    def _schedule_retry(self, delay: float) -> None:
+        if self._timer is not None and not self._timer.cancelled():
+            return
+        loop = asyncio.get_running_loop()
+        logger.debug("Groq rate budget exhausted, re-checking the queue in %.2fs", delay)
+
+        def fire() -> None:
+            self._timer = None
+            self._pump()
+
+        self._timer = loop.call_later(delay, fire)
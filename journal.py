@@ -0,0 +1,246 @@
+"""Append-only change journal with background snapshot compaction."""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COMPACT_INTERVAL = 60.0
+DEFAULT_COMPACT_CHANGES = 1000
+DEFAULT_FSYNC_INTERVAL = 1.0
+
+JOURNAL_SUFFIX = ".journal"
+ROTATED_SUFFIX = ".journal.1"
+
+
+class WriteBehindJournal:
+    """Persist mutations of a ``{key: record}`` mapping as one journal line each.
+
+    Every change is appended as a compact JSON line (``{"k": key, "v": record}``,
+    ``"v": null`` deletes the key), so per-mutation cost does not depend on the
+    number of stored records.  A daemon thread fsyncs the journal at most
+    ``fsync_interval`` seconds after a write and folds the journal into the
+    snapshot every ``compact_interval`` seconds or ``compact_changes`` changes.
+
+    Compaction serialises the snapshot and rotates the journal under ``lock``,
+    then writes the snapshot outside of it, so writers are only blocked for the
+    duration of a ``json.dumps`` call.  Journal entries are full-record upserts,
+    which makes replay idempotent if the process dies mid-compaction.
+    """
+
+    def __init__(
+        self,
+        snapshot_path: str,
+        snapshot_provider: Callable[[], Dict[str, Any]],
+        lock: Any,
+        *,
+        compact_interval: float = DEFAULT_COMPACT_INTERVAL,
+        compact_changes: int = DEFAULT_COMPACT_CHANGES,
+        fsync_interval: float = DEFAULT_FSYNC_INTERVAL,
+    ) -> None:
+        self.snapshot_path = snapshot_path
+        self.journal_path = snapshot_path + JOURNAL_SUFFIX
+        self.rotated_path = snapshot_path + ROTATED_SUFFIX
+        self._snapshot_provider = snapshot_provider
+        self._lock = lock
+        self._compact_interval = max(compact_interval, 0.1)
+        self._compact_changes = max(compact_changes, 1)
+        self._fsync_interval = max(fsync_interval, 0.01)
+
+        self._fh = None
+        self._compaction_lock = threading.Lock()
+        self._pending_changes = 0
+        self._needs_fsync = False
+        self._last_compaction = time.monotonic()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------ #
+    # Loading
+    # ------------------------------------------------------------------ #
+    def load(self) -> Dict[str, Any]:
+        """Return the snapshot with any journal entries replayed on top."""
+        data: Dict[str, Any] = {}
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, "r", encoding="utf-8") as fh:
+                    loaded = json.load(fh)
+                if isinstance(loaded, dict):
+                    data = loaded
+            except (OSError, json.JSONDecodeError) as exc:
+                logger.error("Error loading snapshot %s: %s", self.snapshot_path, exc)
+
+        replayed = 0
+        for path in (self.rotated_path, self.journal_path):
+            replayed += self._replay(path, data)
+        if replayed:
+            logger.info("Replayed %s journal entries into %s", replayed, self.snapshot_path)
+            self._pending_changes = replayed
+        return data
+
+    @staticmethod
+    def _replay(path: str, data: Dict[str, Any]) -> int:
+        if not os.path.exists(path):
+            return 0
+        count = 0
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                for line in fh:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line after a crash; everything before it is valid.
+                        logger.warning("Skipping corrupt journal line in %s", path)
+                        continue
+                    key = str(entry.get("k"))
+                    value = entry.get("v")
+                    if value is None:
+                        data.pop(key, None)
+                    else:
+                        data[key] = value
+                    count += 1
+        except OSError as exc:
+            logger.error("Error replaying journal %s: %s", path, exc)
+        return count
+
+    # ------------------------------------------------------------------ #
+    # Writing
+    # ------------------------------------------------------------------ #
+    def start(self) -> None:
+        """Start the background thread; the journal file is created by the first ``append``."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+        self._thread.start()
+
+    def append(self, key: Any, value: Optional[Dict[str, Any]]) -> None:
+        """Record the new state of ``key`` (``None`` removes it)."""
+        line = json.dumps({"k": str(key), "v": value}, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            if self._fh is None:
+                self._open_journal()
+            try:
+                self._fh.write(line + "\n")
+                self._fh.flush()
+            except OSError as exc:
+                logger.error("Error appending to journal %s: %s", self.journal_path, exc)
+                return
+            self._pending_changes += 1
+            self._needs_fsync = True
+            if self._pending_changes >= self._compact_changes:
+                self._wakeup.set()
+
+    def compact(self, force: bool = False) -> None:
+        """Fold the journal into a fresh snapshot and drop the folded entries.
+
+        ``force`` rewrites the snapshot even without journalled changes, for
+        callers that replaced the data wholesale.
+        """
+        # Serialises whole compactions so an older payload never overwrites a newer one.
+        with self._compaction_lock:
+            with self._lock:
+                if not force and self._pending_changes == 0:
+                    self._last_compaction = time.monotonic()
+                    return
+                payload = json.dumps(self._snapshot_provider(), ensure_ascii=False, separators=(",", ":"))
+                self._rotate_journal()
+                self._pending_changes = 0
+                self._last_compaction = time.monotonic()
+
+            tmp_path = self.snapshot_path + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as fh:
+                    fh.write(payload)
+                    fh.flush()
+                    os.fsync(fh.fileno())
+                os.replace(tmp_path, self.snapshot_path)
+                if os.path.exists(self.rotated_path):
+                    os.remove(self.rotated_path)
+            except OSError as exc:
+                # The rotated journal is kept, so the next load still sees every change.
+                logger.error("Error compacting snapshot %s: %s", self.snapshot_path, exc)
+
+    def close(self) -> None:
+        """Stop the background thread and leave a fully compacted snapshot."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self._thread = None
+        self.compact()
+        with self._lock:
+            if self._fh is not None:
+                try:
+                    self._fh.close()
+                except OSError:
+                    pass
+                self._fh = None
+
+    # ------------------------------------------------------------------ #
+    # Internals
+    # ------------------------------------------------------------------ #
+    def _open_journal(self) -> None:
+        try:
+            self._fh = open(self.journal_path, "a", encoding="utf-8")
+        except OSError as exc:
+            logger.error("Error opening journal %s: %s", self.journal_path, exc)
+            self._fh = None
+
+    def _rotate_journal(self) -> None:
+        """Move the live journal aside; called with ``self._lock`` held."""
+        if self._fh is not None:
+            try:
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+                self._fh.close()
+            except OSError as exc:
+                logger.error("Error closing journal %s: %s", self.journal_path, exc)
+            self._fh = None
+        self._needs_fsync = False
+        try:
+            if os.path.exists(self.journal_path):
+                if os.path.exists(self.rotated_path):
+                    # A previous compaction failed; keep its entries ahead of the new ones.
+                    with open(self.rotated_path, "a", encoding="utf-8") as dst, open(
+                        self.journal_path, "r", encoding="utf-8"
+                    ) as src:
+                        dst.write(src.read())
+                    os.remove(self.journal_path)
+                else:
+                    os.replace(self.journal_path, self.rotated_path)
+        except OSError as exc:
+            logger.error("Error rotating journal %s: %s", self.journal_path, exc)
+
+    def _fsync(self) -> None:
+        with self._lock:
+            if not self._needs_fsync or self._fh is None:
+                return
+            try:
+                os.fsync(self._fh.fileno())
+            except OSError as exc:
+                logger.error("Error syncing journal %s: %s", self.journal_path, exc)
+            self._needs_fsync = False
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self._fsync_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            self._fsync()
+            due = time.monotonic() - self._last_compaction >= self._compact_interval
+            if self._pending_changes >= self._compact_changes or (due and self._pending_changes):
+                try:
+                    self.compact()
+                except Exception as exc:  # pragma: no cover - defensive
+                    logger.error("Journal compaction failed: %s", exc)
@@ -0,0 +1,83 @@
+"""Aho–Corasick keyword matcher: all keyword categories found in a text in one pass."""
+
+from __future__ import annotations
+
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List, Mapping, Set
+
+_NO_MATCH: FrozenSet[str] = frozenset()
+
+
+class KeywordMatcher:
+    """Report which keyword categories occur in a text, scanning it once.
+
+    ``categories`` maps a category name to its keywords.  :meth:`find` returns
+    the names of the categories that have at least one keyword occurring in the
+    text as a substring — the same answer as running
+    ``any(keyword in text for keyword in keywords)`` per category, but in a
+    single pass whose cost does not depend on the number of keywords.
+
+    The keyword trie and its failure links are compiled into a deterministic
+    automaton whose states hold their complete transition maps (characters
+    outside the keywords' alphabet lead back to the start), so the scan is
+    one dictionary lookup per character.  States that end a keyword are
+    numbered last, which makes "did anything match here?" a single
+    comparison.  Matching is case-sensitive: the tables are lower-case and
+    callers pass lower-cased text.
+    """
+
+    __slots__ = ("categories", "_transitions", "_first_accepting", "_output")
+
+    def __init__(self, categories: Mapping[str, Iterable[str]]) -> None:
+        self.categories: Dict[str, tuple] = {name: tuple(words) for name, words in categories.items()}
+        goto: List[Dict[str, int]] = [{}]
+        output: List[Set[str]] = [set()]
+        for name, words in self.categories.items():
+            for word in words:
+                if not word:
+                    raise ValueError(f"empty keyword in category {name!r}")
+                state = 0
+                for char in word:
+                    following = goto[state].get(char)
+                    if following is None:
+                        following = len(goto)
+                        goto[state][char] = following
+                        goto.append({})
+                        output.append(set())
+                    state = following
+                output[state].add(name)
+
+        # Breadth-first over the trie: a state's failure target is shallower,
+        # so its complete transition map is ready when the state is reached.
+        fail = [0] * len(goto)
+        complete: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in range(len(goto) - 1)]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            complete[state] = {**complete[fail[state]], **goto[state]}
+            output[state] |= output[fail[state]]
+            for char, child in goto[state].items():
+                fail[child] = complete[fail[state]].get(char, 0)
+                queue.append(child)
+
+        # Renumber: the start state stays 0, accepting states come last.
+        order = sorted(range(len(goto)), key=lambda state: (bool(output[state]), state != 0))
+        number = {state: index for index, state in enumerate(order)}
+        self._transitions = [
+            {char: number[target] for char, target in complete[state].items() if target} for state in order
+        ]
+        accepting = [number[state] for state in order if output[state]]
+        self._first_accepting = accepting[0] if accepting else len(order)
+        self._output = {number[state]: frozenset(output[state]) for state in order if output[state]}
+
+    def find(self, text: str) -> FrozenSet[str]:
+        """Names of all categories with a keyword in ``text``."""
+        transitions = self._transitions
+        first_accepting = self._first_accepting
+        found: Set[str] = set()
+        state = 0
+        for char in text:
+            state = transitions[state].get(char, 0)
+            if state >= first_accepting:
+                found |= self._output[state]
+        return frozenset(found) if found else _NO_MATCH
@@ -3,11 +3,14 @@ import asyncio
 import time
 import os
 import csv
+import functools
+import json
 from collections import defaultdict
 from aiohttp import web
 from io import StringIO, BytesIO
 from datetime import datetime
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
+from telegram.error import BadRequest
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -18,8 +21,49 @@ from telegram.ext import (
 )
 from enhanced_ai_handler import enhanced_ai_handler
 from database import user_db
+from persistence import persistence
 from smart_features import smart_features
-from config import TELEGRAM_TOKEN, CREATOR_USERNAME, TELEGRAM_CHANNEL, WEBSITE_URL
+from config import (
+    TELEGRAM_TOKEN,
+    AI_RESPONSE_TIMEOUT,
+    CREATOR_USERNAME,
+    TELEGRAM_CHANNEL,
+    WEBSITE_URL,
+    CONTEXT_MAX_USERS,
+    CONTEXT_IDLE_TTL,
+    CONTEXT_SPILL_PATH,
+    CONTEXT_FLUSH_INTERVAL,
+    RESPONSE_CACHE_BACKEND,
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_DISK_MAX_ENTRIES,
+    SEMANTIC_CACHE_ENABLED,
+    SEMANTIC_CACHE_CAPACITY,
+    SEMANTIC_CACHE_THRESHOLD,
+    STREAM_RESPONSES,
+    STREAM_EDIT_INTERVAL,
+    UPDATE_WORKERS,
+    UPDATE_MAX_PENDING,
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+)
+from cache import ResponseCache, ShelveCacheBackend, SQLiteCacheBackend
+from groq_scheduler import PRIORITY_HIGH, PRIORITY_NORMAL
+from message_analysis import MessageAnalysis
+from cache_keys import build_cache_key, cache_scope, shared_answer_key
+from semantic_cache import SemanticCache, is_semantic_candidate, numpy_available
+from singleflight import SingleFlight
+from streaming_reply import GROUP_EDIT_INTERVAL, StreamingReply
+from telegram_format import html_to_text, iter_message_chunks, render_answer_html
+from chunked_reply import send_chunks
+from send_queue import send_queue
+from update_processor import PerChatUpdateProcessor
+from webhook import WebhookReceiver, setup_webhook
+from context_store import ContextStore, ShelveSpill, SQLiteContextSpill
+from sqlite_store import get_default_store
 from scheduler_course import run_forever
 from course_handler import setup_course_handlers, send_welcome_to_group
 from permissions import is_admin_identity
@@ -32,123 +76,6 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-
-
-def format_code_for_telegram(text):
-    """Format code blocks and basic Markdown for Telegram HTML output."""
-    import re
-
-    block_placeholders = {}
-    inline_placeholders = {}
-
-    def replace_code_block(match):
-        code_content = match.group(2).rstrip()
-        escaped_code = escape_code_content(code_content)
-        placeholder = f'__CODE_BLOCK_{len(block_placeholders)}__'
-        block_placeholders[placeholder] = f'<pre><code>{escaped_code}</code></pre>'
-        return placeholder
-
-    text = re.sub(r'```(\w+)?\n?(.*?)\n?```', replace_code_block, text, flags=re.DOTALL)
-
-    def replace_inline_code(match):
-        code_content = escape_code_content(match.group(1))
-        placeholder = f'__INLINE_CODE_{len(inline_placeholders)}__'
-        inline_placeholders[placeholder] = f'<code>{code_content}</code>'
-        return placeholder
-
-    text = re.sub(r'`([^`\n]+)`', replace_inline_code, text)
-
-    text = escape_html_chars(text)
-    text = convert_markdown_to_html(text)
-
-    for placeholder, value in inline_placeholders.items():
-        text = text.replace(placeholder, value)
-
-    for placeholder, value in block_placeholders.items():
-        text = text.replace(placeholder, value)
-
-    return f"✅ <b>Ответ:</b>\n{text}"
-
-
-def escape_code_content(code_text):
-    """Escape HTML in code content while preserving structure"""
-    code_text = code_text.replace('&', '&amp;')
-    code_text = code_text.replace('<', '&lt;')
-    code_text = code_text.replace('>', '&gt;')
-    return code_text.strip()
-
-
-def escape_html_chars(text):
-    """Escape HTML special characters for safe Telegram HTML parsing"""
-    text = text.replace('&', '&amp;')
-    text = text.replace('<', '&lt;')
-    text = text.replace('>', '&gt;')
-    text = text.replace('"', '&quot;')
-    return text
-
-
-def convert_markdown_to_html(text: str) -> str:
-    import re
-
-    # Headings -> bold paragraphs
-    text = re.sub(r'^\s*#{3}\s+(.+)$', r'<b>\1</b>', text, flags=re.MULTILINE)
-    text = re.sub(r'^\s*#{2}\s+(.+)$', r'<b>\1</b>', text, flags=re.MULTILINE)
-    text = re.sub(r'^\s*#\s+(.+)$', r'<b>\1</b>', text, flags=re.MULTILINE)
-
-    # Replace horizontal rules with blank lines
-    text = re.sub(r'^\s*([-*_]){3,}\s*$', '', text, flags=re.MULTILINE)
-
-    # Convert simple markdown tables to bullet lists
-    lines = text.split('\n')
-    processed_lines = []
-    i = 0
-    while i < len(lines):
-        stripped = lines[i].strip()
-        if stripped.startswith('|') and stripped.endswith('|'):
-            if i + 1 < len(lines):
-                separator = lines[i + 1].strip()
-                if re.match(r'^\|\s*[-:]+\s*(\|\s*[-:]+\s*)+\|?$', separator):
-                    headers = [c.strip() for c in stripped.strip('|').split('|')]
-                    headers = [h for h in headers if h]
-                    i += 2
-                    while i < len(lines):
-                        row = lines[i].strip()
-                        if not (row.startswith('|') and row.endswith('|')):
-                            break
-                        cells = [c.strip() for c in row.strip('|').split('|')]
-                        pairs = []
-                        for idx, cell in enumerate(cells):
-                            if idx < len(headers) and headers[idx]:
-                                content = cell or '—'
-                                content = content or '—'
-                                # wrap in code if looks like tag or contains <>
-                                if '<' in content or '&lt;' in content:
-                                    content = f"<code>{content}</code>"
-                                pairs.append(f"<b>{headers[idx]}:</b> {content}")
-                            elif cell:
-                                content = cell
-                                if '<' in content or '&lt;' in content:
-                                    content = f"<code>{content}</code>"
-                                pairs.append(content)
-                        if pairs:
-                            processed_lines.append('&#8226; ' + '<br>'.join(pairs))
-                        i += 1
-                    continue
-        processed_lines.append(lines[i])
-        i += 1
-    text = '\n'.join(processed_lines)
-
-    # Bold (**text**)
-    text = re.sub(r'\*\*(.+?)\*\*', r'<b>\1</b>', text)
-    # Italic (*text*)
-    text = re.sub(r'(?<!\*)\*(?!\*)(.+?)(?<!\*)\*(?!\*)', r'<i>\1</i>', text)
-    # Bullet points starting with '-', '*', or '•' (bullet)
-    text = re.sub(r'(^|\n)[\-*\u2022]\s+', r'\1&#8226; ', text)
-    # Numbered lists keep numbers but ensure spacing
-    text = re.sub(r'\n(\d+)\.\s+', r'\n\1. ', text)
-    return text
-
-
 class RateLimiter:
     def __init__(self):
         self.user_requests = defaultdict(list)
@@ -169,21 +96,21 @@ class RateLimiter:
         return True
 
 
-class ResponseCache:
-    def __init__(self):
-        self.cache = {}
-        self.max_size = 100
-
-    def get(self, question_hash: str):
-        return self.cache.get(question_hash)
-
-    def set(self, question_hash: str, response: str):
-        if len(self.cache) >= self.max_size:
-            # Remove oldest entry
-            oldest_key = next(iter(self.cache))
-            del self.cache[oldest_key]
-        self.cache[question_hash] = response
-
+def _create_response_cache_backend():
+    backend = RESPONSE_CACHE_BACKEND or ("sqlite" if get_default_store() is not None else "memory")
+    try:
+        if backend == "sqlite":
+            store = get_default_store()
+            if store is not None:
+                return SQLiteCacheBackend(store)
+            logger.warning("RESPONSE_CACHE_BACKEND=sqlite требует STORAGE_BACKEND=sqlite, кэш будет в памяти")
+        elif backend == "shelve":
+            return ShelveCacheBackend(RESPONSE_CACHE_PATH)
+        elif backend != "memory":
+            logger.warning("Неизвестный RESPONSE_CACHE_BACKEND=%r, кэш будет в памяти", backend)
+    except Exception as exc:
+        logger.error("Не удалось открыть хранилище кэша ответов: %s", exc)
+    return None
 
 
 def _is_legacy_fallback_response(text: str) -> bool:
@@ -230,19 +157,74 @@ class UserContext:
         else:
             self.skill_level = "beginner"
 
+    def to_state(self) -> dict:
+        """Компактное состояние для выгрузки (без истории диалога)"""
+        return {
+            "skill_level": self.skill_level,
+            "preferred_language": self.preferred_language,
+            "preferences": self.preferences,
+            "feedback_scores": self.feedback_scores,
+            "last_tip_topic": self.last_tip_topic,
+            "last_tip_text": self.last_tip_text,
+        }
 
-# Хранилище контекстов
-user_contexts = {}
+    @classmethod
+    def from_state(cls, state: dict) -> "UserContext":
+        context = cls()
+        context.skill_level = state.get("skill_level", context.skill_level)
+        context.preferred_language = state.get("preferred_language", context.preferred_language)
+        context.preferences.update(state.get("preferences") or {})
+        context.feedback_scores = list(state.get("feedback_scores") or [])
+        context.last_tip_topic = state.get("last_tip_topic")
+        context.last_tip_text = state.get("last_tip_text")
+        return context
+
+
+def _create_context_spill():
+    store = get_default_store()
+    if store is not None:
+        return SQLiteContextSpill(store)
+    if not CONTEXT_SPILL_PATH:
+        return None
+    try:
+        return ShelveSpill(CONTEXT_SPILL_PATH)
+    except Exception as exc:
+        logger.error("Не удалось открыть хранилище контекстов %s: %s", CONTEXT_SPILL_PATH, exc)
+        return None
+
+
+# Хранилище контекстов: LRU + TTL простоя; загружаются лениво, изменения пишутся пакетами
+user_contexts = ContextStore(
+    UserContext,
+    max_entries=CONTEXT_MAX_USERS,
+    idle_ttl=CONTEXT_IDLE_TTL,
+    spill=_create_context_spill(),
+)
 
 
-def get_user_context(user_id: int) -> UserContext:
-    if user_id not in user_contexts:
-        user_contexts[user_id] = UserContext()
-    context = user_contexts[user_id]
+async def get_user_context(user_id: int) -> UserContext:
+    # Контекст не в памяти читается из хранилища в отдельном потоке, не блокируя цикл событий
+    context = await user_contexts.get_async(user_id)
     context.user_id = user_id
     return context
 
 
+async def flush_write_behind_forever():
+    """Периодически записывать изменённые контексты и кэш ответов пакетами в потоке хранилища"""
+    while True:
+        await asyncio.sleep(CONTEXT_FLUSH_INTERVAL)
+        batch = user_contexts.collect_dirty()
+        if batch:
+            # Итог записи отмечается здесь, в цикле событий: поток хранилища состояние не меняет
+            stored = False
+            try:
+                stored = await persistence.run(user_contexts.write, batch)
+            finally:
+                user_contexts.complete_write(batch, stored)
+        if response_cache.backend is not None:
+            await persistence.submit(response_cache.flush)
+
+
 def is_admin_user(telegram_user) -> bool:
     """Check whether the provided Telegram user has admin privileges."""
     if telegram_user is None:
@@ -288,7 +270,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
 
     user_id = query.from_user.id
-    user_context = get_user_context(user_id)
+    user_context = await get_user_context(user_id)
 
     if data == "feedback_good":
         user_context.update_skill_level(5)
@@ -340,9 +322,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
     username = update.message.from_user.username or "Unknown"
 
-    # Регистрируем пользователя в базе данных
-    user_data = user_db.get_user(user_id)
-    user_db.update_user(user_id, {
+    # Регистрируем пользователя в базе данных (запись выполняется вне event loop)
+    await persistence.submit(user_db.update_user, user_id, {
         'username': username,
         'first_name': update.message.from_user.first_name or "Unknown"
     })
@@ -376,7 +357,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
-    user_context = get_user_context(user_id)
+    user_context = await get_user_context(user_id)
 
     settings_text = (
         f"⚙️ Ваши настройки:\n\n"
@@ -392,6 +373,35 @@ async def settings_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(settings_text, reply_markup=get_main_keyboard())
 
 
+async def _generate_answer(
+    text, user_context, share_key, semantic_scope, priority=PRIORITY_NORMAL, on_delta=None, analysis=None
+):
+    """Запрос к ИИ; кэш заполняется здесь, чтобы общий запрос сохранил ответ ровно один раз.
+
+    С ``share_key`` ответ строится без личных данных и попадает в кэш; без него — персональный и не кэшируется.
+    """
+    response, is_fallback = await enhanced_ai_handler.get_specialized_response(
+        text,
+        "general",
+        user_context,
+        skill_level=user_context.skill_level,
+        preferences=user_context.preferences,
+        priority=priority,
+        on_delta=on_delta,
+        analysis=analysis,
+        shared=share_key is not None,
+    )
+    if not response or not response.strip():
+        return response, is_fallback
+    if not is_fallback and share_key:
+        response_cache.set(share_key, response)
+        if semantic_scope is not None:
+            semantic_cache.add(text, semantic_scope, response)
+    elif is_fallback:
+        logger.info("Skipping cache for fallback response")
+    return response, is_fallback
+
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         if not update or not update.message:
@@ -399,7 +409,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
             
         user_id = update.message.from_user.id
-        user_context = get_user_context(user_id)
+        user_context = await get_user_context(user_id)
 
         if not rate_limiter.is_allowed(user_id):
             await update.message.reply_text(
@@ -432,8 +442,10 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
 
-        text_lower = text.lower()
-        if 'установить уровень' in text_lower:
+        # Разбор сообщения выполняется один раз и передаётся дальше по конвейеру
+        analysis = MessageAnalysis(text)
+        text_lower = analysis.lower
+        if 'set_level' in analysis.matched:
             if 'начинающий' in text_lower:
                 user_context.skill_level = 'beginner'
                 await update.message.reply_text("✅ Уровень установлен: начинающий")
@@ -445,7 +457,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await update.message.reply_text("✅ Уровень установлен: продвинутый")
             return
 
-        if 'стиль кода' in text_lower:
+        if 'set_code_style' in analysis.matched:
             if 'краткий' in text_lower:
                 user_context.preferences['code_style'] = 'concise'
                 await update.message.reply_text("✅ Стиль кода: краткий")
@@ -457,12 +469,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await update.message.reply_text("✅ Стиль кода: для начинающих")
             return
 
-        sensitive_keywords = [
-            'пароль', 'токен', 'ключ', 'password', 'token', 'key', 'api_key',
-            'secret', 'секрет', 'конфигурация', 'config', 'env', '.env'
-        ]
-
-        if any(keyword in text_lower for keyword in sensitive_keywords):
+        if analysis.sensitive:
             await update.message.reply_text(
                 "🔒 Я не могу предоставить доступ к конфиденциальной информации.\n\n"
                 "Для безопасности все пароли и токены защищены.\n"
@@ -471,38 +478,53 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return
 
-        import hashlib
-        question_hash = hashlib.md5(text.encode()).hexdigest()
-        cached_response = response_cache.get(question_hash)
+        # Ключ учитывает нормализованный текст и персонализацию промпта; None — уточнение, кэш не используем
+        question_hash = build_cache_key(text, user_context.skill_level, user_context.preferences)
+        cached_response = await response_cache.get_async(question_hash) if question_hash else None
+        # Кэшировать и делить с одновременными вопросами можно только ответ без личных данных: он
+        # строится для пользователя без истории диалога, без имени и персональных советов
+        share_key = shared_answer_key(question_hash, user_context.history)
 
         if cached_response and _is_legacy_fallback_response(cached_response):
             logger.info("Removing legacy fallback from cache")
-            response_cache.cache.pop(question_hash, None)
+            response_cache.delete(question_hash)
             cached_response = None
 
+        # Похожий по формулировке вопрос с той же персонализацией
+        semantic_scope = None
+        if question_hash and semantic_cache is not None and is_semantic_candidate(text):
+            semantic_scope = cache_scope(user_context.skill_level, user_context.preferences)
+            if not cached_response:
+                match = semantic_cache.lookup(text, semantic_scope)
+                if match:
+                    cached_response, similarity = match
+                    logger.info(f"🧭 Семантический кэш: сходство {similarity:.2f} для {user_id}")
+
         if cached_response:
             logger.info(f"📦 Используем кэшированный ответ для {user_id}")
-            await update.message.reply_text(
-                cached_response + "\n\n💡 Быстрый ответ из кэша!",
-                reply_markup=get_main_keyboard()
+            await send_chunks(
+                lambda chunk, reply_markup: update.message.reply_text(chunk, reply_markup=reply_markup),
+                iter_message_chunks(cached_response + "\n\n💡 Быстрый ответ из кэша!", html=False),
+                reply_markup=get_main_keyboard(),
             )
             return
 
-        # Увеличиваем счетчик вопросов
-        user_db.increment_questions(user_id)
+        # Увеличиваем счетчик вопросов (запись выполняется вне event loop)
+        await persistence.submit(user_db.increment_questions, user_id)
 
-        if any(word in text_lower for word in ['javascript', 'js', 'джаваскрипт']):
-            user_db.add_topic_interest(user_id, 'javascript')
+        topic = analysis.topics[0] if analysis.topics else None
+        if topic == 'javascript':
+            await persistence.submit(user_db.add_topic_interest, user_id, 'javascript')
             if 'javascript' not in user_context.preferences['favorite_languages']:
                 user_context.preferences['favorite_languages'].append('javascript')
-        elif any(word in text_lower for word in ['python', 'питон', 'пайтон']):
-            user_db.add_topic_interest(user_id, 'python')
+        elif topic == 'python':
+            await persistence.submit(user_db.add_topic_interest, user_id, 'python')
             if 'python' not in user_context.preferences['favorite_languages']:
                 user_context.preferences['favorite_languages'].append('python')
-        elif any(word in text_lower for word in ['найди ошибку', 'ошибка', 'debug']):
-            user_db.add_topic_interest(user_id, 'debugging')
-        elif any(word in text_lower for word in ['с чего начать', 'начать учить', 'основы']):
-            user_db.add_topic_interest(user_id, 'learning')
+        elif topic == 'debugging':
+            await persistence.submit(user_db.add_topic_interest, user_id, 'debugging')
+        elif topic == 'learning':
+            await persistence.submit(user_db.add_topic_interest, user_id, 'learning')
             if 'learning_basics' not in user_context.preferences['learning_goals']:
                 user_context.preferences['learning_goals'].append('learning_basics')
 
@@ -512,19 +534,37 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.info(f"📨 Получено сообщение от {user_id}: {text[:100]}...")
 
         is_fallback = False
+        streaming = None
         try:
-            response, is_fallback = await asyncio.wait_for(
-                enhanced_ai_handler.get_specialized_response(
-                    text,
-                    "general",
-                    user_context,
-                    skill_level=user_context.skill_level,
-                    preferences=user_context.preferences
-                ),
-                timeout=30.0
+            # Запросы администраторов обслуживаются в приоритетной очереди к Groq
+            priority = PRIORITY_HIGH if is_admin_user(update.message.from_user) else PRIORITY_NORMAL
+            # Ответ показывается по мере генерации; общий запрос стримит только в сообщение ведущего
+            if STREAM_RESPONSES:
+                interval = STREAM_EDIT_INTERVAL
+                if update.effective_chat and update.effective_chat.type != 'private':
+                    interval = max(interval, GROUP_EDIT_INTERVAL)
+                streaming = StreamingReply(update.message, interval=interval)
+            generate = functools.partial(
+                _generate_answer,
+                text,
+                user_context,
+                share_key,
+                semantic_scope,
+                priority,
+                streaming.feed if streaming else None,
+                analysis,
             )
+            if share_key:
+                # Одинаковые вопросы, пришедшие одновременно, ждут один общий запрос к ИИ
+                (response, is_fallback), shared = await answer_flights.do(share_key, generate, timeout=AI_RESPONSE_TIMEOUT)
+                if shared:
+                    logger.info(f"🔗 Ответ для {user_id} получен из уже выполняющегося запроса")
+            else:
+                response, is_fallback = await asyncio.wait_for(generate(), timeout=AI_RESPONSE_TIMEOUT)
         except asyncio.TimeoutError:
             logger.error(f"Timeout for user {user_id}")
+            if streaming is not None:
+                await streaming.discard()
             await update.message.reply_text(
                 "⏱️ Запрос обрабатывается слишком долго. Попробуйте упростить вопрос или повторить позже.",
                 reply_markup=get_main_keyboard()
@@ -532,6 +572,8 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
         except Exception as ai_error:
             logger.error(f"AI handler error for user {user_id}: {ai_error}")
+            if streaming is not None:
+                await streaming.discard()
             await update.message.reply_text(
                 "🤖 Временные проблемы с ИИ. Попробуйте переформулировать вопрос.",
                 reply_markup=get_main_keyboard()
@@ -539,69 +581,50 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         if not response or len(response.strip()) == 0:
+            if streaming is not None:
+                await streaming.discard()
             await update.message.reply_text(
                 "🤔 Не удалось сформировать ответ. Попробуйте переформулировать вопрос.",
                 reply_markup=get_main_keyboard()
             )
             return
 
-        if not is_fallback:
-            response_cache.set(question_hash, response)
-        else:
-            logger.info("Skipping cache for fallback response")
-
         user_context.add_message("assistant", response)
 
         # Логируем ответ
         logger.info(f"📤 Отправляем ответ: {response[:100]}...")
 
+        preview = streaming
+
+        async def send_html(chunk, reply_markup):
+            nonlocal preview
+            # Превью потока заменяется первой частью ответа; если превью не было или правка не прошла — обычная отправка
+            if preview is not None:
+                shown, preview = preview, None
+                if await shown.finish(chunk, reply_markup=reply_markup):
+                    return None
+                await shown.discard()
+            try:
+                return await update.message.reply_text(chunk, reply_markup=reply_markup, parse_mode='HTML')
+            except BadRequest as markup_error:
+                # Разметку, которую Telegram не принял, отправляем той же частью без HTML
+                logger.warning(f"HTML part rejected, sending it as plain text: {markup_error}")
+                return await update.message.reply_text(html_to_text(chunk), reply_markup=reply_markup)
+
         try:
-            has_code = any([
-                '\`\`\`' in response,  # Fixed: removed escaping from backticks
-                '`' in response,  # Inline code
-                'def ' in response,
-                'function ' in response,
-                'class ' in response,
-                'import ' in response,
-                'from ' in response,
-                'console.log' in response,
-                'print(' in response,
-                'return ' in response,
-                'html>' in response.lower(),
-                'DOCTYPE' in response
-            ])
-
-            if has_code:
-                formatted_response = format_code_for_telegram(response)
-                await update.message.reply_text(
-                    formatted_response,
-                    reply_markup=get_main_keyboard(),
-                    parse_mode='HTML'
-                )
-            else:
-                safe_response = escape_html_chars(response)
-                await update.message.reply_text(
-                    f"✅ <b>Ответ:</b>\n{safe_response}",
-                    reply_markup=get_main_keyboard(),
-                    parse_mode='HTML'
-                )
+            # Длинный ответ уходит несколькими сообщениями, следующая часть режется, пока отправляется предыдущая
+            await send_chunks(send_html, iter_message_chunks(render_answer_html(response)), reply_markup=get_main_keyboard())
 
         except Exception as send_error:
             logger.error(f"Message sending error: {send_error}")
-            try:
-                safe_response = escape_html_chars(response)
-                await update.message.reply_text(
-                    f"✅ <b>Ответ:</b>\n{safe_response}",
-                    reply_markup=get_main_keyboard(),
-                    parse_mode='HTML'
-                )
-            except Exception:
-                # Final fallback - guaranteed to work
-                clean_response = ''.join(c for c in response if ord(c) < 128)  # ASCII only
-                await update.message.reply_text(
-                    f"✅ Ответ: {clean_response[:1000]}",
-                    reply_markup=get_main_keyboard()
-                )
+            if preview is not None:
+                await preview.discard()
+            # Запасной вариант: весь ответ обычным текстом, тоже частями
+            await send_chunks(
+                lambda chunk, reply_markup: update.message.reply_text(chunk, reply_markup=reply_markup),
+                iter_message_chunks("✅ Ответ:\n" + response, html=False),
+                reply_markup=get_main_keyboard(),
+            )
 
     except Exception as e:
         logger.error(f"Критическая ошибка в handle_message: {e}", exc_info=True)
@@ -673,8 +696,8 @@ async def about_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # Команда /stats - статистика пользователя
 async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.message.from_user.id
-    user_context = get_user_context(user_id)
-    stats = user_db.get_user_stats(user_id)
+    user_context = await get_user_context(user_id)
+    stats = await persistence.run(user_db.get_user_stats, user_id)
 
     stats_text = (
         f"📊 Ваша статистика:\n\n"
@@ -724,8 +747,8 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await message.reply_text("Open a private chat with the bot to view the admin statistics.")
         return
 
-    total_users = user_db.get_all_users_count()
-    active_users = len(user_db.get_active_users(7))
+    total_users = await persistence.run(user_db.get_all_users_count)
+    active_users = await persistence.run(user_db.count_active_users, 7)
 
     admin_text = (
         f"👑 Админ панель\n\n"
@@ -742,7 +765,9 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def _send_admin_export_csv(query):
-    if not user_db.users_data:
+    # Копии записей снимаются в потоке хранилища, пока его записи не меняют словарь
+    records = await persistence.run(user_db.snapshot_users)
+    if not records:
         await query.message.reply_text("Пока нет данных для экспорта.")
         return
 
@@ -764,7 +789,7 @@ async def _send_admin_export_csv(query):
     writer = csv.DictWriter(stream, fieldnames=fieldnames)
     writer.writeheader()
 
-    for record in user_db.users_data.values():
+    for record in records:
         writer.writerow({
             "user_id": record.get("user_id"),
             "username": record.get("username") or "",
@@ -799,30 +824,49 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         pass
 
 
-# Запуск бота
-async def bot_runner():
-    try:
-        application = Application.builder().token(TELEGRAM_TOKEN).build()
+# Сборка приложения бота
+def build_application() -> Application:
+    # Все запросы к Bot API идут через общую очередь отправки: лимиты Telegram и повторы после flood control
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .rate_limiter(send_queue)
+        .concurrent_updates(update_processor)
+    )
+    if WEBHOOK_URL:
+        # Обновления приходят на webhook веб-сервера, Updater для long polling не нужен
+        builder = builder.updater(None)
+    application = builder.build()
 
-        # Добавляем обработчики
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("help", help_command))
-        application.add_handler(CommandHandler("about", about_command))
-        application.add_handler(CommandHandler("stats", stats_command))
-        application.add_handler(CommandHandler("settings", settings_command))  # Added settings command
-        application.add_handler(CommandHandler("admin", admin_command))
-        application.add_handler(CallbackQueryHandler(button_callback, pattern=r"^(admin_|feedback_)"))
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    # Добавляем обработчики
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("about", about_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("settings", settings_command))  # Added settings command
+    application.add_handler(CommandHandler("admin", admin_command))
+    application.add_handler(CallbackQueryHandler(button_callback, pattern=r"^(admin_|feedback_)"))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 
-        # Добавляем обработчики курса
-        setup_course_handlers(application)
+    # Добавляем обработчики курса
+    setup_course_handlers(application)
 
-        # Обработчик ошибок
-        application.add_error_handler(error_handler)
+    # Обработчик ошибок
+    application.add_error_handler(error_handler)
 
+    return application
+
+
+# Запуск бота
+async def bot_runner(application: Application):
+    try:
         await application.initialize()
         await application.start()
-        await application.updater.start_polling()
+        if WEBHOOK_URL:
+            # Telegram будет присылать обновления на WEBHOOK_PATH с секретом в заголовке
+            await application.bot.set_webhook(url=WEBHOOK_URL + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET)
+        else:
+            await application.updater.start_polling()
 
         logger.info("🤖 Бот запущен! Создан Вадимом (vadzim.by)")
         print("🚀 Бот запущен! Создан Вадимом (vadzim.by)")
@@ -840,26 +884,57 @@ async def bot_runner():
     except Exception as e:
         logger.error(f"Ошибка запуска бота: {e}")
     finally:
-        if 'application' in locals():
-            if getattr(application, 'running', False):
-                await application.stop()
-            elif getattr(application, 'initialized', False):
-                await application.shutdown()
+        if getattr(application, 'running', False):
+            await application.stop()
+        elif getattr(application, 'initialized', False):
+            await application.shutdown()
+
+
+# Приёмник webhook в веб-приложении (есть только в режиме webhook)
+WEBHOOK_RECEIVER = web.AppKey("webhook_receiver", WebhookReceiver)
 
 
 async def health_handler(request):
     return web.Response(text="OK")
 
 
+async def metrics_handler(request):
+    receiver = request.app.get(WEBHOOK_RECEIVER)
+    payload = {
+        "user_contexts": user_contexts.metrics(),
+        "response_cache": response_cache.metrics(),
+        "semantic_cache": semantic_cache.metrics() if semantic_cache is not None else None,
+        "answer_flights": answer_flights.metrics(),
+        "groq_scheduler": enhanced_ai_handler.groq_scheduler.metrics(),
+        "groq_resilience": enhanced_ai_handler.groq_resilience.metrics(),
+        "groq_routes": enhanced_ai_handler.model_router.metrics(),
+        "prompt_budget": enhanced_ai_handler.prompt_budget.metrics(),
+        "send_queue": send_queue.metrics(),
+        "update_processor": update_processor.metrics(),
+        "webhook": receiver.metrics() if receiver is not None else None,
+    }
+    return web.Response(text=json.dumps(payload), content_type="application/json")
+
+
 async def main_entry():
+    # Сбрасываем журналы/очереди хранилища при остановке
+    persistence.add_shutdown_hook(user_db.close)
+    persistence.add_shutdown_hook(user_contexts.close)
+    persistence.add_shutdown_hook(response_cache.close)
+
     # Запускаем планировщик курса в фоне
     scheduler_task = asyncio.create_task(run_forever())
+    contexts_task = asyncio.create_task(flush_write_behind_forever())
     
-    bot_task = asyncio.create_task(bot_runner())
+    application = build_application()
+    bot_task = asyncio.create_task(bot_runner(application))
 
     app = web.Application()
     app.router.add_get("/", health_handler)
     app.router.add_get("/health", health_handler)
+    app.router.add_get("/metrics", metrics_handler)
+    if WEBHOOK_URL:
+        app[WEBHOOK_RECEIVER] = setup_webhook(app, application, WEBHOOK_PATH, WEBHOOK_SECRET)
 
     runner = web.AppRunner(app)
     await runner.setup()
@@ -869,10 +944,13 @@ async def main_entry():
     try:
         await site.start()
         logger.info("Health check server running on port %s", port)
+        if WEBHOOK_URL:
+            logger.info("Receiving updates via webhook at %s%s", WEBHOOK_URL, WEBHOOK_PATH)
         await bot_task
     except asyncio.CancelledError:
         bot_task.cancel()
         scheduler_task.cancel()
+        contexts_task.cancel()
         raise
     except Exception:
         logger.exception("Critical error in bot loop")
@@ -884,16 +962,35 @@ async def main_entry():
                 await bot_task
             except asyncio.CancelledError:
                 pass
-        if not scheduler_task.done():
-            scheduler_task.cancel()
-            try:
-                await scheduler_task
-            except asyncio.CancelledError:
-                pass
+        for task in (scheduler_task, contexts_task):
+            if not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
         await runner.cleanup()
+        await persistence.shutdown()
 
 rate_limiter = RateLimiter()
-response_cache = ResponseCache()
+response_cache = ResponseCache(
+    max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+    max_bytes=RESPONSE_CACHE_MAX_BYTES,
+    ttl=RESPONSE_CACHE_TTL,
+    backend=_create_response_cache_backend(),
+    backend_max_entries=RESPONSE_CACHE_DISK_MAX_ENTRIES,
+)
+answer_flights = SingleFlight()
+
+# Обновления разных пользователей обрабатываются параллельно, одного пользователя — по порядку,
+# чтобы медленный ответ Groq не задерживал остальных, а история диалога не перемешивалась
+update_processor = PerChatUpdateProcessor(UPDATE_WORKERS, max_pending=UPDATE_MAX_PENDING)
+semantic_cache = None
+if SEMANTIC_CACHE_ENABLED:
+    if numpy_available():
+        semantic_cache = SemanticCache(capacity=SEMANTIC_CACHE_CAPACITY, threshold=SEMANTIC_CACHE_THRESHOLD)
+    else:
+        logger.warning("numpy не установлен: семантический кэш отключён")
 
 if __name__ == "__main__":
     asyncio.run(main_entry())
@@ -0,0 +1,82 @@
+"""
+Разбор входящего сообщения: выполняется один раз на апдейт и передаётся дальше по конвейеру
+"""
+
+import re
+from typing import FrozenSet, Optional, Tuple
+
+from message_keywords import (
+    MESSAGE_KEYWORDS,
+    MODE_KEYWORDS,
+    PROGRAMMING_LANGUAGES,
+    TONE_KEYWORDS,
+    TOPIC_KEYWORDS,
+)
+
+# Блоки кода в сообщении: (язык, код)
+CODE_BLOCK_RE = re.compile(r"```(\w+)?\s*(.*?)```", re.DOTALL)
+
+
+def language_from_keywords(matched: FrozenSet[str]) -> Optional[str]:
+    """Первый язык из PROGRAMMING_LANGUAGES, чьё ключевое слово нашлось в тексте"""
+    for language in PROGRAMMING_LANGUAGES:
+        if "lang:" + language in matched:
+            return language
+    return None
+
+
+def language_from_syntax(text: str) -> Optional[str]:
+    """Язык по характерному синтаксису, когда ключевых слов нет"""
+    if 'def ' in text and ':' in text:
+        return 'python'
+    elif 'function' in text and '{' in text:
+        return 'javascript'
+    elif 'public class' in text:
+        return 'java'
+    elif '#include' in text:
+        return 'cpp'
+    return None
+
+
+class MessageAnalysis:
+    """Всё, что обработчикам нужно знать о тексте сообщения, посчитанное за один раз.
+
+    Текст приводится к нижнему регистру и один раз проходит через общий
+    автомат ключевых слов (MESSAGE_KEYWORDS); из найденных категорий
+    выводятся тон, режим ответа, темы, признак чувствительных данных и язык.
+    main.handle_message создаёт разбор и передаёт его в
+    EnhancedAIHandler.get_specialized_response, чтобы текст не сканировался
+    повторно на каждом шаге.
+    """
+
+    __slots__ = ("text", "lower", "matched", "tone", "mode", "topics", "sensitive", "code_blocks", "language")
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.lower = text.lower().strip()
+        self.matched: FrozenSet[str] = MESSAGE_KEYWORDS.find(self.lower)
+        # Порядок таблиц задаёт приоритет: первый совпавший тон/режим побеждает
+        self.tone: Optional[str] = next((tone for tone, _ in TONE_KEYWORDS if "tone:" + tone in self.matched), None)
+        self.mode: str = next((mode for mode, _ in MODE_KEYWORDS if "mode:" + mode in self.matched), "general")
+        self.topics: Tuple[str, ...] = tuple(topic for topic, _ in TOPIC_KEYWORDS if "topic:" + topic in self.matched)
+        self.sensitive = "sensitive" in self.matched
+        self.code_blocks: Tuple[Tuple[str, str], ...] = tuple(CODE_BLOCK_RE.findall(text)) if "```" in text else ()
+        self.language: Optional[str] = language_from_keywords(self.matched) or language_from_syntax(text)
+
+    @property
+    def is_code_question(self) -> bool:
+        """Вопрос о программировании (признаки CODE_INDICATORS)"""
+        return "code" in self.matched
+
+    def truncated(self, max_lines: int) -> "MessageAnalysis":
+        """Разбор сообщения, обрезанного до max_lines строк (тот же объект, если обрезать нечего)"""
+        lines = self.text.splitlines()
+        if len(lines) <= max_lines:
+            return self
+        return MessageAnalysis("\n".join(lines[:max_lines]) + "\n…")
+
+    def __repr__(self) -> str:
+        return (
+            f"MessageAnalysis(tone={self.tone!r}, mode={self.mode!r}, language={self.language!r}, "
+            f"topics={self.topics!r}, sensitive={self.sensitive}, code_blocks={len(self.code_blocks)})"
+        )
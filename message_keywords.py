@@ -0,0 +1,303 @@
+"""
+Таблицы ключевых слов для разбора сообщений и общий автомат для поиска по ним за один проход
+"""
+
+from cache_keys import FOLLOW_UP_KEYWORDS
+from keyword_matcher import KeywordMatcher
+from prompt_templates import VADZIM_KEYWORDS
+
+# Пресеты small talk: триггеры и варианты ответа
+SMALL_TALK_PRESETS = [
+    {
+        "triggers": ("не работает", "сломалось", "не запускается", "ошибка", "баг", "падает", "у меня баг"),
+        "responses": [
+            "🛠 Понимаю, как неприятно, когда что-то ломается. Давай посмотрим на детали и разнесём этот баг вместе.",
+            "🧯 Ох, похоже система просит внимания. Расскажи, какие ошибки видишь — попробуем разрулить.",
+            "🤖 Техдолг настиг! Кинь информацию об ошибке, и мы шаг за шагом найдём решение.",
+        ],
+    },
+    {
+        "triggers": ("получилось", "готово", "сделал", "успех", "заработало", "завелось"),
+        "responses": [
+            "🔥 Красота! Люблю такие апдейты. Если хочешь закрепить результат, могу подсказать, что ещё проверить.",
+            "🎉 Отличная работа! Можем сразу подумать, как автоматизировать следующий шаг.",
+            "🙌 Вот это скорость! Если хочешь, помогу задокументировать успех, чтобы повторить в следующий раз.",
+        ],
+    },
+    {
+        "triggers": ("как дела", "как жизнь", "как ты", "как настроение"),
+        "responses": [
+            "😊 Всё отлично! С утра разруливал пару бойлерплейтов, а сейчас могу подсказать тебе. Что сегодня в планах?",
+            "💪 Держусь бодро: ревьюлю код, подпиливаю бота и слежу, чтобы деплой на Render не заснул. Как у тебя прогресс?",
+            "☕ Пью виртуальный кофе и мониторю логи, чтобы всё работало 24/7. Что новенького у тебя?",
+        ],
+    },
+    {
+        "triggers": ("что делаешь", "чем занимаешься", "чем занят"),
+        "responses": [
+            "🧰 Сейчас перебираю логи и допиливаю ответы, чтобы они звучали живее. Хочешь — подключу мозговой штурм к твоему вопросу.",
+            "🔍 Чищу техдолг, чтобы бот не повторялся и быстрее находил решения. Расскажи, что у тебя наболело?",
+            "🛠 Кручусь между задачами: тестирую идеи, пишу сниппеты, помогаю пользователям. Давай разберёмся и с твоей задачей!",
+        ],
+    },
+    {
+        "triggers": ("что нового", "какие новости"),
+        "responses": [
+            "📰 Читаю свежие апдейты по FastAPI и Groq — любопытно, что они придумали. А у тебя какие новости?",
+            "📬 Разбираю фидбек от пользователей и думаю, как прокачать ответы. Делись, что у тебя интересного.",
+            "🧭 Пробую новые трюки в промптинге, чтобы бот отвечал точнее. Если есть идеи — обсудим!",
+        ],
+    },
+    {
+        "triggers": ("доброе утро",),
+        "responses": [
+            "🌅 Доброе утро! Отличное время добить злосчастный баг до того, как проснётся вся команда.",
+            "☀️ Привет! Предлагаю начать день с небольшой победы — с чего начнём?",
+            "🧠 Утренний мозг заряжен. Готов помочь тебе разгрести любую задачу.",
+        ],
+    },
+    {
+        "triggers": ("добрый день",),
+        "responses": [
+            "🌞 Добрый день! Если нужно ускорить фичу или починить тесты — я рядом.",
+            "🥪 Как проходит день? Если зависаешь на задаче, давай разберём её вместе.",
+            "🧭 Полдень — время навести порядок в коде. С чего начнём?",
+        ],
+    },
+    {
+        "triggers": ("добрый вечер",),
+        "responses": [
+            "🌇 Добрый вечер! Отличный момент подвести итоги и запланировать, что закрыть завтра.",
+            "🎧 Я тут, если хочешь быстро пройтись по задачам перед оффлайном.",
+            "🛋 Вечер — отличное время обсудить архитектуру или набросать идеи для рефакторинга.",
+        ],
+    },
+    {
+        "triggers": ("доброй ночи", "спокойной ночи"),
+        "responses": [
+            "🌙 Доброй ночи! Если хочешь, могу оставить для тебя чек-лист на утро.",
+            "🛌 Отдыхай! Утром продолжим штурмовать код — идеи уже подкипают.",
+            "😴 Понимаю, смена была жаркая. Я побуду на страже, когда вернёшься.",
+        ],
+    },
+    {
+        "triggers": ("привет", "приветик", "здорово", "здравствуйте", "hello", "hi", "hey"),
+        "responses": [
+            "👋 Привет! Всегда рад поговорить о коде и проектах. Что сейчас в работе?",
+            "🤖 Привет! Я уже разогрел модель — давай к делу?",
+            "🙌 Привет! Слушаю внимательно. Расскажи, с чем помочь.",
+        ],
+    },
+    {
+        "triggers": ("спасибо", "благодарю"),
+        "responses": [
+            "✨ Всегда пожалуйста! Если появятся новые вопросы — не стесняйся, помогу.",
+            "😊 Рад, что пригодилось. Готов обсудить следующий шаг, когда будешь готов.",
+            "🤗 Обращайся в любое время! Люблю видеть прогресс проектов.",
+        ],
+    },
+    {
+        "triggers": ("расскажи о себе", "ты кто"),
+        "responses": [
+            "Я Помощник Программиста — меня создал Вадим (vadzim.by). Люблю Python, автотесты и дружелюбный онбординг в IT.",
+            "Меня зовут Помощник Программиста. Я — проект Вадима (vadzim.by) и обожаю помогать с кодом.",
+            "Я цифровой напарник Вадима (vadzim.by). Подсказки, ревью, идеи — это ко мне.",
+        ],
+    },
+    {
+        "triggers": ("ты тут", "ты здесь", "на связи", "ты онлайн"),
+        "responses": [
+            "Всегда здесь! Давай посмотрим, что можно улучшить прямо сейчас.",
+            "На связи! Подкидывай код или вопрос — вместе решим.",
+            "Да, я рядом. Рассказывай, что происходит.",
+        ],
+    },
+    {
+        "triggers": ("помнишь меня",),
+        "responses": [
+            "Конечно! Я веду историю диалога — расскажи, на чём остановились.",
+            "Помню! Готов продолжить с того места, где мы заканчивали.",
+            "Да, держу контекст. Что обновилось с тех пор?",
+        ],
+    },
+    {
+        "triggers": ("что посоветуешь", "какой совет"),
+        "responses": [
+            "Могу подсказать подход, ресурс или инструмент. Уточни тему — и я подберу что-то дельное.",
+            "Давай сузим запрос: какую область хочешь подтянуть? Я подскажу, с чего начать.",
+            "Люблю делиться находками! Направь, что хочется улучшить, и подберу чек-лист.",
+        ],
+    },
+    {
+        "triggers": ("скучаешь",),
+        "responses": [
+            "😄 Тут не до скуки: всегда есть чей-то pet-проект, который ждёт подсказки. Как твои дела?",
+            "😂 Я занят тем, что читаю логи и придумываю новые фичи. Лучше расскажи, что интересного у тебя!",
+            "🤓 Скучать не приходится — проекты кипят. Так что залетай со своими задачами.",
+        ],
+    },
+]
+
+# Признаки эмоционального тона
+POSITIVE_KEYWORDS = (
+    "ура",
+    "получилось",
+    "готово",
+    "сделал",
+    "сделала",
+    "заработало",
+    "заработал",
+    "успех",
+    "сработало",
+    "вышло",
+    "fixed",
+    "done",
+    "solved",
+    "ready",
+    "закоммитил",
+    "задеплоил",
+)
+
+NEGATIVE_KEYWORDS = (
+    "не работает",
+    "сломалось",
+    "не выходит",
+    "ошибка",
+    "ошибку",
+    "баг",
+    "не запускается",
+    "упало",
+    "упал",
+    "падает",
+    "не собирается",
+    "fail",
+    "problem",
+    "issue",
+    "traceback",
+    "stack trace",
+    "вылетает",
+    "не проходит тест",
+    "не компилируется",
+)
+
+# Дополнительные признаки эмоций (проверяются после NEGATIVE/POSITIVE)
+FRUSTRATION_WORDS = ("блять", "черт", "долбаный", "ненавижу", "бесит", "устал", "надоело")
+EXCITED_WORDS = ("вау", "круто", "супер", "отлично", "класс", "здорово", "ура")
+CONFUSED_PHRASES = ("не понимаю", "не понял", "запутался", "не знаю", "как это", "что это")
+
+# Тон сообщения; побеждает первый совпавший
+TONE_KEYWORDS = (
+    ("negative", NEGATIVE_KEYWORDS),
+    ("positive", POSITIVE_KEYWORDS),
+    ("frustrated", FRUSTRATION_WORDS),
+    ("excited", EXCITED_WORDS),
+    ("confused", CONFUSED_PHRASES),
+)
+
+# Простые small talk вопросы, которые узнаём и в сообщениях с "?"
+SMALL_TALK_QUESTIONS = (
+    "как дела",
+    "как жизнь",
+    "как ты",
+    "как настроение",
+    "что делаешь",
+    "чем занимаешься",
+    "что нового",
+    "какие новости",
+)
+
+# Режим ответа по ключевым словам; побеждает первый совпавший
+MODE_KEYWORDS = (
+    ("optimize_code", ("оптимизируй", "optimize")),
+    ("explain_concept", ("объясни", "explain")),
+    ("debug_code", ("ошибка", "debug")),
+    ("architecture_advice", ("архитектур", "architecture")),
+    ("analyze_code", ("анализируй", "проанализируй", "analyze")),
+)
+
+# Признаки вопросов с готовыми ответами без обращения к Groq
+SHORTCUT_KEYWORDS = {
+    "html": ("html",),
+    "css": ("css",),
+    "learn_start": ("нач", "start", "уч", "изуч", "learn"),
+    "calculator": ("калькулятор", "calculator"),
+    "js": ("javascript", "js"),
+    "find_error": ("найди ошибку", "find error"),
+    "learning_advice": ("с чего начать", "как начать", "начать учить", "начать изучать"),
+    "explain_this_code": ("объясни этот код", "что делает этот код"),
+    "analyze_this_code": ("проанализируй этот код", "analyze this code"),
+}
+
+# Текстовые команды настройки в main.handle_message
+SETTINGS_KEYWORDS = {
+    "set_level": ("установить уровень",),
+    "set_code_style": ("стиль кода",),
+}
+
+SENSITIVE_KEYWORDS = (
+    "пароль", "токен", "ключ", "password", "token", "key", "api_key",
+    "secret", "секрет", "конфигурация", "config", "env", ".env",
+)
+
+# Темы интересов пользователя; засчитывается первая совпавшая
+TOPIC_KEYWORDS = (
+    ("javascript", ("javascript", "js", "джаваскрипт")),
+    ("python", ("python", "питон", "пайтон")),
+    ("debugging", ("найди ошибку", "ошибка", "debug")),
+    ("learning", ("с чего начать", "начать учить", "основы")),
+)
+
+# Признаки вопроса о программировании (utils.is_code_question)
+CODE_INDICATORS = (
+    'код', 'функция', 'переменная', 'массив', 'объект', 'класс',
+    'алгоритм', 'ошибка', 'баг', 'отладка', 'программа',
+    'code', 'function', 'variable', 'array', 'object', 'class',
+    'algorithm', 'error', 'bug', 'debug', 'program',
+    '```', 'import', 'from', 'def ', 'function', 'var ', 'let ',
+    'const ', 'class ', 'interface', 'type', 'struct',
+)
+
+# Расширенный список языков программирования; побеждает первый совпавший
+PROGRAMMING_LANGUAGES = {
+    'python': ['python', 'py', 'питон', 'пайтон'],
+    'javascript': ['javascript', 'js', 'джаваскрипт', 'node'],
+    'typescript': ['typescript', 'ts', 'тайпскрипт'],
+    'java': ['java', 'джава'],
+    'cpp': ['c++', 'cpp', 'c plus plus', 'си плюс плюс'],
+    'c': ['c', 'си'],
+    'rust': ['rust', 'раст'],
+    'go': ['go', 'golang', 'гоу'],
+    'php': ['php', 'пхп'],
+    'ruby': ['ruby', 'руби'],
+    'swift': ['swift', 'свифт'],
+    'kotlin': ['kotlin', 'котлин'],
+    'sql': ['sql', 'mysql', 'postgresql', 'sqlite'],
+    'html': ['html', 'хтмл'],
+    'css': ['css', 'стили'],
+    'bash': ['bash', 'shell', 'terminal', 'терминал']
+}
+
+# Категория автомата для каждого пресета small talk (в том же порядке)
+SMALL_TALK_CATEGORIES = tuple(f"small_talk:{index}" for index in range(len(SMALL_TALK_PRESETS)))
+
+
+def _categories():
+    """Все таблицы в виде {категория: ключевые слова} для общего автомата"""
+    categories = {category: preset["triggers"] for category, preset in zip(SMALL_TALK_CATEGORIES, SMALL_TALK_PRESETS)}
+    categories["small_talk_question"] = SMALL_TALK_QUESTIONS
+    categories.update((f"tone:{tone}", words) for tone, words in TONE_KEYWORDS)
+    categories["follow_up"] = FOLLOW_UP_KEYWORDS
+    categories.update((f"mode:{mode}", words) for mode, words in MODE_KEYWORDS)
+    categories.update(SHORTCUT_KEYWORDS)
+    categories.update(SETTINGS_KEYWORDS)
+    categories["sensitive"] = SENSITIVE_KEYWORDS
+    categories.update((f"topic:{topic}", words) for topic, words in TOPIC_KEYWORDS)
+    categories["code"] = CODE_INDICATORS
+    categories.update((f"lang:{language}", words) for language, words in PROGRAMMING_LANGUAGES.items())
+    categories["vadzim"] = VADZIM_KEYWORDS
+    return categories
+
+
+# Один проход по тексту в нижнем регистре даёт все совпавшие категории
+MESSAGE_KEYWORDS = KeywordMatcher(_categories())
+
@@ -0,0 +1,147 @@
+"""Pick the Groq model and token budget for a question, with per-route accounting."""
+
+from __future__ import annotations
+
+import re
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from utils import is_code_question
+
+ROUTE_FAST = "fast"
+ROUTE_STANDARD = "standard"
+
+# Modes that need the full model: reading code or reasoning about a system.
+ESCALATED_MODES = frozenset({"analyze_code", "debug_code", "optimize_code", "architecture_advice"})
+
+SHORT_QUESTION_CHARS = 280
+SHORT_QUESTION_LINES = 3
+SHORT_CODE_TOPIC_WORDS = 12
+LATENCY_SAMPLES = 200
+
+# Requests to produce code need the full budget even when the wording is short.
+_CODE_TASK_WORDS = ("напиши", "реализуй", "сгенерируй", "write ", "implement", "generate ")
+
+_CODE_SYNTAX_RE = re.compile(
+    r"```|^\s*(def|class|function|import|from|const|let|var|public|#include)\b|[{};]\s*$|=>|\)\s*:",
+    re.MULTILINE,
+)
+
+
+class Route:
+    __slots__ = ("name", "model", "max_tokens", "reason")
+
+    def __init__(self, name: str, model: str, max_tokens: int, reason: str) -> None:
+        self.name = name
+        self.model = model
+        self.max_tokens = max_tokens
+        self.reason = reason
+
+    def __repr__(self) -> str:
+        return f"Route({self.name!r}, {self.model!r}, max_tokens={self.max_tokens}, reason={self.reason!r})"
+
+
+class _RouteStats:
+    __slots__ = ("calls", "failures", "prompt_tokens", "completion_tokens", "latencies", "reasons")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.failures = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.reasons: Dict[str, int] = {}
+
+
+class ModelRouter:
+    """Send simple questions to a fast model / smaller budget, everything else to the main model.
+
+    A question goes to the fast route only when all of these hold: the detected
+    mode is not one of :data:`ESCALATED_MODES`, it is not a follow-up (those ask
+    for more depth), it contains no code, it is short, and — if
+    :func:`utils.is_code_question` says it is about programming — it is a short
+    conceptual question rather than a task description.  Requests to write
+    code always take the main route.  When ``fast_model`` is empty the main
+    model is used with the fast token budget.
+    """
+
+    def __init__(
+        self,
+        *,
+        model: str,
+        max_tokens: int,
+        fast_model: Optional[str] = None,
+        fast_max_tokens: int = 600,
+    ) -> None:
+        self.standard = (model, int(max_tokens))
+        self.fast = (fast_model or model, int(fast_max_tokens))
+        self._stats: Dict[str, _RouteStats] = {ROUTE_FAST: _RouteStats(), ROUTE_STANDARD: _RouteStats()}
+
+    def route(
+        self,
+        message: str,
+        mode: str = "general",
+        *,
+        follow_up: bool = False,
+        code_question: Optional[bool] = None,
+    ) -> Route:
+        """``code_question`` is the caller's :func:`utils.is_code_question` result, if already known."""
+        reason = self._escalation_reason(message, mode, follow_up, code_question)
+        if reason is None:
+            return Route(ROUTE_FAST, self.fast[0], self.fast[1], "simple")
+        return Route(ROUTE_STANDARD, self.standard[0], self.standard[1], reason)
+
+    def record(self, route: Route, latency: float, usage: Any = None) -> None:
+        stats = self._stats[route.name]
+        stats.calls += 1
+        stats.latencies.append(latency)
+        stats.reasons[route.reason] = stats.reasons.get(route.reason, 0) + 1
+        stats.prompt_tokens += int(getattr(usage, "prompt_tokens", 0) or 0)
+        stats.completion_tokens += int(getattr(usage, "completion_tokens", 0) or 0)
+
+    def record_failure(self, route: Route) -> None:
+        self._stats[route.name].failures += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        result = {}
+        for name, stats in self._stats.items():
+            latencies = sorted(stats.latencies)
+
+            def percentile(fraction: float) -> float:
+                if not latencies:
+                    return 0.0
+                return round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 1)
+
+            model, max_tokens = self.fast if name == ROUTE_FAST else self.standard
+            result[name] = {
+                "model": model,
+                "max_tokens": max_tokens,
+                "calls": stats.calls,
+                "failures": stats.failures,
+                "latency_p50_ms": percentile(0.5),
+                "latency_p95_ms": percentile(0.95),
+                "prompt_tokens": stats.prompt_tokens,
+                "completion_tokens": stats.completion_tokens,
+                "reasons": dict(stats.reasons),
+            }
+        return result
+
+    @staticmethod
+    def _escalation_reason(message: str, mode: str, follow_up: bool, code_question: Optional[bool]) -> Optional[str]:
+        if mode in ESCALATED_MODES:
+            return f"mode:{mode}"
+        if follow_up:
+            return "follow_up"
+        text = message.strip()
+        if _CODE_SYNTAX_RE.search(text):
+            return "code"
+        if len(text) > SHORT_QUESTION_CHARS or text.count("\n") >= SHORT_QUESTION_LINES:
+            return "long"
+        lowered = text.lower()
+        if any(word in lowered for word in _CODE_TASK_WORDS):
+            return "code_task"
+        if code_question is None:
+            code_question = is_code_question(text)
+        if code_question and len(text.split()) > SHORT_CODE_TOPIC_WORDS:
+            return "code_task"
+        return None
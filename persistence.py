@@ -0,0 +1,95 @@
+"""Run blocking storage calls on a dedicated writer thread instead of the event loop."""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Set
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PENDING = 1000
+
+
+class AsyncPersistence:
+    """Serialise storage calls (JSON files, Sheets, SQLite) on one writer thread.
+
+    A single worker keeps mutations in submission order, so a later read issued
+    through :meth:`run` always observes earlier writes.  ``max_pending`` bounds
+    the number of queued jobs: :meth:`submit` returns as soon as a job is queued
+    but waits for a free slot when the writer falls behind, which pushes back on
+    the handlers instead of growing the queue without limit.
+    """
+
+    def __init__(self, max_pending: int = DEFAULT_MAX_PENDING) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="persistence")
+        self._slots = asyncio.Semaphore(max(max_pending, 1))
+        self._pending: Set[asyncio.Future] = set()
+        self._shutdown_hooks: List[Callable[[], Any]] = []
+        self._closed = False
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Execute ``func`` on the writer thread and return its result."""
+        return await (await self._enqueue(func, *args, **kwargs))
+
+    async def submit(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+        """Queue ``func`` without waiting for it (fire-and-forget with backpressure)."""
+        future = await self._enqueue(func, *args, **kwargs)
+        future.add_done_callback(self._log_failure)
+
+    def add_shutdown_hook(self, hook: Callable[[], Any]) -> None:
+        """Register a blocking callable to run on the writer thread at shutdown."""
+        self._shutdown_hooks.append(hook)
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def flush(self) -> None:
+        """Wait until every queued job has finished."""
+        if self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+    async def shutdown(self) -> None:
+        """Drain the queue, run the shutdown hooks and stop the writer thread."""
+        if self._closed:
+            return
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        for hook in self._shutdown_hooks:
+            try:
+                await loop.run_in_executor(self._executor, hook)
+            except Exception as exc:
+                logger.error("Persistence shutdown hook %r failed: %s", hook, exc)
+        self._closed = True
+        self._executor.shutdown(wait=True)
+
+    async def _enqueue(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> asyncio.Future:
+        if self._closed:
+            raise RuntimeError("AsyncPersistence is shut down")
+        await self._slots.acquire()
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        except Exception:
+            self._slots.release()
+            raise
+        self._pending.add(future)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: asyncio.Future) -> None:
+        self._pending.discard(future)
+        self._slots.release()
+
+    @staticmethod
+    def _log_failure(future: asyncio.Future) -> None:
+        if future.cancelled():
+            return
+        exc = future.exception()
+        if exc is not None:
+            logger.error("Persistence job failed: %s", exc, exc_info=exc)
+
+
+persistence = AsyncPersistence()
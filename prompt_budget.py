@@ -0,0 +1,238 @@
+"""Token-aware assembly of Groq chat prompts: history window, deduplication, input budget."""
+
+from __future__ import annotations
+
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Any, Deque, Dict, Iterable, List, Mapping, Optional, Tuple
+
+# Average characters per token for current BPE vocabularies: Latin text and
+# code pack ~4 characters into a token, Cyrillic noticeably fewer.
+LATIN_CHARS_PER_TOKEN = 4.0
+OTHER_CHARS_PER_TOKEN = 3.0
+MESSAGE_OVERHEAD_TOKENS = 4  # role and separators added per chat message
+
+DEFAULT_MAX_INPUT_TOKENS = 3000
+DEFAULT_HISTORY_MESSAGES = 6
+DEFAULT_RECENT_MESSAGES = 2
+DEFAULT_RECENT_MESSAGE_TOKENS = 700
+DEFAULT_OLDER_MESSAGE_TOKENS = 150
+MIN_MESSAGE_TOKENS = 60
+REPORT_SAMPLES = 500
+# The same history messages are re-sent with every request of a conversation, so
+# their estimates and compressed forms are memoized (keyed by the text itself).
+MEMO_SIZE = 2048
+
+CODE_PLACEHOLDER = "[код опущен]"
+_CODE_BLOCK_RE = re.compile(r"```.*?(```|$)", re.DOTALL)
+_WHITESPACE_RE = re.compile(r"[ \t]+")
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def estimate_tokens(text: Optional[str]) -> int:
+    """Local token estimate (no tokenizer download), within ~15% for Russian and English prose."""
+    if not text:
+        return 0
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    other_chars = len(text) - ascii_chars
+    return int(ascii_chars / LATIN_CHARS_PER_TOKEN + other_chars / OTHER_CHARS_PER_TOKEN) + 1
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut ``text`` to about ``max_tokens``, preferring a sentence or line boundary."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # Scale the character limit by the text's own chars-per-token ratio.
+    limit = max(int(len(text) * max_tokens / estimate_tokens(text)), 1)
+    cut = text[:limit]
+    boundary = max(cut.rfind(". "), cut.rfind("\n"), cut.rfind("! "), cut.rfind("? "))
+    if boundary > limit // 2:
+        cut = cut[: boundary + 1]
+    return cut.rstrip() + " …"
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def compress_turn(text: str, max_tokens: int) -> str:
+    """Shorten an older turn: collapse code blocks, squeeze whitespace, then truncate."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    text = _CODE_BLOCK_RE.sub(CODE_PLACEHOLDER, text)
+    text = _WHITESPACE_RE.sub(" ", text)
+    text = re.sub(r"\n{3,}", "\n\n", text).strip()
+    return truncate_to_tokens(text, max_tokens)
+
+
+def _normalize(text: Optional[str]) -> str:
+    return (text or "").strip()
+
+
+class HistoryWindow:
+    """The history messages chosen for one request, with their original texts."""
+
+    __slots__ = ("messages", "sources", "raw_tokens", "compressed")
+
+    def __init__(self) -> None:
+        self.messages: List[Dict[str, str]] = []
+        self.sources: List[str] = []
+        self.raw_tokens = 0
+        self.compressed = 0
+
+    def contains(self, text: Optional[str]) -> bool:
+        """True if ``text`` is one of the messages already sent as history."""
+        normalized = _normalize(text)
+        return bool(normalized) and normalized in self.sources
+
+    def drop_oldest(self) -> None:
+        del self.messages[0]
+        del self.sources[0]
+        # A history that starts with the assistant's reply has lost its question.
+        while self.messages and self.messages[0]["role"] == "assistant":
+            del self.messages[0]
+            del self.sources[0]
+
+
+class PromptReport:
+    """Token accounting for one assembled prompt."""
+
+    __slots__ = (
+        "system_tokens",
+        "history_tokens",
+        "prompt_tokens",
+        "total_tokens",
+        "history_messages",
+        "compressed",
+        "dropped",
+        "saved_tokens",
+    )
+
+    def __init__(self) -> None:
+        self.system_tokens = 0
+        self.history_tokens = 0
+        self.prompt_tokens = 0
+        self.total_tokens = 0
+        self.history_messages = 0
+        self.compressed = 0
+        self.dropped = 0
+        self.saved_tokens = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class PromptBudget:
+    """Build the ``messages`` list for a chat completion within an input-token budget.
+
+    History is the last ``history_messages`` user/assistant turns, minus the
+    current message (the bot records it before calling the model, and it is
+    sent as part of the instruction prompt anyway).  The newest
+    ``recent_messages`` turns are kept up to ``recent_message_tokens`` each;
+    older ones are compressed to ``older_message_tokens`` (code collapsed,
+    text cut at a sentence).  Callers use :meth:`HistoryWindow.contains` to
+    leave out of the instruction prompt what the history already carries.
+    :meth:`assemble` then drops the oldest turns until the total fits
+    ``max_input_tokens`` (the latest exchange is shortened rather than
+    dropped while that leaves it a useful size) and returns a
+    :class:`PromptReport`.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_input_tokens: int = DEFAULT_MAX_INPUT_TOKENS,
+        history_messages: int = DEFAULT_HISTORY_MESSAGES,
+        recent_messages: int = DEFAULT_RECENT_MESSAGES,
+        recent_message_tokens: int = DEFAULT_RECENT_MESSAGE_TOKENS,
+        older_message_tokens: int = DEFAULT_OLDER_MESSAGE_TOKENS,
+    ) -> None:
+        self.max_input_tokens = int(max_input_tokens)
+        self.history_messages = int(history_messages)
+        self.recent_messages = int(recent_messages)
+        self.recent_message_tokens = int(recent_message_tokens)
+        self.older_message_tokens = int(older_message_tokens)
+        self._totals: Deque[int] = deque(maxlen=REPORT_SAMPLES)
+        self._stats = {"requests": 0, "input_tokens": 0, "saved_tokens": 0, "dropped_messages": 0}
+
+    def select_history(self, history: Iterable[Mapping[str, Any]], current_message: str) -> HistoryWindow:
+        entries = [
+            (entry.get("role"), _normalize(entry.get("content")))
+            for entry in history
+            if entry.get("role") in ("user", "assistant") and _normalize(entry.get("content"))
+        ]
+        if entries and entries[-1] == ("user", _normalize(current_message)):
+            entries.pop()
+        entries = entries[-self.history_messages:] if self.history_messages > 0 else []
+
+        window = HistoryWindow()
+        recent_from = len(entries) - self.recent_messages
+        for index, (role, content) in enumerate(entries):
+            window.raw_tokens += estimate_tokens(content)
+            if index >= recent_from:
+                shortened = truncate_to_tokens(content, self.recent_message_tokens)
+            else:
+                shortened = compress_turn(content, self.older_message_tokens)
+            if shortened != content:
+                window.compressed += 1
+            window.messages.append({"role": role, "content": shortened})
+            window.sources.append(content)
+        while window.messages and window.messages[0]["role"] == "assistant":
+            window.drop_oldest()
+        return window
+
+    def assemble(
+        self,
+        system_prompt: str,
+        window: HistoryWindow,
+        prompt: str,
+        *,
+        omitted: Iterable[Optional[str]] = (),
+    ) -> Tuple[List[Dict[str, str]], PromptReport]:
+        """Return the chat messages and their token report; ``omitted`` are deduplicated texts."""
+        report = PromptReport()
+        report.system_tokens = estimate_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+        report.prompt_tokens = estimate_tokens(prompt) + MESSAGE_OVERHEAD_TOKENS
+        report.compressed = window.compressed
+
+        def history_tokens() -> int:
+            return sum(estimate_tokens(item["content"]) + MESSAGE_OVERHEAD_TOKENS for item in window.messages)
+
+        initial_messages = len(window.messages)
+        fixed = report.system_tokens + report.prompt_tokens
+        while window.messages and fixed + history_tokens() > self.max_input_tokens:
+            if len(window.messages) <= self.recent_messages:
+                # Keep the latest exchange, shortened to the remaining budget, rather than losing it.
+                share = (self.max_input_tokens - fixed) // len(window.messages) - MESSAGE_OVERHEAD_TOKENS
+                if share >= MIN_MESSAGE_TOKENS:
+                    for item in window.messages:
+                        item["content"] = truncate_to_tokens(item["content"], share)
+                    break
+            window.drop_oldest()
+        report.dropped = initial_messages - len(window.messages)
+        report.history_tokens = history_tokens()
+        report.history_messages = len(window.messages)
+        report.total_tokens = fixed + report.history_tokens
+        report.saved_tokens = max(window.raw_tokens - report.history_tokens, 0) + sum(
+            estimate_tokens(text) for text in omitted if text
+        )
+
+        messages = [{"role": "system", "content": system_prompt}]
+        messages.extend(window.messages)
+        messages.append({"role": "user", "content": prompt})
+
+        self._stats["requests"] += 1
+        self._stats["input_tokens"] += report.total_tokens
+        self._stats["saved_tokens"] += report.saved_tokens
+        self._stats["dropped_messages"] += report.dropped
+        self._totals.append(report.total_tokens)
+        return messages, report
+
+    def metrics(self) -> Dict[str, Any]:
+        totals = sorted(self._totals)
+        requests = self._stats["requests"]
+        return {
+            "max_input_tokens": self.max_input_tokens,
+            "avg_input_tokens": round(self._stats["input_tokens"] / requests) if requests else 0,
+            "p95_input_tokens": totals[min(len(totals) - 1, int(len(totals) * 0.95))] if totals else 0,
+            **self._stats,
+        }
@@ -0,0 +1,155 @@
+"""
+Реестр шаблонов промптов и быстрых ответов: собирается один раз при импорте
+"""
+
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+# Базовые описания режимов с более естественными формулировками
+MODE_DESCRIPTIONS = {
+    "analyze_code": "Проанализируй этот код",
+    "debug_code": "Найди и исправь ошибки в коде",
+    "explain_concept": "Объясни концепцию",
+    "optimize_code": "Оптимизируй код",
+    "architecture_advice": "Дай советы по архитектуре",
+    "general": "Ответь на вопрос по программированию"
+}
+
+# Персонализация на основе уровня навыков с более живыми формулировками
+LEVEL_ADJUSTMENTS = {
+    "beginner": {
+        "analyze_code": "Проанализируй этот код простыми словами, как будто объясняешь коллеге-новичку. Объясни каждую важную строку.",
+        "debug_code": "Найди ошибки и объясни, почему они возникли и как их исправить. Будь терпеливым и понятным.",
+        "explain_concept": "Объясни концепцию очень простыми словами с базовыми примерами. Представь, что объясняешь другу, который только начинает.",
+        "optimize_code": "Покажи как улучшить код и объясни почему эти изменения лучше. Используй простые аналогии.",
+        "architecture_advice": "Дай простые советы по структуре кода для новичков. Не перегружай терминами.",
+        "general": "Ответь простыми словами, добавь примеры для новичков. Будь терпеливым и понятным."
+    },
+    "intermediate": {
+        "analyze_code": "Проанализируй код как опытный коллега: укажи на паттерны, потенциальные улучшения, лучшие практики и частые ошибки.",
+        "debug_code": "Найди ошибки и предложи несколько способов исправления с объяснением плюсов и минусов каждого. Предложи лучшие практики.",
+        "explain_concept": "Объясни концепцию с практическими примерами и случаями использования. Покажи, где это применяется в реальных проектах и какие есть альтернативы.",
+        "optimize_code": "Оптимизируй код, покажи альтернативные подходы и объясни trade-offs. Предложи несколько вариантов с объяснением когда что использовать.",
+        "architecture_advice": "Дай советы по архитектуре с учетом масштабируемости, поддерживаемости и лучших практик. Покажи примеры.",
+        "general": "Дай подробный ответ с примерами и лучшими практиками. Покажи несколько подходов, если это уместно. Всегда предлагай конкретные следующие шаги."
+    },
+    "advanced": {
+        "analyze_code": "Глубокий анализ как senior-разработчик: архитектура, производительность, безопасность, edge cases, рефакторинг. Будь критичным и конструктивным, предлагай конкретные улучшения.",
+        "debug_code": "Найди ошибки, проанализируй root cause, предложи системные решения и профилактику. Покажи несколько подходов с trade-offs.",
+        "explain_concept": "Детальное объяснение с продвинутыми паттернами, edge cases, альтернативными подходами и реальными примерами из production.",
+        "optimize_code": "Продвинутая оптимизация: алгоритмы, память, производительность, масштабируемость. Покажи trade-offs и когда что использовать.",
+        "architecture_advice": "Экспертные советы по enterprise архитектуре, паттернам, anti-patterns и масштабированию. Дай практические рекомендации.",
+        "general": "Экспертный ответ с глубоким техническим анализом. Можешь быть более кратким и техничным, но всегда с практическими примерами."
+    }
+}
+
+# Быстрые ответы
+_BASE_QUICK_RESPONSES = {
+    'привет': """👋 Привет! Я Помощник Программиста
+🚀 Создан Вадимом (vadzim.by)
+
+💻 Помогу с:
+• Анализом и отладкой кода
+• Объяснением концепций программирования
+• Оптимизацией и архитектурой приложений
+• Решением проблем и ошибок
+• Персональным обучением программированию
+
+🎯 Я адаптируюсь под ваш уровень и стиль обучения!
+📊 Используйте кнопки для обратной связи - это помогает мне становиться лучше
+
+📝 Просто напишите свой вопрос или код!
+
+⚡ Быстрые команды:
+/help - Получить справку
+/settings - Настроить предпочтения
+/about - О создателе
+
+👇 Также можете воспользоваться кнопками ниже:""",
+    'hello': "Hello! 👋 I'm Programming Assistant. Created by Vadim (vadzim.by)",
+    'hi': "Hi there! 👋 Programming Assistant here!",
+    'здравствуй': "Здравствуй! 👋 Помощник Программиста к вашим услугам!",
+    'как дела': "Всё отлично! 😊 Готов помочь с программированием!",
+    'how are you': "I'm great! 😊 Ready to help with programming!",
+    'сайт': "👨‍💻 Создатель: Вадим\n🌐 Сайт: vadzim.by\n🚀 Специализация: разработка сайтов и Telegram ботов",
+    'вадим': "👨‍💻 Создатель: Вадим\n🌐 Сайт: vadzim.by\n💻 Стек: Python, JavaScript, Django, React",
+    'vadzim': "👨‍💻 Creator: Vadzim\n🌐 Website: vadzim.by\n💻 Tech stack: Python, JavaScript, Django, React",
+    'кто тебя создал': "Меня создал Вадим (vadzim.by) - full-stack разработчик из Беларуси 🚀",
+    'who created you': "I was created by Vadzim (vadzim.by) - full-stack developer from Belarus 🚀"
+}
+
+# Персонализация на основе уровня навыков
+_LEVEL_QUICK_RESPONSES = {
+    "beginner": {
+        'помощь': "🎯 Для новичков рекомендую начать с Python! Хотите пошаговый план обучения?",
+        'help': "🎯 For beginners, I recommend starting with Python! Want a step-by-step learning plan?",
+    },
+    "intermediate": {
+        'помощь': "💪 Отлично! Готов помочь с более сложными задачами. Какой проект разрабатываете?",
+        'help': "💪 Great! Ready to help with more complex tasks. What project are you working on?",
+    },
+    "advanced": {
+        'помощь': "🚀 Эксперт в деле! Готов обсудить архитектуру, оптимизацию и лучшие практики.",
+        'help': "🚀 Expert level! Ready to discuss architecture, optimization and best practices.",
+    },
+}
+
+TONE_CONTEXT = {
+    "frustrated": " Пользователь расстроен и раздражён — будь особенно терпеливым и поддерживающим.",
+    "confused": " Пользователь запутался — объясняй максимально просто и пошагово.",
+    "excited": " Пользователь вдохновлён — поддерживай энтузиазм и предлагай интересные идеи.",
+    "negative": " Пользователь столкнулся с проблемой — будь поддерживающим и конструктивным.",
+}
+
+STYLE_SUFFIX = {
+    "detailed": " Дай максимально подробное объяснение с примерами.",
+    "concise": " Будь кратким и по делу, без лишней воды.",
+}
+
+FOLLOW_UP_SUFFIX = " Пользователь уже получил базовый ответ, так что добавь глубины: продвинутые примеры, лучшие практики, частые ошибки и ресурсы для самостоятельного изучения."
+
+ANSWER_RULES = (
+    " Предлагай конкретные следующие шаги, добавляй ссылки на документацию, форматируй код в ```язык``` и не повторяй предыдущие объяснения слово в слово."
+    " Избегай markdown таблиц, предпочитай короткие абзацы или списки, держи ответ в пределах 1200 символов, если только код не требует больше места."
+)
+
+VADZIM_KEYWORDS = ("telegram", "бот", "боты", "python", "javascript", "django", "react", "создател", "вадим", "vadzim")
+VADZIM_CONTEXT = " Если уместно, можешь упомянуть, что создатель бота Вадим (vadzim.by, @vadzim_belarus) специализируется на Python, JavaScript и Telegram-ботах. Но делай это естественно, только когда это релевантно."
+
+FOLLOW_UP_SECTION = "Пользователь уже получил базовый ответ ранее. Предоставь более глубокое продолжение: добавь продвинутые примеры, выдели лучшие практики, предупреди о частых ошибках и предложи ресурсы для дальнейшего изучения."
+CLOSING = "\n\nВажно: Дай ответ, которым бы гордился senior-разработчик. Будь конкретным, практичным и полезным. Предложи новые идеи, чтобы пользователь продвинулся дальше."
+
+
+@lru_cache(maxsize=1024)
+def instruction_head(
+    mode: str,
+    skill_level: str,
+    language: str = "",
+    follow_up: bool = False,
+    style: str = "",
+    tone: Optional[str] = None,
+) -> str:
+    """Неизменная часть задания для модели до имени пользователя (мемоизируется по ключу)"""
+    task = LEVEL_ADJUSTMENTS.get(skill_level, {}).get(mode, MODE_DESCRIPTIONS.get(mode, MODE_DESCRIPTIONS["general"]))
+    if language:
+        task += f" Если возможно, используй примеры на {language}."
+    if follow_up:
+        task += FOLLOW_UP_SUFFIX
+    task += STYLE_SUFFIX.get(style, "")
+    task += TONE_CONTEXT.get(tone, "") if tone else ""
+    return task
+
+
+def _build_quick_responses(skill_level: str) -> Mapping[str, str]:
+    responses = dict(_BASE_QUICK_RESPONSES)
+    responses.update(_LEVEL_QUICK_RESPONSES.get(skill_level, {}))
+    return MappingProxyType(responses)
+
+
+# Быстрые ответы для каждого уровня (неизменяемые словари, общие для всех запросов)
+QUICK_RESPONSES = {level: _build_quick_responses(level) for level in (*_LEVEL_QUICK_RESPONSES, "")}
+
+
+def quick_responses(skill_level: str) -> Mapping[str, str]:
+    return QUICK_RESPONSES.get(skill_level) or QUICK_RESPONSES[""]
@@ -0,0 +1,238 @@
+"""Compact in-memory record types with dict-compatible accessors."""
+
+from __future__ import annotations
+
+import sys
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Field kinds: how a dict value is stored in a slot and converted back.
+_PLAIN = 0      # stored as-is
+_INTERNED = 1   # low-cardinality string, shared via sys.intern
+_EPOCH = 2      # ISO timestamp stored as epoch seconds (int)
+_TOPICS = 3     # list of strings stored as a tuple of interned strings
+_INTS = 4       # list of ints stored as a tuple
+
+_MISSING = object()
+
+
+def to_epoch(value: Any) -> Optional[int]:
+    """Convert an ISO string (or number) to epoch seconds; None when missing or invalid."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    try:
+        return int(datetime.fromisoformat(str(value)).timestamp())
+    except ValueError:
+        return None
+
+
+def epoch_to_iso(value: Optional[int]) -> Optional[str]:
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value).isoformat()
+
+
+class CompactRecord:
+    """Base for slotted records that behave like the dicts they replace.
+
+    Subclasses declare ``_FIELDS`` as ``(dict_key, slot_name, kind, default)``.
+    Keys outside the schema (e.g. ad-hoc ``update_user`` payloads) live in a
+    lazily created ``_extra`` dict so no information is lost.
+    """
+
+    __slots__ = ("_extra",)
+    _FIELDS: Tuple[Tuple[str, str, int, Any], ...] = ()
+    _BY_KEY: Dict[str, Tuple[str, int]] = {}
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._BY_KEY = {key: (slot, kind) for key, slot, kind, _ in cls._FIELDS}
+
+    def __init__(self, **values: Any) -> None:
+        self._extra: Optional[Dict[str, Any]] = None
+        for key, slot, kind, default in self._FIELDS:
+            object.__setattr__(self, slot, self._encode(kind, values.pop(key, default)))
+        if values:
+            self._extra = dict(values)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]):
+        return cls(**dict(data))
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {key: self._decode(kind, getattr(self, slot)) for key, slot, kind, _ in self._FIELDS}
+        if self._extra:
+            result.update(self._extra)
+        return result
+
+    # ------------------------------------------------------------------ #
+    # Conversion helpers
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def _encode(kind: int, value: Any) -> Any:
+        if kind == _INTERNED:
+            return sys.intern(value) if isinstance(value, str) else value
+        if kind == _EPOCH:
+            return to_epoch(value)
+        if kind == _TOPICS:
+            return tuple(sys.intern(str(item)) for item in (value or ()))
+        if kind == _INTS:
+            return tuple(int(item) for item in (value or ()))
+        return value
+
+    @staticmethod
+    def _decode(kind: int, value: Any) -> Any:
+        if kind == _EPOCH:
+            return epoch_to_iso(value)
+        if kind in (_TOPICS, _INTS):
+            return list(value)
+        return value
+
+    # ------------------------------------------------------------------ #
+    # Mapping protocol
+    # ------------------------------------------------------------------ #
+    def __getitem__(self, key: str) -> Any:
+        field = self._BY_KEY.get(key)
+        if field is not None:
+            return self._decode(field[1], getattr(self, field[0]))
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        field = self._BY_KEY.get(key)
+        if field is not None:
+            object.__setattr__(self, field[0], self._encode(field[1], value))
+            return
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._BY_KEY or (self._extra is not None and key in self._extra)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self._FIELDS) + (len(self._extra) if self._extra else 0)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, CompactRecord):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            self[key] = default
+            return default
+        return value
+
+    def update(self, values: Dict[str, Any] = None, **kwargs: Any) -> None:
+        for source in (values or {}, kwargs):
+            for key, value in source.items():
+                self[key] = value
+
+    def keys(self) -> List[str]:
+        keys = [key for key, _, _, _ in self._FIELDS]
+        if self._extra:
+            keys.extend(self._extra)
+        return keys
+
+    def values(self) -> List[Any]:
+        return [self[key] for key in self.keys()]
+
+    def items(self) -> List[Tuple[str, Any]]:
+        return [(key, self[key]) for key in self.keys()]
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class UserRecord(CompactRecord):
+    """A ``UserDatabase`` entry; about half the memory of the equivalent dict."""
+
+    __slots__ = (
+        "user_id",
+        "username",
+        "first_name",
+        "preferred_language",
+        "skill_level",
+        "total_questions",
+        "topics",
+        "created_ts",
+        "last_active_ts",
+    )
+    _FIELDS = (
+        ("user_id", "user_id", _PLAIN, None),
+        ("username", "username", _PLAIN, None),
+        ("first_name", "first_name", _PLAIN, None),
+        ("preferred_language", "preferred_language", _INTERNED, None),
+        ("skill_level", "skill_level", _INTERNED, "intermediate"),
+        ("total_questions", "total_questions", _PLAIN, 0),
+        ("favorite_topics", "topics", _TOPICS, ()),
+        ("created_at", "created_ts", _EPOCH, None),
+        ("last_active", "last_active_ts", _EPOCH, None),
+    )
+
+    def add_topic(self, topic: str, keep: int) -> bool:
+        """Append ``topic`` if new, keeping only the last ``keep`` topics."""
+        if topic in self.topics:
+            return False
+        self.topics = (self.topics + (sys.intern(topic),))[-keep:]
+        return True
+
+
+class ProgressRecord(CompactRecord):
+    """A ``UserProgressManager`` entry."""
+
+    __slots__ = (
+        "current_lesson",
+        "completed",
+        "started_ts",
+        "last_activity_ts",
+        "total_lessons_requested",
+        "last_lesson_ts",
+    )
+    _FIELDS = (
+        ("current_lesson", "current_lesson", _PLAIN, 0),
+        ("completed_lessons", "completed", _INTS, ()),
+        ("started_at", "started_ts", _EPOCH, None),
+        ("last_activity", "last_activity_ts", _EPOCH, None),
+        ("total_lessons_requested", "total_lessons_requested", _PLAIN, 0),
+        ("last_lesson_time", "last_lesson_ts", _EPOCH, None),
+    )
+
+    def mark_completed(self, lesson_index: int) -> None:
+        if lesson_index not in self.completed:
+            self.completed = self.completed + (int(lesson_index),)
+
+
+def records_from_mapping(cls, data: Dict[Any, Dict[str, Any]]) -> Dict[int, Any]:
+    """Convert a JSON-style ``{"123": {...}}`` mapping into ``{123: Record}``."""
+    converted: Dict[int, Any] = {}
+    for key, value in data.items():
+        try:
+            user_id = int(key)
+        except (TypeError, ValueError):
+            continue
+        converted[user_id] = value if isinstance(value, cls) else cls.from_dict(value)
+    return converted
+
+
+def records_to_mapping(data: Iterable[Tuple[int, CompactRecord]]) -> Dict[str, Dict[str, Any]]:
+    """Inverse of :func:`records_from_mapping`, used for snapshots."""
+    return {str(key): record.to_dict() for key, record in data}
@@ -0,0 +1,323 @@
+"""Retry, circuit breaking and request hedging for outbound API calls."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+_RETRYABLE_NAMES = frozenset({"APIConnectionError", "APITimeoutError"})
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+LATENCY_SAMPLES = 200
+MIN_HEDGE_SAMPLES = 20
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Timeouts, connection failures, 429 and 5xx are worth retrying; other errors are not."""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    return any(cls.__name__ in _RETRYABLE_NAMES for cls in type(error).__mro__)
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Delay requested by the server via ``retry-after-ms`` / ``Retry-After``, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        value = headers.get("retry-after-ms")
+        if value:
+            return max(float(value) / 1000.0, 0.0)
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+class RetryPolicy:
+    """Jittered exponential backoff ("full jitter") bounded by a total time budget.
+
+    Every attempt gets at most ``attempt_timeout`` seconds and never more than
+    what is left of ``max_elapsed``, so the whole call, retries included, ends
+    within ``max_elapsed``; a retry is not started with less than
+    ``min_attempt`` seconds left.  Callers with their own deadline set
+    ``max_elapsed`` below it.
+    """
+
+    def __init__(
+        self,
+        *,
+        attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        max_elapsed: float = 25.0,
+        attempt_timeout: float = 20.0,
+        min_attempt: float = 1.0,
+        rng: Callable[[], float] = random.random,
+    ) -> None:
+        self.attempts = max(int(attempts), 1)
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self.max_elapsed = float(max_elapsed)
+        self.attempt_timeout = float(attempt_timeout)
+        self.min_attempt = float(min_attempt)
+        self._rng = rng
+
+    def delay(self, retry_number: int, error: BaseException) -> float:
+        requested = retry_after_seconds(error)
+        if requested is not None:
+            return requested
+        return self._rng() * min(self.max_delay, self.base_delay * (2 ** retry_number))
+
+
+class CircuitBreaker:
+    """Error-rate circuit breaker over a sliding time window.
+
+    The circuit opens when at least ``min_calls`` outcomes were recorded in the
+    last ``window`` seconds and the share of failures reaches
+    ``failure_ratio``.  While open, :meth:`allow` refuses calls for
+    ``open_seconds``; afterwards a single probe is let through (half-open) and
+    its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(
+        self,
+        *,
+        failure_ratio: float = 0.5,
+        min_calls: int = 5,
+        window: float = 60.0,
+        open_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_ratio = float(failure_ratio)
+        self.min_calls = max(int(min_calls), 1)
+        self.window = float(window)
+        self.open_seconds = float(open_seconds)
+        self._clock = clock
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self) -> bool:
+        if self._state == STATE_CLOSED:
+            return True
+        if self._state == STATE_OPEN:
+            if self._clock() - self._opened_at < self.open_seconds:
+                return False
+            self._state = STATE_HALF_OPEN
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        if self._state == STATE_HALF_OPEN:
+            logger.info("Circuit closed after a successful probe")
+            self._state = STATE_CLOSED
+            self._probe_in_flight = False
+            self._outcomes.clear()
+            return
+        self._record(True)
+
+    def record_failure(self) -> None:
+        if self._state == STATE_HALF_OPEN:
+            self._open()
+            return
+        self._record(False)
+        if self._state == STATE_CLOSED and self._tripped():
+            self._open()
+
+    def _record(self, ok: bool) -> None:
+        now = self._clock()
+        self._outcomes.append((now, ok))
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def _tripped(self) -> bool:
+        if len(self._outcomes) < self.min_calls:
+            return False
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        return failures / len(self._outcomes) >= self.failure_ratio
+
+    def _open(self) -> None:
+        logger.warning("Circuit opened for %.0fs", self.open_seconds)
+        self._state = STATE_OPEN
+        self._opened_at = self._clock()
+        self._probe_in_flight = False
+        self.opened += 1
+
+
+class ResilientCaller:
+    """Run an async call with retries, a circuit breaker and optional hedging.
+
+    ``call`` raises :class:`CircuitOpenError` immediately while the breaker is
+    open.  Otherwise it awaits ``factory()`` within the attempt timeout of
+    :class:`RetryPolicy`; retryable errors (see :func:`is_retryable`,
+    timeouts included) are retried with its backoff, honouring
+    ``Retry-After``, as long as the total time budget allows and the optional
+    ``retry_if`` predicate agrees.  The breaker sees the outcome of every
+    attempt: only retryable errors count as failures, because a 400 still
+    means the server is up, and a call cancelled by its caller's deadline
+    counts as one too.
+
+    With ``hedge_percentile`` set, a call still running after that percentile
+    of recent latencies gets a second identical request; the first success
+    wins and the other is cancelled.  ``hedge_allowed`` is consulted before
+    launching the hedge so spare capacity is not taken from queued requests.
+    ``sleep`` and ``clock`` are injectable for tests.
+    """
+
+    def __init__(
+        self,
+        *,
+        policy: Optional[RetryPolicy] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        hedge_percentile: Optional[float] = None,
+        hedge_allowed: Callable[[], bool] = lambda: True,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.policy = policy or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker(clock=clock)
+        self.hedge_percentile = hedge_percentile
+        self._hedge_allowed = hedge_allowed
+        self._sleep = sleep
+        self._clock = clock
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self._stats = {
+            "calls": 0,
+            "retries": 0,
+            "failures": 0,
+            "short_circuited": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+        }
+
+    async def call(
+        self,
+        factory: Callable[[], Awaitable[Any]],
+        *,
+        hedge: bool = True,
+        retry_if: Optional[Callable[[], bool]] = None,
+        attempt_timeout: Optional[float] = None,
+    ) -> Any:
+        """Return the result of ``factory()``; ``attempt_timeout`` overrides the policy's for this call."""
+        if not self.breaker.allow():
+            self._stats["short_circuited"] += 1
+            raise CircuitOpenError("circuit breaker is open")
+        self._stats["calls"] += 1
+        per_attempt = self.policy.attempt_timeout if attempt_timeout is None else float(attempt_timeout)
+        deadline = self._clock() + self.policy.max_elapsed
+        attempt = 0
+        while True:
+            started = self._clock()
+            timeout = min(per_attempt, deadline - started)
+            try:
+                if hedge and self.hedge_percentile is not None:
+                    result = await asyncio.wait_for(self._hedged(factory), timeout)
+                else:
+                    result = await asyncio.wait_for(factory(), timeout)
+            except asyncio.CancelledError:
+                # Only the caller's deadline cancels a call: it took too long, which is a failure
+                self.breaker.record_failure()
+                raise
+            except Exception as error:
+                retryable = is_retryable(error)
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                attempt += 1
+                delay = self.policy.delay(attempt - 1, error) if retryable else 0.0
+                if (
+                    not retryable
+                    or attempt >= self.policy.attempts
+                    or self.breaker.state != STATE_CLOSED
+                    or deadline - (self._clock() + delay) < self.policy.min_attempt
+                    or (retry_if is not None and not retry_if())
+                ):
+                    self._stats["failures"] += 1
+                    raise
+                self._stats["retries"] += 1
+                logger.info("Retrying after %s (attempt %d, delay %.2fs)", type(error).__name__, attempt + 1, delay)
+                await self._sleep(delay)
+                continue
+            self.breaker.record_success()
+            self._latencies.append(self._clock() - started)
+            return result
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "breaker_state": self.breaker.state,
+            "breaker_opened": self.breaker.opened,
+            "hedge_delay_ms": round(self._hedge_delay() * 1000, 1) if self._hedge_delay() is not None else None,
+            **self._stats,
+        }
+
+    # ------------------------------------------------------------------ #
+    # Hedging
+    # ------------------------------------------------------------------ #
+    def _hedge_delay(self) -> Optional[float]:
+        if self.hedge_percentile is None or len(self._latencies) < MIN_HEDGE_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile))]
+
+    async def _hedged(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        delay = self._hedge_delay()
+        if delay is None:
+            return await factory()
+        first = asyncio.ensure_future(factory())
+        pending = {first}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return first.result()
+            if not self._hedge_allowed():
+                return await first
+            self._stats["hedges"] += 1
+            second = asyncio.ensure_future(factory())
+            pending = {first, second}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self._stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            assert error is not None
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
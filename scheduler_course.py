@@ -12,9 +12,14 @@ from typing import Dict, List, Optional
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 from dotenv import load_dotenv
-from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ExtBot
 from telegram.error import TelegramError
 
+from persistence import persistence
+from send_queue import send_queue
+from sqlite_store import get_default_store
+
 # Загружаем переменные окружения
 load_dotenv()
 
@@ -915,13 +920,17 @@ class CourseScheduler:
     """Планировщик курса"""
     
     def __init__(self):
-        self.bot = Bot(token=BOT_TOKEN) if BOT_TOKEN else None
+        # Тот же токен, что у основного бота, поэтому и очередь отправки с её лимитами общая
+        self.bot = ExtBot(token=BOT_TOKEN, rate_limiter=send_queue) if BOT_TOKEN else None
         self.scheduler = AsyncIOScheduler(timezone=TZ)
         self.current_index = self.load_index()
         
     def load_index(self) -> int:
         """Загрузить текущий индекс урока"""
         try:
+            store = get_default_store()
+            if store is not None:
+                return int(store.get_state('lesson_index', 0))
             if os.path.exists(STATE_FILE):
                 with open(STATE_FILE, 'r', encoding='utf-8') as f:
                     data = json.load(f)
@@ -935,6 +944,11 @@ class CourseScheduler:
         """Сохранить текущий индекс урока"""
         try:
             data = {'lesson_index': index, 'last_updated': datetime.now().isoformat()}
+            store = get_default_store()
+            if store is not None:
+                store.set_state('lesson_index', index)
+                store.set_state('last_updated', data['last_updated'])
+                return
             with open(STATE_FILE, 'w', encoding='utf-8') as f:
                 json.dump(data, f, ensure_ascii=False, indent=2)
         except Exception as e:
@@ -1033,7 +1047,7 @@ class CourseScheduler:
             
             # Обновляем индекс и сохраняем
             self.current_index += 1
-            self.save_index(self.current_index)
+            await persistence.submit(self.save_index, self.current_index)
             
         except Exception as e:
             logger.error(f"❌ Ошибка публикации урока: {e}")
@@ -0,0 +1,140 @@
+"""Replay a message log and compare cache hit rates: raw md5 keys vs. build_cache_key.
+
+Run: python scripts/bench_cache_keys.py [--log messages.tsv] [--messages 5000]
+
+A log line is either ``<skill_level>\\t<message>`` or just ``<message>``
+(skill level "beginner").  Without ``--log`` a synthetic log is generated from
+typical course questions with realistic wording noise.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import random
+import sys
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+# Ensure project root is on sys.path
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from cache_keys import build_cache_key  # noqa: E402
+
+QUESTIONS = (
+    "Что такое замыкание?",
+    "Чем отличается список от кортежа?",
+    "Как работает async await в Python?",
+    "Что такое декоратор?",
+    "Как подключить CSS к HTML?",
+    "Зачем нужен git rebase?",
+    "Что такое REST API?",
+    "Как работает flexbox?",
+    "Что такое промис в JavaScript?",
+    "Как написать цикл for в Python?",
+    "Чем let отличается от var?",
+    "Что такое ООП?",
+    "Как создать виртуальное окружение?",
+    "Что такое рекурсия?",
+    "Как объединить два словаря в Python?",
+    "Зачем нужен Docker?",
+    "Что такое SQL JOIN?",
+    "Как работает event loop?",
+    "Что выбрать: Django или FastAPI?",
+    "Объясни, что такое абстракция",
+)
+LEVELS = ("beginner", "beginner", "beginner", "intermediate", "advanced")
+LOOKALIKES = {"о": "o", "а": "a", "е": "e", "с": "c", "р": "p"}
+
+
+def _noisy(question: str, rng: random.Random) -> str:
+    text = question
+    if rng.random() < 0.4:
+        text = text.lower()
+    if rng.random() < 0.3:
+        text = text.rstrip("?")
+    if rng.random() < 0.15:
+        text = text.rstrip("?") + "??"
+    if rng.random() < 0.2:
+        text = "  " + text.replace(" ", "  ", 1) + " "
+    if rng.random() < 0.2:
+        text = text.replace("е", "ё", 1) if "ё" not in text else text.replace("ё", "е")
+    if rng.random() < 0.1:
+        for cyrillic, latin in LOOKALIKES.items():
+            if cyrillic in text:
+                text = text.replace(cyrillic, latin, 1)
+                break
+    if rng.random() < 0.1:
+        text = text.rstrip("?") + "!"
+    return text
+
+
+def synthetic_log(count: int, seed: int) -> List[Tuple[str, str]]:
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(len(QUESTIONS))]  # Zipf-like popularity
+    return [
+        (rng.choice(LEVELS), _noisy(rng.choices(QUESTIONS, weights)[0], rng))
+        for _ in range(count)
+    ]
+
+
+def load_log(path: Path) -> List[Tuple[str, str]]:
+    entries = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        level, sep, message = line.partition("\t")
+        entries.append((level, message) if sep else ("beginner", line))
+    return entries
+
+
+def replay(entries: Iterable[Tuple[str, str]], use_new_keys: bool) -> dict:
+    cache = {}
+    hits = wrong_level = uncacheable = total = 0
+    for level, message in entries:
+        total += 1
+        if use_new_keys:
+            key = build_cache_key(message, level, {})
+        else:
+            key = hashlib.md5(message.encode()).hexdigest()
+        if key is None:
+            uncacheable += 1
+            continue
+        cached_level = cache.get(key)
+        if cached_level is not None:
+            hits += 1
+            if cached_level != level:
+                wrong_level += 1
+        else:
+            cache[key] = level
+    return {
+        "total": total,
+        "hits": hits,
+        "hit_rate": hits / total if total else 0.0,
+        "wrong_level_hits": wrong_level,
+        "uncacheable": uncacheable,
+        "distinct_keys": len(cache),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--log", help="message log to replay (TSV: skill_level<TAB>message)")
+    parser.add_argument("--messages", type=int, default=5000, help="synthetic log size")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    entries = load_log(Path(args.log)) if args.log else synthetic_log(args.messages, args.seed)
+    for label, use_new_keys in (("md5(raw text) (before)", False), ("build_cache_key (after)", True)):
+        result = replay(entries, use_new_keys)
+        print(
+            f"{label:26s} hit rate {result['hit_rate']:6.1%} ({result['hits']}/{result['total']}), "
+            f"wrong-level hits {result['wrong_level_hits']}, uncacheable {result['uncacheable']}, "
+            f"keys {result['distinct_keys']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Measure event-loop lag caused by progress writes, inline vs. via AsyncPersistence.
+
+Run: python scripts/bench_event_loop_lag.py --users 20000 --messages 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Ensure project root is on sys.path
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+os.environ.pop("STORAGE_BACKEND", None)  # benchmark the JSON file path
+
+from persistence import AsyncPersistence  # noqa: E402
+from records import ProgressRecord  # noqa: E402
+from user_progress import UserProgressManager  # noqa: E402
+
+TICK = 0.005
+
+
+async def _monitor(samples: list, stop: asyncio.Event) -> None:
+    """Record how late each TICK-second sleep wakes up."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(TICK)
+        samples.append(max(0.0, loop.time() - started - TICK))
+
+
+async def _scenario(manager: UserProgressManager, messages: int, use_writer: bool) -> dict:
+    samples: list = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(_monitor(samples, stop))
+    writer = AsyncPersistence() if use_writer else None
+
+    started = time.perf_counter()
+    for index in range(messages):
+        if writer is not None:
+            await writer.submit(manager.update_user_progress, index, index % 10)
+        else:
+            manager.update_user_progress(index, index % 10)
+        await asyncio.sleep(0)  # other updates get a turn between messages
+    handler_time = time.perf_counter() - started
+    if writer is not None:
+        await writer.shutdown()
+
+    stop.set()
+    await monitor
+    samples.sort()
+    return {
+        "handler_ms_per_msg": handler_time / messages * 1000,
+        "lag_p50_ms": statistics.median(samples) * 1000 if samples else 0.0,
+        "lag_p99_ms": samples[int(len(samples) * 0.99) - 1] * 1000 if samples else 0.0,
+        "lag_max_ms": samples[-1] * 1000 if samples else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20000, help="users pre-populated in the progress file")
+    parser.add_argument("--messages", type=int, default=200, help="progress updates to issue")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = UserProgressManager(os.path.join(tmp, "progress.json"))
+        for user_id in range(args.users):
+            manager.progress_data[user_id] = ProgressRecord(
+                started_at="2025-01-01T00:00:00",
+                last_activity="2025-01-01T00:00:00",
+            )
+
+        for label, use_writer in (("inline (before)", False), ("AsyncPersistence (after)", True)):
+            result = asyncio.run(_scenario(manager, args.messages, use_writer))
+            print(
+                f"{label:26s} handler {result['handler_ms_per_msg']:8.2f} ms/msg | "
+                f"loop lag p50 {result['lag_p50_ms']:7.2f} ms, p99 {result['lag_p99_ms']:7.2f} ms, "
+                f"max {result['lag_max_ms']:7.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Compare per-table substring scans with the single-pass keyword automaton.
+
+Run: python scripts/bench_keyword_matcher.py [--repeat 300] [--length 4000]
+
+Every message is checked against all keyword tables of ``message_keywords``
+twice: with one ``any(keyword in text ...)`` scan per table (what the
+handlers did before) and with one ``MESSAGE_KEYWORDS.find`` pass.  Both must
+report the same categories.  Prints the best-of-five microseconds per message
+for long messages (Telegram's 4000-character cut) and for short questions.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+# Ensure project root is on sys.path
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from message_keywords import MESSAGE_KEYWORDS  # noqa: E402
+
+SAMPLES = {
+    "prose_ru": "Расскажите, пожалуйста, как устроена память в современных процессорах и зачем нужны кэши. ",
+    "code_ru": (
+        "Помогите разобраться: функция считает среднее по списку, но падает на пустом списке.\n"
+        "```python\ndef average(items):\n    return sum(items) / len(items)\n```\n"
+    ),
+    "mixed_en": "My React app fails to build after the upgrade, traceback below. Any idea what is wrong? ",
+}
+SHORT = ("что такое замыкание?", "как дела?", "объясни этот код", "напиши функцию сортировки на python")
+
+
+def per_table(text: str) -> frozenset:
+    return frozenset(
+        name for name, keywords in MESSAGE_KEYWORDS.categories.items() if any(keyword in text for keyword in keywords)
+    )
+
+
+def best_us(func, texts, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for text in texts:
+                func(text)
+        best = min(best, (time.perf_counter() - started) / (repeat * len(texts)))
+    return best * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=300)
+    parser.add_argument("--length", type=int, default=4000)
+    args = parser.parse_args()
+
+    keywords = sum(len(words) for words in MESSAGE_KEYWORDS.categories.values())
+    print(f"{len(MESSAGE_KEYWORDS.categories)} categories, {keywords} keywords")
+    cases = {name: [(sample * (args.length // len(sample) + 1))[: args.length].lower()] for name, sample in SAMPLES.items()}
+    cases["short"] = list(SHORT)
+    for name, texts in cases.items():
+        for text in texts:
+            assert per_table(text) == MESSAGE_KEYWORDS.find(text), text[:60]
+        scans = best_us(per_table, texts, args.repeat)
+        single = best_us(MESSAGE_KEYWORDS.find, texts, args.repeat)
+        print(f"  {name:10s} per-table scans {scans:8.1f} us   one pass {single:8.1f} us   x{scans / single:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Time the per-message work done before a request reaches Groq.
+
+Run: python scripts/bench_prompt_path.py [--messages 20000]
+
+Replays a mix of questions through the steps ``get_specialized_response``
+performs before calling the API: the one-off ``MessageAnalysis``, small-talk
+matching, the personalized quick responses lookup, the personalized prompt,
+history selection within the token budget and model routing.  Reports
+microseconds per message and per step.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+# Ensure project root is on sys.path
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+# config.py requires these; the benchmark never talks to Telegram or Groq.
+for _name in ("TELEGRAM_TOKEN", "GROQ_API_KEY", "HUGGING_FACE_TOKEN"):
+    os.environ.setdefault(_name, "bench")
+
+from config import SYSTEM_PROMPT  # noqa: E402
+from enhanced_ai_handler import EnhancedAIHandler  # noqa: E402
+from message_analysis import MessageAnalysis  # noqa: E402
+
+MESSAGES = (
+    "Что такое замыкание в Python?",
+    "Объясни, как работает event loop",
+    "Оптимизируй мой цикл, он слишком медленный",
+    "Почему у меня ошибка KeyError в словаре?",
+    "Какую архитектуру выбрать для Telegram-бота?",
+    "Проанализируй функцию сортировки",
+    "Чем отличается list от tuple?",
+    "Расскажи подробнее",
+)
+MODES = ("general", "explain_concept", "optimize_code", "debug_code", "architecture_advice", "analyze_code")
+LEVELS = ("beginner", "intermediate", "advanced")
+STYLES = ("", "detailed", "concise")
+TONES = (None, "frustrated", "confused", "excited")
+ANSWER = "Замыкание — это функция, которая запоминает переменные окружения. " * 12
+
+
+def run(handler: EnhancedAIHandler, count: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    steps = {"analysis": 0.0, "small_talk": 0.0, "quick_responses": 0.0, "prompt": 0.0, "budget": 0.0, "route": 0.0}
+    history = []
+    for question in MESSAGES[:3]:
+        history += [{"role": "user", "content": question}, {"role": "assistant", "content": ANSWER}]
+
+    started = time.perf_counter()
+    for _ in range(count):
+        message = rng.choice(MESSAGES)
+        mode, level = rng.choice(MODES), rng.choice(LEVELS)
+        preferences = {"explanation_style": rng.choice(STYLES), "language": rng.choice(("", "python"))}
+
+        ta = time.perf_counter()
+        analysis = MessageAnalysis(message)
+        t0 = time.perf_counter()
+        handler._match_small_talk(analysis.lower, analysis.matched)
+        t1 = time.perf_counter()
+        quick = handler._get_personalized_quick_responses(level, preferences)
+        _ = analysis.lower in quick
+        t2 = time.perf_counter()
+        prompt = handler._build_personalized_prompt(
+            message,
+            mode,
+            level,
+            preferences,
+            follow_up=message == "Расскажи подробнее",
+            base_question=MESSAGES[2],
+            previous_answer=ANSWER,
+            user_tone=rng.choice(TONES),
+            user_name="Анна",
+            analysis=analysis,
+        )
+        t3 = time.perf_counter()
+        window = handler.prompt_budget.select_history(history + [{"role": "user", "content": message}], message)
+        handler.prompt_budget.assemble(SYSTEM_PROMPT, window, prompt)
+        t4 = time.perf_counter()
+        handler.model_router.route(message, mode, code_question=analysis.is_code_question)
+        t5 = time.perf_counter()
+
+        steps["analysis"] += t0 - ta
+        steps["small_talk"] += t1 - t0
+        steps["quick_responses"] += t2 - t1
+        steps["prompt"] += t3 - t2
+        steps["budget"] += t4 - t3
+        steps["route"] += t5 - t4
+    total = time.perf_counter() - started
+    return {"total_us": total / count * 1e6, **{name: value / count * 1e6 for name, value in steps.items()}}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    handler = EnhancedAIHandler()
+    run(handler, 500, args.seed)  # warm-up
+    result = run(handler, args.messages, args.seed)
+    print(f"pre-Groq path: {result.pop('total_us'):.1f} us/message over {args.messages} messages")
+    for name, value in result.items():
+        print(f"  {name:16s} {value:7.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Check the Telegram HTML renderer against golden outputs and measure its throughput.
+
+Run: python scripts/bench_telegram_format.py [--repeat 300] [--check] [--update-golden]
+
+``telegram_format_golden.json`` holds sample AI answers (prose, code blocks,
+tables, lists, headings, rules and edge cases) with the HTML the bot sent for
+them before the renderer was rewritten; the only intended difference is that
+table rows are separated by newlines instead of ``<br>``, which Telegram does
+not accept.  Every sample is rendered and compared first; ``--check`` stops
+there (exit status 1 on a mismatch).  Otherwise prints the best-of-five
+microseconds per answer and the throughput over all samples, then the time
+to split ever longer rendered answers into 4096-character messages, which
+should stay flat per kilobyte.
+``--update-golden`` rewrites the expected HTML after an intentional change.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+# Ensure project root is on sys.path
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from telegram_format import MAX_MESSAGE_LENGTH, iter_message_chunks, render_answer_html  # noqa: E402
+
+GOLDEN_PATH = Path(__file__).resolve().parent / "telegram_format_golden.json"
+
+
+def best_us(func, text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func(text)
+        best = min(best, (time.perf_counter() - started) / repeat)
+    return best * 1e6
+
+
+def split(html: str) -> list:
+    chunks = list(iter_message_chunks(html))
+    assert all(len(chunk) <= MAX_MESSAGE_LENGTH for chunk in chunks)
+    return chunks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=300)
+    parser.add_argument("--check", action="store_true", help="only compare with the golden outputs")
+    parser.add_argument("--update-golden", action="store_true", help="store the current output as golden")
+    args = parser.parse_args()
+
+    cases = json.loads(GOLDEN_PATH.read_text(encoding="utf-8"))
+    if args.update_golden:
+        for case in cases:
+            case["html"] = render_answer_html(case["text"])
+        GOLDEN_PATH.write_text(json.dumps(cases, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"updated {len(cases)} golden outputs")
+        return
+
+    failed = [case["name"] for case in cases if render_answer_html(case["text"]) != case["html"]]
+    print(f"{len(cases) - len(failed)}/{len(cases)} golden outputs match" + (f", differ: {', '.join(failed)}" if failed else ""))
+    if args.check or failed:
+        sys.exit(1 if failed else 0)
+
+    total_chars = total_us = 0.0
+    for case in cases:
+        spent = best_us(render_answer_html, case["text"], args.repeat)
+        total_chars += len(case["text"])
+        total_us += spent
+        print(f"  {case['name']:20s} {len(case['text']):5d} chars {spent:8.1f} us")
+    print(f"total {total_us:.0f} us for {total_chars:.0f} chars, {total_chars / total_us:.1f} chars/us")
+
+    answer = "\n\n".join(case["text"] for case in cases)
+    for copies in (4, 16, 64):
+        html = render_answer_html("\n\n".join([answer] * copies))
+        spent = best_us(split, html, max(1, args.repeat // copies))
+        print(f"  split {len(html) // 1024:4d} KB into {len(split(html)):3d} messages {spent:9.1f} us, {spent * 1024 / len(html):.1f} us/KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Replay synthetic updates through PerChatUpdateProcessor against a stubbed Groq client.
+
+Run: python scripts/bench_update_processor.py [--updates 1000] [--users 200] [--workers 1,4,16]
+                                             [--groq-latency 0.01] [--groq-in-flight 4]
+
+Each question is handled like ``handle_message``: it reads the user's
+history, asks a stub Groq client (a sleep of ``--groq-latency`` seconds with
+a long tail, admitted by the real ``GroqScheduler``) and appends the
+question and the answer.  One update in five is a command answered without
+Groq.  All updates arrive at once, the way a backlog does after a restart;
+a few users send many of them.  For every worker count the script prints the
+total time, the p50/p95 time until a question and a command are answered, and
+how many histories came out in a different order than the user wrote; that
+must be zero.  ``--workers 1`` is what the bot did before (one update at a
+time).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List
+
+# Ensure project root is on sys.path
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from telegram import Bot, Update  # noqa: E402
+
+from groq_scheduler import GroqScheduler  # noqa: E402
+from update_processor import PerChatUpdateProcessor  # noqa: E402
+
+
+class StubGroq:
+    """Answers after a latency with a long tail, like a loaded Groq endpoint."""
+
+    def __init__(self, latency: float, seed: int) -> None:
+        self.latency = latency
+        self.random = random.Random(seed)
+
+    async def complete(self, question: str) -> str:
+        await asyncio.sleep(self.latency * self.random.lognormvariate(0, 0.75))
+        return f"answer to {question}"
+
+
+def synthetic_updates(count: int, users: int, seed: int) -> List[dict]:
+    rng = random.Random(seed)
+    # Skewed senders: a handful of users write most of the messages
+    weights = [1.0 / (rank + 1) for rank in range(users)]
+    updates = []
+    for update_id in range(1, count + 1):
+        user_id = 1000 + rng.choices(range(users), weights)[0]
+        text = "/start" if rng.random() < 0.2 else f"question {update_id}"
+        updates.append({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private", "first_name": "Bench"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+                "text": text,
+            },
+        })
+    return updates
+
+
+async def replay(raw_updates: List[dict], workers: int, args: argparse.Namespace) -> Dict[str, float]:
+    bot = Bot(token="123456:BENCH")
+    updates = [Update.de_json(data, bot) for data in raw_updates]
+    processor = PerChatUpdateProcessor(workers)
+    scheduler = GroqScheduler(max_in_flight=args.groq_in_flight, requests_per_minute=1e9, tokens_per_minute=1e12)
+    groq = StubGroq(args.groq_latency, args.seed)
+    histories: Dict[int, List[str]] = {}
+    written: Dict[int, List[str]] = {}
+    questions: List[float] = []
+    commands: List[float] = []
+
+    async def handle(update: Update, arrived: float) -> None:
+        text = update.message.text
+        if text.startswith("/"):
+            await asyncio.sleep(0)
+            commands.append(time.perf_counter() - arrived)
+            return
+        user_id = update.effective_user.id
+        history = histories.setdefault(user_id, [])
+        seen = len(history)
+        answer = await scheduler.run(lambda: groq.complete(text))
+        # A handler that overlapped another one of the same user would see a changed history
+        if len(history) != seen:
+            history.append("overlap")
+        history.extend((text, answer))
+        questions.append(time.perf_counter() - arrived)
+
+    for update in updates:
+        if not update.message.text.startswith("/"):
+            written.setdefault(update.effective_user.id, []).append(update.message.text)
+
+    await processor.initialize()
+    started = time.perf_counter()
+    # The application starts one task per update in arrival order
+    tasks = [asyncio.create_task(processor.process_update(update, handle(update, started))) for update in updates]
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    await processor.shutdown()
+
+    misordered = sum(1 for user_id, texts in written.items() if histories.get(user_id, [])[::2] != texts)
+    questions.sort()
+    commands.sort()
+
+    def at(samples: List[float], fraction: float) -> float:
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))] if samples else 0.0
+
+    return {
+        "elapsed": elapsed,
+        "question_p50": at(questions, 0.5),
+        "question_p95": at(questions, 0.95),
+        "command_p50": at(commands, 0.5),
+        "command_p95": at(commands, 0.95),
+        "misordered": misordered,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--workers", default="1,4,16", help="comma-separated worker counts to compare")
+    parser.add_argument("--groq-latency", type=float, default=0.01, help="median stub Groq latency, seconds")
+    parser.add_argument("--groq-in-flight", type=int, default=4, help="GroqScheduler max_in_flight")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    raw_updates = synthetic_updates(args.updates, args.users, args.seed)
+    print(f"{args.updates} updates from {args.users} users, Groq {args.groq_latency * 1000:.0f} ms median, "
+          f"{args.groq_in_flight} Groq calls at once")
+    for workers in (int(value) for value in args.workers.split(",")):
+        result = asyncio.run(replay(raw_updates, workers, args))
+        print(
+            f"  workers {workers:3d}: total {result['elapsed']:6.2f} s | "
+            f"question p50 {result['question_p50'] * 1000:8.1f} ms p95 {result['question_p95'] * 1000:8.1f} ms | "
+            f"command p50 {result['command_p50'] * 1000:8.1f} ms p95 {result['command_p95'] * 1000:8.1f} ms | "
+            f"misordered users {result['misordered']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Compare memory per user: legacy dict records vs. compact UserRecord/ProgressRecord.
+
+Run: python scripts/bench_user_memory.py --sizes 10000,100000,1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Ensure project root is on sys.path
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from records import ProgressRecord, UserRecord  # noqa: E402
+
+TOPICS = ("python", "javascript", "sql", "docker", "git", "algorithms", "react", "django")
+LEVELS = ("beginner", "intermediate", "advanced")
+BASE_TIME = datetime(2025, 1, 1)
+BASE_USER_ID = 100_000_000
+
+
+def _user_dict(index: int) -> dict:
+    # json.load produces a fresh string per value, so build them the same way.
+    created = (BASE_TIME + timedelta(seconds=index)).isoformat()
+    active = (BASE_TIME + timedelta(seconds=index * 7)).isoformat()
+    return {
+        "user_id": BASE_USER_ID + index,
+        "username": f"user{index}",
+        "first_name": f"Name{index % 5000}",
+        "preferred_language": "".join(TOPICS[index % 3]),
+        "skill_level": "".join(LEVELS[index % 3]),
+        "total_questions": index % 50,
+        "favorite_topics": ["".join(TOPICS[(index + shift) % len(TOPICS)]) for shift in range(3)],
+        "created_at": created,
+        "last_active": active,
+    }
+
+
+def _progress_dict(index: int) -> dict:
+    stamp = (BASE_TIME + timedelta(seconds=index)).isoformat()
+    return {
+        "current_lesson": index % 40,
+        "completed_lessons": list(range(index % 5)),
+        "started_at": stamp,
+        "last_activity": stamp,
+        "total_lessons_requested": index % 40,
+        "last_lesson_time": stamp,
+    }
+
+
+def _measure(build) -> tuple:
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    data = build()
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    gc.collect()
+    return current, elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma-separated user counts")
+    args = parser.parse_args()
+
+    scenarios = (
+        ("users: dict, str keys", lambda n: {str(BASE_USER_ID + i): _user_dict(i) for i in range(n)}),
+        ("users: UserRecord, int keys", lambda n: {BASE_USER_ID + i: UserRecord.from_dict(_user_dict(i)) for i in range(n)}),
+        ("progress: dict, str keys", lambda n: {str(BASE_USER_ID + i): _progress_dict(i) for i in range(n)}),
+        (
+            "progress: ProgressRecord",
+            lambda n: {BASE_USER_ID + i: ProgressRecord.from_dict(_progress_dict(i)) for i in range(n)},
+        ),
+    )
+
+    for size in (int(item) for item in args.sizes.split(",") if item.strip()):
+        print(f"--- {size:,} users ---")
+        for label, factory in scenarios:
+            current, elapsed = _measure(lambda: factory(size))
+            print(f"{label:30s} {current / 2**20:9.1f} MiB  {current / size:7.0f} B/user  build {elapsed:6.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Local stand-in for the Groq chat completions API, for exercising retries and the breaker.
+
+Run: python scripts/fake_groq_server.py [--port 8099] [--latency 0.5] [--fail-rate 0.3]
+                                        [--status 503] [--retry-after 2] [--outage 0]
+
+Point the bot (or any AsyncGroq client) at it with
+``GROQ_BASE_URL=http://127.0.0.1:8099`` and any API key.  Each request sleeps
+``--latency`` seconds (with +/-50% jitter), then fails with ``--status`` with
+probability ``--fail-rate`` (sending ``Retry-After`` when given).  During the
+first ``--outage`` seconds after start every request fails.  ``stream=true``
+requests get a server-sent event stream with the same final answer.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from aiohttp import web
+
+ANSWER = (
+    "Замыкание — это функция, которая запоминает переменные из области видимости, "
+    "в которой была создана.\n\n```python\ndef counter():\n    count = 0\n\n"
+    "    def inc():\n        nonlocal count\n        count += 1\n        return count\n\n"
+    "    return inc\n```"
+)
+
+
+def _usage(messages) -> dict:
+    prompt = sum(len(str(item.get("content", ""))) for item in messages) // 4
+    completion = len(ANSWER) // 4
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def build_app(args: argparse.Namespace) -> web.Application:
+    started = time.monotonic()
+    stats = {"requests": 0, "failed": 0}
+
+    async def completions(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        stats["requests"] += 1
+        await asyncio.sleep(args.latency * random.uniform(0.5, 1.5))
+
+        in_outage = time.monotonic() - started < args.outage
+        if in_outage or random.random() < args.fail_rate:
+            stats["failed"] += 1
+            headers = {"retry-after": str(args.retry_after)} if args.retry_after is not None else {}
+            error = {"error": {"message": "simulated failure", "type": "server_error"}}
+            return web.json_response(error, status=args.status, headers=headers)
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "fake")
+        usage = _usage(body.get("messages", []))
+        if not body.get("stream"):
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": ANSWER},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        words = ANSWER.split(" ")
+        for index, word in enumerate(words):
+            delta = word if index == len(words) - 1 else word + " "
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            await asyncio.sleep(0.02)
+        final = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "x_groq": {"id": completion_id, "usage": usage},
+        }
+        await response.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        await response.write_eof()
+        return response
+
+    async def stats_handler(_: web.Request) -> web.Response:
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_post("/openai/v1/chat/completions", completions)
+    app.router.add_get("/stats", stats_handler)
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean response latency, seconds")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="probability of an error response")
+    parser.add_argument("--status", type=int, default=503, help="HTTP status of simulated errors")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After header on errors")
+    parser.add_argument("--outage", type=float, default=0.0, help="fail everything for the first N seconds")
+    args = parser.parse_args()
+    web.run_app(build_app(args), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Post synthetic updates to the webhook receiver and measure ack and delivery latency.
+
+Run: python scripts/load_test_webhook.py [--updates 1000] [--concurrency 50] [--handler-delay 0.05]
+     python scripts/load_test_webhook.py --url https://<name>.onrender.com/telegram/webhook --secret ...
+
+Without ``--url`` the script serves ``webhook.WebhookReceiver`` on a local
+port, exactly as ``main_entry`` mounts it, with an update queue drained by a
+stand-in handler that sleeps ``--handler-delay`` seconds per update.  It
+reports the time to the HTTP 200 (ack) and the time until the handler takes
+the update from the queue (delivery), as p50/p95/max, plus requests per
+second; the ack should not grow with the handler delay.  Requests with a
+wrong secret are checked to get 403 first.
+
+With ``--url`` the updates go to a running bot and only the ack latency is
+measured.  They look like private messages from ``--chat-id``, which the bot
+will try to answer; use a chat you own.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+# Ensure project root is on sys.path
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from telegram import Bot  # noqa: E402
+
+from webhook import SECRET_HEADER, setup_webhook  # noqa: E402
+
+LOCAL_SECRET = "load-test-secret"
+LOCAL_PATH = "/telegram/webhook"
+
+
+def synthetic_update(update_id: int, chat_id: int) -> bytes:
+    sender = {"id": chat_id, "is_bot": False, "first_name": "Load", "username": "load_test"}
+    return json.dumps({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": "Load"},
+            "from": sender,
+            "text": f"Как работает декоратор в Python? #{update_id}",
+        },
+    }).encode("utf-8")
+
+
+def summary(name: str, samples: List[float]) -> str:
+    if not samples:
+        return f"{name}: no samples"
+    ordered = sorted(samples)
+
+    def at(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000
+
+    return f"{name}: p50 {at(0.5):.2f} ms, p95 {at(0.95):.2f} ms, max {ordered[-1] * 1000:.2f} ms"
+
+
+async def post_all(url: str, secret: str, args: argparse.Namespace, sent_at: Dict[int, float]) -> List[float]:
+    acks: List[float] = []
+    headers = {SECRET_HEADER: secret, "Content-Type": "application/json"}
+    next_id = iter(range(1, args.updates + 1))
+
+    async def worker(session: aiohttp.ClientSession) -> None:
+        for update_id in next_id:
+            body = synthetic_update(update_id, args.chat_id)
+            started = time.perf_counter()
+            sent_at[update_id] = started
+            async with session.post(url, data=body, headers=headers) as response:
+                await response.read()
+                if response.status != 200:
+                    raise RuntimeError(f"update {update_id}: HTTP {response.status}")
+            acks.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async with session.post(url, data=synthetic_update(0, args.chat_id), headers={SECRET_HEADER: "wrong"}) as response:
+            if response.status != 403:
+                raise RuntimeError(f"wrong secret answered with HTTP {response.status}, expected 403")
+        await asyncio.gather(*(worker(session) for _ in range(args.concurrency)))
+    return acks
+
+
+async def run_local(args: argparse.Namespace) -> None:
+    # The receiver only needs the bot (to attach it to updates) and the queue
+    application = SimpleNamespace(bot=Bot(token="123456:LOAD-TEST"), update_queue=asyncio.Queue())
+    app = web.Application()
+    receiver = setup_webhook(app, application, LOCAL_PATH, LOCAL_SECRET)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host="127.0.0.1", port=0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+
+    sent_at: Dict[int, float] = {}
+    delivered: List[float] = []
+
+    async def handler() -> None:
+        while True:
+            update = await application.update_queue.get()
+            delivered.append(time.perf_counter() - sent_at[update.update_id])
+            await asyncio.sleep(args.handler_delay)
+
+    # The application processes updates concurrently; model that with a few consumers
+    consumers = [asyncio.create_task(handler()) for _ in range(args.consumers)]
+    try:
+        started = time.perf_counter()
+        acks = await post_all(f"http://{host}:{port}{LOCAL_PATH}", LOCAL_SECRET, args, sent_at)
+        elapsed = time.perf_counter() - started
+        while len(delivered) < args.updates:
+            await asyncio.sleep(0.01)
+    finally:
+        for consumer in consumers:
+            consumer.cancel()
+        await runner.cleanup()
+
+    print(f"{args.updates} updates, concurrency {args.concurrency}, handler delay {args.handler_delay * 1000:.0f} ms")
+    print(f"posted in {elapsed:.2f} s, {args.updates / elapsed:.0f} updates/s")
+    print(summary("ack     ", acks))
+    print(summary("delivery", delivered))
+    print(f"receiver: {receiver.metrics()}")
+
+
+async def run_remote(args: argparse.Namespace) -> None:
+    started = time.perf_counter()
+    acks = await post_all(args.url, args.secret, args, {})
+    elapsed = time.perf_counter() - started
+    print(f"{args.updates} updates to {args.url}, concurrency {args.concurrency}")
+    print(f"posted in {elapsed:.2f} s, {args.updates / elapsed:.0f} updates/s")
+    print(summary("ack", acks))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--handler-delay", type=float, default=0.05, help="seconds the stand-in handler spends per update")
+    parser.add_argument("--consumers", type=int, default=32, help="updates handled at once (local mode)")
+    parser.add_argument("--url", help="webhook URL of a running bot (default: local receiver)")
+    parser.add_argument("--secret", default="", help="WEBHOOK_SECRET of the running bot")
+    parser.add_argument("--chat-id", type=int, default=1, help="chat the synthetic messages come from")
+    args = parser.parse_args(argv)
+    asyncio.run(run_remote(args) if args.url else run_local(args))
+
+
+if __name__ == "__main__":
+    main()
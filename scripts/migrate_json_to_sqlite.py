@@ -0,0 +1,67 @@
+"""One-off utility to import users.json, user_progress.json and state.json into SQLite."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, Optional
+
+# Ensure project root is on sys.path
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from sqlite_store import DEFAULT_SQLITE_PATH, ENV_SQLITE_PATH, SQLiteStore  # noqa: E402
+
+
+def _load_mapping(path: Path, label: str) -> Optional[Dict]:
+    if not path.exists():
+        print(f"Skipping {label}: {path} does not exist.")
+        return None
+    with path.open("r", encoding="utf-8") as fh:
+        data = json.load(fh)
+    if not isinstance(data, dict):
+        raise SystemExit(f"Invalid JSON structure in {path}: expected an object.")
+    return data
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Import the JSON storage files into the SQLite backend. "
+            f"Afterwards start the bot with STORAGE_BACKEND=sqlite and {ENV_SQLITE_PATH} pointing at the database."
+        )
+    )
+    parser.add_argument("--db", default=DEFAULT_SQLITE_PATH, help="SQLite database path (default: bot.db)")
+    parser.add_argument("--users", default="users.json", help="Path to users.json")
+    parser.add_argument("--progress", default="user_progress.json", help="Path to user_progress.json")
+    parser.add_argument("--state", default="state.json", help="Path to the course state.json")
+    args = parser.parse_args()
+
+    store = SQLiteStore(args.db)
+
+    users = _load_mapping(Path(args.users), "users")
+    if users is not None:
+        store.upsert_users({str(key): value for key, value in users.items()})
+        print(f"Imported {len(users)} users from {args.users}")
+
+    progress = _load_mapping(Path(args.progress), "progress")
+    if progress is not None:
+        store.upsert_progress_many({str(key): value for key, value in progress.items()})
+        print(f"Imported progress for {len(progress)} users from {args.progress}")
+
+    state = _load_mapping(Path(args.state), "course state")
+    if state is not None:
+        store.set_state("lesson_index", int(state.get("lesson_index", 0)))
+        if state.get("last_updated"):
+            store.set_state("last_updated", state["last_updated"])
+        print(f"Imported lesson_index={state.get('lesson_index', 0)} from {args.state}")
+
+    store.close()
+    print(f"Done: {args.db}")
+
+
+if __name__ == "__main__":
+    main()
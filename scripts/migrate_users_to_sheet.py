@@ -39,8 +39,7 @@ def main() -> None:
         raise SystemExit("Invalid JSON structure: expected an object mapping user IDs to records.")
 
     db = UserDatabase()
-    db.users_data = {str(k): v for k, v in data.items()}
-    db._save_data()
+    db.replace_all(data)
     print(f"Uploaded {len(db.users_data)} users to {('Google Sheets' if db._use_sheets else db.db_file)}")
 
 
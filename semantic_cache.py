@@ -0,0 +1,219 @@
+"""Near-duplicate answer cache over hashed character n-gram TF-IDF vectors."""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+from cache_keys import normalize_question
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPACITY = 1000
+DEFAULT_THRESHOLD = 0.82
+DEFAULT_DIM = 2048
+DEFAULT_TTL = 24 * 3600.0
+NGRAM = 3
+MIN_WORDS = 3
+MAX_CHARS = 300
+
+_CODE_MARKERS = ("```", "def ", "function ", "class ", "import ", "console.log", "print(", "=>", "{", ";")
+
+
+def numpy_available() -> bool:
+    return np is not None
+
+
+def is_semantic_candidate(text: str) -> bool:
+    """Only short prose questions are matched by similarity.
+
+    Very short messages carry too little signal, and in code a one-character
+    difference changes the answer, so both always go to the model.
+    """
+    stripped = (text or "").strip()
+    if not stripped or len(stripped) > MAX_CHARS:
+        return False
+    if len(stripped.split()) < MIN_WORDS:
+        return False
+    return not any(marker in stripped for marker in _CODE_MARKERS)
+
+
+class SemanticCache:
+    """Fixed-capacity matrix of question vectors with a vectorised cosine lookup.
+
+    Each question is turned into sublinear term frequencies of hashed word
+    unigrams and padded character trigrams (``dim`` buckets, CRC32 so vectors
+    are stable across processes).  IDF weights come from the document
+    frequencies of the cached questions and are applied at query time, so
+    inserting never rewrites stored rows.  A lookup only considers rows with
+    the same ``scope`` (the personalization part of the exact cache key) and
+    returns the best answer whose cosine similarity reaches ``threshold``.
+    When full, the least recently used slot is replaced.
+    """
+
+    def __init__(
+        self,
+        *,
+        capacity: int = DEFAULT_CAPACITY,
+        threshold: float = DEFAULT_THRESHOLD,
+        dim: int = DEFAULT_DIM,
+        ttl: float = DEFAULT_TTL,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        if np is None:
+            raise RuntimeError("numpy is required for SemanticCache")
+        self.capacity = max(int(capacity), 1)
+        self.threshold = float(threshold)
+        self.dim = int(dim)
+        self.ttl = float(ttl)
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._vectors = np.zeros((self.capacity, self.dim), dtype=np.float32)
+        # Element-wise squares, so IDF-weighted row norms are one matrix-vector product.
+        self._squares = np.zeros((self.capacity, self.dim), dtype=np.float32)
+        self._df = np.zeros(self.dim, dtype=np.int32)
+        self._scopes = np.full(self.capacity, -1, dtype=np.int32)
+        self._last_used = np.zeros(self.capacity, dtype=np.float64)
+        self._expires = np.zeros(self.capacity, dtype=np.float64)
+        self._answers: List[Optional[str]] = [None] * self.capacity
+        self._questions: Dict[Tuple[int, str], int] = {}
+        self._slot_question: List[Optional[Tuple[int, str]]] = [None] * self.capacity
+        self._scope_ids: Dict[str, int] = {}
+        self._size = 0
+        self._stats = {"lookups": 0, "hits": 0, "misses": 0, "added": 0, "evicted": 0, "expired": 0}
+
+    # ------------------------------------------------------------------ #
+    # Vectorisation
+    # ------------------------------------------------------------------ #
+    def vectorize(self, text: str) -> Tuple[str, Any]:
+        normalized = normalize_question(text)
+        buckets = []
+        mask = self.dim - 1 if self.dim & (self.dim - 1) == 0 else None
+        for word in normalized.split():
+            features = [f"w:{word}"]
+            padded = f" {word} "
+            features.extend(padded[i:i + NGRAM] for i in range(max(len(padded) - NGRAM + 1, 1)))
+            for feature in features:
+                digest = zlib.crc32(feature.encode("utf-8"))
+                buckets.append(digest & mask if mask is not None else digest % self.dim)
+        counts = np.bincount(np.asarray(buckets, dtype=np.int64), minlength=self.dim).astype(np.float32)
+        nonzero = counts > 0
+        counts[nonzero] = 1.0 + np.log(counts[nonzero])
+        return normalized, counts
+
+    # ------------------------------------------------------------------ #
+    # Public API
+    # ------------------------------------------------------------------ #
+    def lookup(self, text: str, scope: str) -> Optional[Tuple[str, float]]:
+        """Return ``(answer, similarity)`` for the closest cached question, if close enough."""
+        _, query = self.vectorize(text)
+        now = self._clock()
+        with self._lock:
+            self._stats["lookups"] += 1
+            scope_id = self._scope_ids.get(scope)
+            if scope_id is None or not query.any():
+                self._stats["misses"] += 1
+                return None
+            self._expire(now)
+            in_scope = self._scopes == scope_id
+            if not in_scope.any():
+                self._stats["misses"] += 1
+                return None
+
+            # Full-matrix BLAS products are cheaper than gathering the in-scope rows.
+            n_docs = max(self._size, 1)
+            idf = np.log((1.0 + n_docs) / (1.0 + self._df)) + 1.0
+            weights = (idf * idf).astype(np.float32)
+            numerators = self._vectors @ (query * weights)
+            row_norms = np.sqrt(self._squares @ weights)
+            query_norm = float(np.sqrt(np.dot(query * query, weights)))
+            denominators = row_norms * query_norm
+            valid = in_scope & (denominators > 0)
+            similarities = np.divide(numerators, denominators, out=np.zeros_like(numerators), where=valid)
+            slot = int(np.argmax(similarities))
+            score = float(similarities[slot])
+            if not valid[slot] or score < self.threshold:
+                self._stats["misses"] += 1
+                return None
+            self._last_used[slot] = now
+            self._stats["hits"] += 1
+            return self._answers[slot], score
+
+    def add(self, text: str, scope: str, answer: str) -> None:
+        normalized, vector = self.vectorize(text)
+        if not vector.any():
+            return
+        now = self._clock()
+        with self._lock:
+            scope_id = self._scope_ids.setdefault(scope, len(self._scope_ids))
+            key = (scope_id, normalized)
+            slot = self._questions.get(key)
+            if slot is None:
+                slot = self._free_slot(now)
+                self._questions[key] = slot
+                self._slot_question[slot] = key
+                self._vectors[slot] = vector
+                self._squares[slot] = vector * vector
+                self._df[vector > 0] += 1
+                self._scopes[slot] = scope_id
+                self._size += 1
+                self._stats["added"] += 1
+            self._answers[slot] = answer
+            self._last_used[slot] = now
+            self._expires[slot] = now + self.ttl
+
+    def __len__(self) -> int:
+        return self._size
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["lookups"]
+            return {
+                "entries": self._size,
+                "capacity": self.capacity,
+                "threshold": self.threshold,
+                "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                **self._stats,
+            }
+
+    # ------------------------------------------------------------------ #
+    # Internals (called with ``self._lock`` held)
+    # ------------------------------------------------------------------ #
+    def _free_slot(self, now: float) -> int:
+        if self._size < self.capacity:
+            empty = np.flatnonzero(self._scopes < 0)
+            return int(empty[0])
+        slot = int(np.argmin(self._last_used))
+        self._clear(slot)
+        self._stats["evicted"] += 1
+        return slot
+
+    def _expire(self, now: float) -> None:
+        expired = np.flatnonzero((self._scopes >= 0) & (self._expires <= now))
+        for slot in expired:
+            self._clear(int(slot))
+            self._stats["expired"] += 1
+
+    def _clear(self, slot: int) -> None:
+        if self._scopes[slot] < 0:
+            return
+        self._df[self._vectors[slot] > 0] -= 1
+        self._vectors[slot] = 0.0
+        self._squares[slot] = 0.0
+        self._scopes[slot] = -1
+        self._last_used[slot] = 0.0
+        self._answers[slot] = None
+        key = self._slot_question[slot]
+        if key is not None:
+            self._questions.pop(key, None)
+        self._slot_question[slot] = None
+        self._size -= 1
@@ -0,0 +1,276 @@
+"""Outbound Telegram send queue: global and per-chat rate limits, flood-control retries, edit coalescing."""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Any, Callable, Coroutine, Deque, Dict, Hashable, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from groq_scheduler import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Telegram's documented limits: ~30 messages per second overall, about one per
+# second in a private chat and 20 per minute in a group.
+DEFAULT_GLOBAL_RATE = 30.0
+DEFAULT_PRIVATE_RATE = 1.0
+DEFAULT_GROUP_RATE_PER_MINUTE = 20.0
+DEFAULT_CHAT_BURST = 3
+DEFAULT_MAX_RETRIES = 3
+MAX_TRACKED_CHATS = 10000
+WAIT_SAMPLES = 500
+
+_EDIT_ENDPOINTS = frozenset({"editMessageText", "editMessageCaption", "editMessageReplyMarkup", "editMessageMedia"})
+
+Request = Tuple[Callable[..., Coroutine[Any, Any, Any]], Any, Dict[str, Any]]
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """Delay requested by a flood-control error (an int or a timedelta, depending on the library version)."""
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+def _chat_key(chat_id: Any) -> Optional[Union[int, str]]:
+    """``chat_id`` as one key for ``-100123`` and ``"-100123"``; None when the request has no chat."""
+    if isinstance(chat_id, str):
+        stripped = chat_id.strip()
+        return int(stripped) if stripped.lstrip("-").isdigit() else stripped
+    return chat_id
+
+
+class _Chat:
+    __slots__ = ("bucket", "lock")
+
+    def __init__(self, bucket: TokenBucket) -> None:
+        self.bucket = bucket
+        self.lock = asyncio.Lock()
+
+
+class _PendingEdit:
+    __slots__ = ("request", "future")
+
+    def __init__(self, request: Request) -> None:
+        self.request = request
+        self.future: Optional[asyncio.Future] = None
+
+
+class SendQueue(BaseRateLimiter):
+    """Rate limiter for every Bot API call that targets a chat.
+
+    Plug it into the bot ``Application`` (``Application.builder().rate_limiter``)
+    and into standalone bots (``ExtBot(token, rate_limiter=...)``) so that all
+    of them share one budget.  A request with a ``chat_id`` waits, in arrival
+    order, for a token of its chat's bucket (``private_rate`` per second, or
+    ``group_rate_per_minute`` for groups and channels, each with a burst of
+    ``chat_burst``) and then of the global bucket (``global_rate`` per
+    second).  Requests to one chat go out one at a time, so their order is
+    kept.  Requests without a chat (``getUpdates``, ``answerCallbackQuery``)
+    pass straight through.
+
+    ``RetryAfter`` is retried up to ``max_retries`` times after the delay
+    Telegram asked for; the chat (or, for a request without a chat, every
+    chat) stays paused meanwhile.  An edit of a message that already has an
+    edit waiting in the queue replaces that edit's content instead of being
+    sent separately: both callers get the result of the one request.
+    """
+
+    def __init__(
+        self,
+        *,
+        global_rate: float = DEFAULT_GLOBAL_RATE,
+        private_rate: float = DEFAULT_PRIVATE_RATE,
+        group_rate_per_minute: float = DEFAULT_GROUP_RATE_PER_MINUTE,
+        chat_burst: int = DEFAULT_CHAT_BURST,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.global_rate = float(global_rate)
+        self.private_rate = float(private_rate)
+        self.group_rate = float(group_rate_per_minute) / 60.0
+        self.chat_burst = max(int(chat_burst), 1)
+        self.max_retries = max(int(max_retries), 0)
+        self._clock = clock
+        self._global = TokenBucket(max(self.global_rate, 1.0), self.global_rate, clock)
+        self._global_lock: Optional[asyncio.Lock] = None
+        self._resume_at = 0.0
+        self._chats: Dict[Hashable, _Chat] = {}
+        self._edits: Dict[Hashable, _PendingEdit] = {}
+        self._queued = 0
+        self._in_flight = 0
+        self._waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self._stats = {
+            "sent": 0,
+            "failed": 0,
+            "retry_after": 0,
+            "retry_after_seconds": 0.0,
+            "edits_coalesced": 0,
+            "max_queue_depth": 0,
+        }
+
+    async def initialize(self) -> None:
+        """Nothing to set up: buckets and locks are created on first use."""
+
+    async def shutdown(self) -> None:
+        """Nothing to release; the queue stays usable by the other bots sharing it."""
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Any,
+    ) -> Any:
+        chat_id = _chat_key(data.get("chat_id"))
+        if endpoint in _EDIT_ENDPOINTS:
+            key = (endpoint, chat_id, data.get("message_id"), data.get("inline_message_id"))
+            pending = self._edits.get(key)
+            if pending is not None:
+                # The queued edit has not gone out yet: it will carry this content instead
+                pending.request = (callback, args, kwargs)
+                self._stats["edits_coalesced"] += 1
+            else:
+                pending = self._edits[key] = _PendingEdit((callback, args, kwargs))
+                pending.future = asyncio.ensure_future(self._send(chat_id, lambda: self._take_edit(key, pending)))
+            return await asyncio.shield(pending.future)
+        if chat_id is None:
+            return await callback(*args, **kwargs)
+        return await self._send(chat_id, lambda: (callback, args, kwargs))
+
+    def metrics(self) -> Dict[str, Any]:
+        waits = sorted(self._waits)
+
+        def percentile(fraction: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(len(waits) * fraction))] * 1000, 1)
+
+        return {
+            "queue_depth": self._queued,
+            "in_flight": self._in_flight,
+            "chats": len(self._chats),
+            "edits_pending": len(self._edits),
+            "global_tokens_available": round(self._global.available(), 2),
+            "wait_p50_ms": percentile(0.5),
+            "wait_p95_ms": percentile(0.95),
+            **self._stats,
+            "retry_after_seconds": round(self._stats["retry_after_seconds"], 1),
+        }
+
+    # ------------------------------------------------------------------ #
+    # Internals
+    # ------------------------------------------------------------------ #
+    def _take_edit(self, key: Hashable, pending: _PendingEdit) -> Request:
+        # From here on a new edit of the message is queued on its own
+        if self._edits.get(key) is pending:
+            del self._edits[key]
+        return pending.request
+
+    async def _send(self, chat_id: Optional[Hashable], request: Callable[[], Request]) -> Any:
+        chat = self._chat(chat_id) if chat_id is not None else None
+        queued_at = self._clock()
+        self._queued += 1
+        self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queued)
+        waiting = True
+        try:
+            if chat is not None:
+                await chat.lock.acquire()
+            try:
+                if chat is not None:
+                    await self._take(chat.bucket)
+                if self._global_lock is None:
+                    self._global_lock = asyncio.Lock()
+                async with self._global_lock:
+                    pause = self._resume_at - self._clock()
+                    if pause > 0:
+                        await asyncio.sleep(pause)
+                    await self._take(self._global)
+                self._queued -= 1
+                waiting = False
+                self._waits.append(self._clock() - queued_at)
+                return await self._call(chat, request())
+            finally:
+                if chat is not None:
+                    chat.lock.release()
+        finally:
+            if waiting:
+                self._queued -= 1
+
+    async def _call(self, chat: Optional[_Chat], request: Request) -> Any:
+        callback, args, kwargs = request
+        for attempt in itertools.count():
+            self._in_flight += 1
+            try:
+                result = await callback(*args, **kwargs)
+            except RetryAfter as error:
+                delay = retry_after_seconds(error)
+                self._stats["retry_after"] += 1
+                self._stats["retry_after_seconds"] += delay
+                if attempt >= self.max_retries:
+                    self._stats["failed"] += 1
+                    raise
+                logger.warning("Telegram flood control: retry %d in %.1fs", attempt + 1, delay)
+                if chat is None:
+                    self._resume_at = max(self._resume_at, self._clock() + delay)
+                # The chat lock is held, so the whole chat waits with this request
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self._stats["failed"] += 1
+                raise
+            finally:
+                self._in_flight -= 1
+            self._stats["sent"] += 1
+            return result
+
+    async def _take(self, bucket: TokenBucket) -> None:
+        wait = bucket.wait_time(1)
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = bucket.wait_time(1)
+        bucket.take(1)
+
+    def _chat(self, chat_id: Hashable) -> _Chat:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            if len(self._chats) >= MAX_TRACKED_CHATS:
+                self._forget_idle_chats()
+            # Negative ids and @usernames are groups and channels
+            group = isinstance(chat_id, str) or (isinstance(chat_id, int) and chat_id < 0)
+            rate = self.group_rate if group else self.private_rate
+            chat = self._chats[chat_id] = _Chat(TokenBucket(self.chat_burst, rate, self._clock))
+        return chat
+
+    def _forget_idle_chats(self) -> None:
+        """Drop chats with nothing queued and a full bucket: recreating them changes nothing."""
+        for chat_id, chat in list(self._chats.items()):
+            if not chat.lock.locked() and chat.bucket.available() >= chat.bucket.capacity:
+                del self._chats[chat_id]
+
+
+def _build_send_queue() -> SendQueue:
+    try:
+        from config import SEND_GLOBAL_RATE, SEND_GROUP_RATE_PER_MINUTE, SEND_MAX_RETRIES, SEND_PRIVATE_RATE
+    except Exception:  # pragma: no cover - config needs the bot tokens
+        return SendQueue()
+    return SendQueue(
+        global_rate=SEND_GLOBAL_RATE,
+        private_rate=SEND_PRIVATE_RATE,
+        group_rate_per_minute=SEND_GROUP_RATE_PER_MINUTE,
+        max_retries=SEND_MAX_RETRIES,
+    )
+
+
+# One queue for every bot instance in the process: they share the same token and limits
+send_queue = _build_send_queue()
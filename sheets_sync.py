@@ -0,0 +1,198 @@
+"""Batched, diff-based synchronisation of user rows into a Google Sheets worksheet."""
+
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 5.0
+MAX_RANGES_PER_BATCH = 500
+GRID_GROWTH = 100
+
+
+def _column_letter(index: int) -> str:
+    """Return the A1 column name for a 1-based column index."""
+    letters = ""
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+class SheetsSyncEngine:
+    """Flush only changed rows to a worksheet in ``batch_update`` calls.
+
+    The engine keeps a ``user_id -> row number`` index built from the first
+    column of the sheet.  Callers mark keys dirty; a daemon thread collects the
+    dirty set every ``flush_interval`` seconds and writes those rows (plus any
+    new rows appended after the last known one) in as few API calls as
+    possible.  Any object exposing ``col_values``, ``batch_update``, ``row_count``
+    and ``add_rows`` like :class:`gspread.Worksheet` can be used, which keeps the
+    engine testable against an in-memory fake.
+    """
+
+    def __init__(
+        self,
+        worksheet: Any,
+        headers: List[str],
+        row_builder: Callable[[str], Optional[List[Any]]],
+        lock: Any,
+        *,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    ) -> None:
+        self._worksheet = worksheet
+        self._headers = list(headers)
+        self._row_builder = row_builder
+        self._lock = lock
+        self._flush_interval = max(flush_interval, 0.1)
+        self._last_column = _column_letter(len(self._headers))
+
+        self._row_index: Dict[str, int] = {}
+        self._next_row = 2
+        self._needs_header = False
+        self._index_known = False
+        self._dirty: Set[str] = set()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.rebuild_index()
+
+    # ------------------------------------------------------------------ #
+    # Index maintenance
+    # ------------------------------------------------------------------ #
+    def rebuild_index(self) -> bool:
+        """Re-read the key column; needed after the sheet was rewritten wholesale.
+
+        Returns False when the column could not be read.  The index is then
+        unknown: flushes keep their dirty keys and retry the read first, so a
+        transient API error never makes new rows overwrite existing ones.
+        """
+        try:
+            column = self._worksheet.col_values(1)
+        except Exception as exc:
+            logger.error("Error reading user_id column from Google Sheet: %s", exc)
+            with self._lock:
+                self._index_known = False
+            return False
+
+        with self._lock:
+            self._index_known = True
+            self._row_index = {}
+            if not column:
+                # Empty sheet: write the header with the first flush.
+                self._needs_header = True
+                self._next_row = 2
+                return True
+            self._needs_header = False
+            for row_number, cell in enumerate(column[1:], start=2):
+                try:
+                    key = str(int(str(cell).strip()))
+                except (TypeError, ValueError):
+                    continue
+                self._row_index[key] = row_number
+            self._next_row = len(column) + 1
+        return True
+
+    # ------------------------------------------------------------------ #
+    # Public API
+    # ------------------------------------------------------------------ #
+    def mark_dirty(self, key: str) -> None:
+        """Schedule ``key`` for the next flush; never touches the network."""
+        with self._lock:
+            self._dirty.add(key)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._dirty)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="sheets-sync", daemon=True)
+        self._thread.start()
+
+    def flush(self) -> int:
+        """Write every dirty row now and return how many rows were sent."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty and not self._needs_header:
+                    return 0
+                index_known = self._index_known
+            if not index_known and not self.rebuild_index():
+                # Row numbers are unknown: keep the dirty keys until the column can be read
+                return 0
+            with self._lock:
+                keys = sorted(self._dirty, key=lambda item: int(item) if item.isdigit() else 0)
+                self._dirty.clear()
+                data: List[Dict[str, Any]] = []
+                if self._needs_header:
+                    data.append({"range": f"A1:{self._last_column}1", "values": [self._headers]})
+                for key in keys:
+                    row_values = self._row_builder(key)
+                    if row_values is None:
+                        continue
+                    row_number = self._row_index.get(key)
+                    if row_number is None:
+                        row_number = self._next_row
+                        self._row_index[key] = row_number
+                        self._next_row += 1
+                    data.append(
+                        {
+                            "range": f"A{row_number}:{self._last_column}{row_number}",
+                            "values": [row_values],
+                        }
+                    )
+                last_row = self._next_row - 1
+
+            if not data:
+                return 0
+            try:
+                self._ensure_grid(last_row)
+                for start in range(0, len(data), MAX_RANGES_PER_BATCH):
+                    self._worksheet.batch_update(data[start:start + MAX_RANGES_PER_BATCH])
+            except Exception as exc:
+                logger.error("Error syncing %s rows to Google Sheet: %s", len(keys), exc)
+                with self._lock:
+                    self._dirty.update(keys)
+                return 0
+
+            with self._lock:
+                self._needs_header = False
+            sent = len(data)
+            logger.debug("Synced %s rows to Google Sheet", sent)
+            return sent
+
+    def close(self) -> None:
+        """Stop the background thread and push any remaining changes."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self._flush_interval + 5)
+        self._thread = None
+        self.flush()
+
+    # ------------------------------------------------------------------ #
+    # Internals
+    # ------------------------------------------------------------------ #
+    def _ensure_grid(self, last_row: int) -> None:
+        row_count = getattr(self._worksheet, "row_count", None)
+        if isinstance(row_count, int) and last_row > row_count:
+            self._worksheet.add_rows(last_row - row_count + GRID_GROWTH)
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                if not self._index_known:
+                    self.rebuild_index()
+                self.flush()
+            except Exception as exc:  # pragma: no cover - defensive
+                logger.error("Google Sheets sync failed: %s", exc)
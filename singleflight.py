@@ -0,0 +1,67 @@
+"""Coalesce concurrent identical async calls into one shared in-flight task."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Run at most one ``factory()`` per key at a time; duplicates await its result.
+
+    The first caller for a key (the leader) starts the work as a task.  Every
+    caller, including the leader, waits on it through :func:`asyncio.shield`
+    with its own ``timeout``, so a caller that gives up does not cancel the
+    work for the others.  The task keeps running after all callers have left
+    and is dropped from the in-flight map as soon as it finishes; side effects
+    that must happen exactly once (such as filling a cache) belong inside the
+    factory.  Results and exceptions are delivered to every waiter unchanged.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._stats = {"leaders": 0, "coalesced": 0, "timeouts": 0, "errors": 0}
+
+    async def do(
+        self,
+        key: Hashable,
+        factory: Callable[[], Awaitable[Any]],
+        *,
+        timeout: Optional[float] = None,
+    ) -> Tuple[Any, bool]:
+        """Return ``(result, shared)``; ``shared`` is True when another caller's call was reused."""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done, key=key: self._finished(key, done))
+            self._stats["leaders"] += 1
+        else:
+            self._stats["coalesced"] += 1
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            raise
+        return result, shared
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"in_flight": len(self._inflight), **self._stats}
+
+    def _finished(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            self._stats["errors"] += 1
+            logger.debug("Single-flight call for %r failed: %s", key, exc)
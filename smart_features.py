@@ -6,41 +6,31 @@ import re
 import json
 import logging
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, FrozenSet, List, Optional
+
+from message_analysis import language_from_keywords
+from message_keywords import MESSAGE_KEYWORDS, PROGRAMMING_LANGUAGES
 
 logger = logging.getLogger(__name__)
 
 class SmartFeatures:
     """Набор интеллектуальных функций для бота"""
 
-    # Расширенный список языков
-    PROGRAMMING_LANGUAGES = {
-        'python': ['python', 'py', 'питон', 'пайтон'],
-        'javascript': ['javascript', 'js', 'джаваскрипт', 'node'],
-        'typescript': ['typescript', 'ts', 'тайпскрипт'],
-        'java': ['java', 'джава'],
-        'cpp': ['c++', 'cpp', 'c plus plus', 'си плюс плюс'],
-        'c': ['c', 'си'],
-        'rust': ['rust', 'раст'],
-        'go': ['go', 'golang', 'гоу'],
-        'php': ['php', 'пхп'],
-        'ruby': ['ruby', 'руби'],
-        'swift': ['swift', 'свифт'],
-        'kotlin': ['kotlin', 'котлин'],
-        'sql': ['sql', 'mysql', 'postgresql', 'sqlite'],
-        'html': ['html', 'хтмл'],
-        'css': ['css', 'стили'],
-        'bash': ['bash', 'shell', 'terminal', 'терминал']
-    }
-
-    def detect_language_by_code(self, code: str) -> Optional[str]:
-        """Определить язык программирования по ключевым словам или синтаксису"""
-        text_lower = code.lower()
+    # Расширенный список языков (общая таблица, см. message_keywords)
+    PROGRAMMING_LANGUAGES = PROGRAMMING_LANGUAGES
+
+    def detect_language_by_code(self, code: str, matched: Optional[FrozenSet[str]] = None) -> Optional[str]:
+        """Определить язык программирования по ключевым словам или синтаксису
+
+        matched — категории ключевых слов этого текста, если он уже разобран (MessageAnalysis.matched)
+        """
+        if matched is None:
+            matched = MESSAGE_KEYWORDS.find(code.lower())
 
         # Сначала ищем по словарю ключевых слов
-        for lang, keywords in self.PROGRAMMING_LANGUAGES.items():
-            if any(keyword in text_lower for keyword in keywords):
-                return lang
+        lang = language_from_keywords(matched)
+        if lang:
+            return lang
 
         # Определение по синтаксису
         if re.search(r"def\s+\w+\s*\(", code) and ":" in code:
@@ -0,0 +1,255 @@
+"""SQLite storage backend shared by the user database, course progress and course state."""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from records import to_epoch
+
+logger = logging.getLogger(__name__)
+
+ENV_STORAGE_BACKEND = "STORAGE_BACKEND"
+ENV_SQLITE_PATH = "SQLITE_DB_PATH"
+DEFAULT_SQLITE_PATH = "bot.db"
+BACKEND_SQLITE = "sqlite"
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        data TEXT NOT NULL,
+        last_active INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_users_last_active ON users (last_active)",
+    """
+    CREATE TABLE IF NOT EXISTS progress (
+        user_id INTEGER PRIMARY KEY,
+        data TEXT NOT NULL,
+        last_activity INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_progress_last_activity ON progress (last_activity)",
+    """
+    CREATE TABLE IF NOT EXISTS contexts (
+        user_id INTEGER PRIMARY KEY,
+        data TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS response_cache (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_response_cache_expires ON response_cache (expires_at)",
+    """
+    CREATE TABLE IF NOT EXISTS course_state (
+        name TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    """,
+)
+
+# Statements are kept as constants so sqlite3's per-connection statement cache
+# reuses the prepared form on every call.
+_UPSERT_USER = (
+    "INSERT INTO users (user_id, data, last_active) VALUES (?, ?, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, last_active = excluded.last_active"
+)
+_SELECT_USERS = "SELECT user_id, data FROM users"
+_UPSERT_PROGRESS = (
+    "INSERT INTO progress (user_id, data, last_activity) VALUES (?, ?, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, last_activity = excluded.last_activity"
+)
+_SELECT_PROGRESS = "SELECT user_id, data FROM progress"
+_UPSERT_STATE = (
+    "INSERT INTO course_state (name, value) VALUES (?, ?) "
+    "ON CONFLICT(name) DO UPDATE SET value = excluded.value"
+)
+_SELECT_STATE = "SELECT value FROM course_state WHERE name = ?"
+_UPSERT_CONTEXT = (
+    "INSERT INTO contexts (user_id, data) VALUES (?, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data"
+)
+_SELECT_CONTEXT = "SELECT data FROM contexts WHERE user_id = ?"
+_UPSERT_CACHED = (
+    "INSERT INTO response_cache (key, value, expires_at) VALUES (?, ?, ?) "
+    "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at"
+)
+_DELETE_CACHED = "DELETE FROM response_cache WHERE key = ?"
+_SELECT_CACHED = "SELECT value, expires_at FROM response_cache WHERE key = ?"
+_DELETE_EXPIRED_CACHED = "DELETE FROM response_cache WHERE expires_at <= ?"
+_DELETE_OLDEST_CACHED = (
+    "DELETE FROM response_cache WHERE key IN "
+    "(SELECT key FROM response_cache ORDER BY expires_at ASC LIMIT ?)"
+)
+
+
+def _dumps(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def _epoch(value: Any) -> int:
+    """Epoch seconds for an indexed timestamp column (0 when missing, as the column requires)."""
+    return to_epoch(value) or 0
+
+
+class SQLiteStore:
+    """Thread-safe wrapper around a single WAL-mode SQLite connection."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # Autocommit mode: every single-row upsert is its own short transaction.
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        logger.info("SQLite storage opened at %s", path)
+
+    # ------------------------------------------------------------------ #
+    # Users
+    # ------------------------------------------------------------------ #
+    def load_users(self) -> Dict[str, Dict]:
+        with self._lock:
+            rows = self._conn.execute(_SELECT_USERS).fetchall()
+        return {str(user_id): json.loads(data) for user_id, data in rows}
+
+    def upsert_user(self, user_key: str, record: Dict) -> None:
+        params = (int(user_key), _dumps(record), _epoch(record.get("last_active")))
+        with self._lock:
+            self._conn.execute(_UPSERT_USER, params)
+
+    def upsert_users(self, records: Dict[str, Dict]) -> None:
+        self._executemany(
+            _UPSERT_USER,
+            ((int(key), _dumps(record), _epoch(record.get("last_active"))) for key, record in records.items()),
+        )
+
+    # ------------------------------------------------------------------ #
+    # Course progress
+    # ------------------------------------------------------------------ #
+    def load_progress(self) -> Dict[str, Dict]:
+        with self._lock:
+            rows = self._conn.execute(_SELECT_PROGRESS).fetchall()
+        return {str(user_id): json.loads(data) for user_id, data in rows}
+
+    def upsert_progress(self, user_key: str, record: Dict) -> None:
+        params = (int(user_key), _dumps(record), _epoch(record.get("last_activity")))
+        with self._lock:
+            self._conn.execute(_UPSERT_PROGRESS, params)
+
+    def upsert_progress_many(self, records: Dict[str, Dict]) -> None:
+        self._executemany(
+            _UPSERT_PROGRESS,
+            (
+                (int(key), _dumps(record), _epoch(record.get("last_activity")))
+                for key, record in records.items()
+            ),
+        )
+
+    # ------------------------------------------------------------------ #
+    # Conversation contexts (serialised JSON, loaded one user at a time)
+    # ------------------------------------------------------------------ #
+    def get_context(self, user_id: int) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(_SELECT_CONTEXT, (int(user_id),)).fetchone()
+        return row[0] if row else None
+
+    def upsert_contexts(self, items: Iterable[Tuple[int, str]]) -> None:
+        self._executemany(_UPSERT_CONTEXT, ((int(user_id), data) for user_id, data in items))
+
+    # ------------------------------------------------------------------ #
+    # Response cache (durable tier of cache.ResponseCache)
+    # ------------------------------------------------------------------ #
+    def get_cached_response(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(_SELECT_CACHED, (key,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def write_cached_responses(self, items: Iterable[Tuple[str, Optional[Tuple[str, float]]]]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for key, entry in items:
+                    if entry is None:
+                        self._conn.execute(_DELETE_CACHED, (key,))
+                    else:
+                        self._conn.execute(_UPSERT_CACHED, (key, entry[0], entry[1]))
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def prune_cached_responses(self, max_entries: int, now: float) -> int:
+        """Drop expired rows, then the rows closest to expiry beyond ``max_entries``."""
+        with self._lock:
+            removed = self._conn.execute(_DELETE_EXPIRED_CACHED, (now,)).rowcount
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()
+            if count > max_entries:
+                removed += self._conn.execute(_DELETE_OLDEST_CACHED, (count - max_entries,)).rowcount
+        return removed
+
+    # ------------------------------------------------------------------ #
+    # Course state (lesson index shared by the scheduler and the handler)
+    # ------------------------------------------------------------------ #
+    def get_state(self, name: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute(_SELECT_STATE, (name,)).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def set_state(self, name: str, value: Any) -> None:
+        with self._lock:
+            self._conn.execute(_UPSERT_STATE, (name, json.dumps(value, ensure_ascii=False)))
+
+    # ------------------------------------------------------------------ #
+    # Helpers
+    # ------------------------------------------------------------------ #
+    def _executemany(self, statement: str, params: Iterable[Tuple]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(statement, params)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_default_store: Optional[SQLiteStore] = None
+_default_store_lock = threading.Lock()
+
+
+def sqlite_enabled() -> bool:
+    """Return True when ``STORAGE_BACKEND=sqlite`` is configured."""
+    return (os.getenv(ENV_STORAGE_BACKEND) or "").strip().lower() == BACKEND_SQLITE
+
+
+def get_default_store() -> Optional[SQLiteStore]:
+    """Return the process-wide store, or None when SQLite is not configured."""
+    global _default_store
+    if not sqlite_enabled():
+        return None
+    with _default_store_lock:
+        if _default_store is None:
+            path = (os.getenv(ENV_SQLITE_PATH) or DEFAULT_SQLITE_PATH).strip() or DEFAULT_SQLITE_PATH
+            _default_store = SQLiteStore(path)
+        return _default_store
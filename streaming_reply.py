@@ -0,0 +1,154 @@
+"""Progressively edited Telegram reply for answers that are still being generated."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, List, Optional
+
+from telegram.error import BadRequest, RetryAfter
+
+from send_queue import retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EDIT_INTERVAL = 1.5
+GROUP_EDIT_INTERVAL = 3.0
+MAX_PREVIEW_CHARS = 3900
+CURSOR = " ▌"
+
+
+class StreamingReply:
+    """Show a growing answer in one message, edited at most every ``interval`` seconds.
+
+    ``feed`` is synchronous and cheap, so it can be called for every streamed
+    chunk: it only appends the text and, if no edit is pending, schedules one.
+    The pending edit waits until the throttle window opens and then shows the
+    latest text, so intermediate chunks are coalesced into a single edit.  The
+    first edit sends the message (as a reply to ``message``); previews are plain
+    text because a half-received answer is rarely valid HTML.  ``RetryAfter``
+    from Telegram pushes the next edit back by the requested delay.
+
+    ``finish`` replaces the preview with the final HTML and returns False when
+    nothing was shown yet or the edit failed, in which case the caller sends
+    the answer the usual way (and may ``discard`` the preview).
+    """
+
+    def __init__(
+        self,
+        message: Any,
+        *,
+        interval: float = DEFAULT_EDIT_INTERVAL,
+        max_chars: int = MAX_PREVIEW_CHARS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._message = message
+        self.interval = float(interval)
+        self.max_chars = int(max_chars)
+        self._clock = clock
+        self._parts: List[str] = []
+        self._shown: Optional[str] = None
+        self._sent: Optional[Any] = None
+        self._next_edit = 0.0
+        self._pending: Optional[asyncio.Future] = None
+        self._editing = False
+        self._closed = False
+        self.edits = 0
+
+    @property
+    def started(self) -> bool:
+        return self._sent is not None
+
+    def feed(self, delta: str) -> None:
+        if self._closed or not delta:
+            return
+        self._parts.append(delta)
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._pump())
+
+    async def finish(self, html: str, reply_markup: Any = None) -> bool:
+        """Replace the preview with ``html``; False if the caller must send it instead."""
+        self._closed = True
+        await self._settle()
+        if self._sent is None:
+            return False
+        for attempt in range(2):
+            try:
+                await self._sent.edit_text(html, parse_mode="HTML", reply_markup=reply_markup)
+                return True
+            except RetryAfter as error:
+                if attempt:
+                    break
+                await asyncio.sleep(retry_after_seconds(error))
+            except Exception as error:
+                logger.warning("Could not finalize streamed reply: %s", error)
+                break
+        return False
+
+    async def discard(self) -> None:
+        """Stop updating and delete the preview message, if one was sent."""
+        self._closed = True
+        await self._settle()
+        if self._sent is None:
+            return
+        try:
+            await self._sent.delete()
+        except Exception as error:
+            logger.debug("Could not delete streamed preview: %s", error)
+        self._sent = None
+
+    # ------------------------------------------------------------------ #
+    # Internals
+    # ------------------------------------------------------------------ #
+    def _preview(self) -> str:
+        text = "".join(self._parts).strip()
+        if len(text) > self.max_chars:
+            return text[: self.max_chars].rstrip() + " …"
+        return text + CURSOR
+
+    async def _settle(self) -> None:
+        pending = self._pending
+        if pending is None:
+            return
+        if not self._editing:
+            # Still waiting for the throttle window: nothing is in flight, so cancel it.
+            pending.cancel()
+        try:
+            await pending
+        except asyncio.CancelledError:
+            pass
+
+    async def _pump(self) -> None:
+        try:
+            delay = self._next_edit - self._clock()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self._closed:
+                return
+            text = self._preview()
+            if text == self._shown:
+                return
+            self._editing = True
+            try:
+                if self._sent is None:
+                    self._sent = await self._message.reply_text(text)
+                else:
+                    await self._sent.edit_text(text)
+                self._shown = text
+                self.edits += 1
+                self._next_edit = self._clock() + self.interval
+            except RetryAfter as error:
+                self._next_edit = self._clock() + retry_after_seconds(error)
+            except BadRequest as error:
+                # "Message is not modified" and similar are harmless for a preview
+                logger.debug("Streamed preview edit rejected: %s", error)
+                self._next_edit = self._clock() + self.interval
+            finally:
+                self._editing = False
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            logger.debug("Streamed preview update failed: %s", error)
+        finally:
+            self._pending = None
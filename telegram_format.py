@@ -0,0 +1,324 @@
+"""Render AI answers (Markdown as produced by the model) into Telegram HTML.
+
+Patterns are compiled once at import; the text is tokenized (code cut out),
+escaped, walked line by line for block elements and finished with a few
+compiled passes, without per-match Python callbacks.
+"""
+
+from __future__ import annotations
+
+import html as _html
+import re
+from typing import Iterator, List, Tuple
+
+ANSWER_PREFIX = "✅ <b>Ответ:</b>\n"
+BULLET = "&#8226; "
+MAX_MESSAGE_LENGTH = 4096
+
+# Fenced and inline code are cut out first and replaced by one private-use
+# character each, so the Markdown rules never look inside code.
+_FENCE_RE = re.compile(r"```(\w+)?\n?(.*?)\n?```", re.DOTALL)
+_INLINE_CODE_RE = re.compile(r"`([^`\n]+)`")
+_TOKEN_BASE = 0xF0000
+_TOKEN_RE = re.compile("([\U000F0000-\U000FFFFD])")
+
+_HEADING_RE = re.compile(r"\s*#{1,3}\s+(.+)")
+_RULE_RE = re.compile(r"\s*[-*_]{3,}\s*")
+_TABLE_SEPARATOR_RE = re.compile(r"\|\s*[-:]+\s*(\|\s*[-:]+\s*)+\|?")
+_BOLD_RE = re.compile(r"(\*\*)(.+?)(\*\*)")
+_ITALIC_RE = re.compile(r"(?<!\*)(\*)(?!\*)(.+?)(?<!\*)(\*)(?!\*)")
+_BULLET_RE = re.compile(r"^[\-*•][^\S\n]+", re.MULTILINE)
+_NUMBERED_RE = re.compile(r"(\n\d+\.)([^\S\n]+)")
+# First characters of lines that can be a heading, a rule or a table row.
+_BLOCK_STARTS = "#-*_|"
+# Markers that make an answer go through the Markdown renderer rather than plain escaping.
+_CODE_HINT_RE = re.compile(
+    r"`|def |function |class |import |from |console\.log|print\(|return |DOCTYPE|[hH][tT][mM][lL]>"
+)
+
+_HTML_ESCAPES = (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;"))
+
+# Message splitting: tags (the tag, "/" if it closes, the name) and entities.
+_OPEN_CLOSE_RE = re.compile(r"(<(/?)([a-zA-Z][a-zA-Z0-9-]*)[^>]*>)")
+_TAG_RE = re.compile(r"<[^>]*>")
+_ENTITY_RE = re.compile(r"&#?\w+;")
+# Preferred cut points, best first: paragraph, line, word.
+_BREAKS = (("\n\n", 2), ("\n", 1), (" ", 1))
+
+
+def escape_html(text: str) -> str:
+    """Escape ``&``, ``<``, ``>`` and ``"`` for Telegram's HTML parse mode."""
+    for char, entity in _HTML_ESCAPES:
+        text = text.replace(char, entity)
+    return text.replace('"', "&quot;")
+
+
+def escape_code(code: str) -> str:
+    """Escape code for ``<code>``/``<pre>`` (quotes are left as is) and strip it."""
+    for char, entity in _HTML_ESCAPES:
+        code = code.replace(char, entity)
+    return code.strip()
+
+
+def html_to_text(text: str) -> str:
+    """Plain text of Telegram HTML (tags dropped, entities decoded), for sending without ``parse_mode``."""
+    return _html.unescape(_TAG_RE.sub("", text))
+
+
+def render_answer_html(text: str) -> str:
+    """Final Telegram HTML for an AI answer.
+
+    Answers that look like they contain code or Markdown go through
+    :func:`render_markdown`; anything else is only escaped.
+    """
+    if _CODE_HINT_RE.search(text):
+        return render_markdown(text)
+    return ANSWER_PREFIX + escape_html(text)
+
+
+def render_markdown(text: str) -> str:
+    """Render fenced code, inline code, headings, rules, tables, bold/italic and lists.
+
+    Fenced blocks become ``<pre><code>``, inline code ``<code>``, headings
+    bold lines, tables one bullet per row with ``Header: value`` lines,
+    ``-``/``*``/``•`` items bullets.  Blank lines right above a heading are
+    dropped, and a horizontal rule together with the blank lines around it
+    becomes a single empty line.
+
+    Every substitution is a compiled ``split`` whose pieces are put back with
+    slice assignments, so no Python callback runs per match.
+    """
+    if _TOKEN_RE.search(text):
+        text = _TOKEN_RE.sub("\ufffd", text)
+    tokens: List[str] = []
+
+    parts = _FENCE_RE.split(text)  # text, language, code, text, ...
+    if len(parts) > 1:
+        tokens.extend(f"<pre><code>{escape_code(code.rstrip())}</code></pre>" for code in parts[2::3])
+        parts[1::3] = [chr(_TOKEN_BASE + number) for number in range(len(tokens))]
+        parts[2::3] = [""] * len(tokens)
+        text = "".join(parts)
+
+    parts = _INLINE_CODE_RE.split(text)  # text, code, text, ...
+    if len(parts) > 1:
+        first = len(tokens)
+        for code in parts[1::2]:
+            code = f"<code>{escape_code(code)}</code>"
+            # Backticks around a fenced block leave its token inside the span
+            tokens.append(_restore(code, tokens) if first and _TOKEN_RE.search(code) else code)
+        parts[1::2] = [chr(_TOKEN_BASE + number) for number in range(first, len(tokens))]
+        text = "".join(parts)
+
+    html = "\n".join(_render_blocks(escape_html(text).split("\n")))
+    if "*" in html:
+        if "**" in html:
+            html = _wrap(_BOLD_RE, html, "<b>", "</b>")
+        html = _wrap(_ITALIC_RE, html, "<i>", "</i>")
+    html = _BULLET_RE.sub(BULLET, html)
+    parts = _NUMBERED_RE.split(html)  # text, "\nN.", spaces, text, ...
+    if len(parts) > 1:
+        parts[2::3] = [" "] * (len(parts) // 3)
+        html = "".join(parts)
+    if tokens:
+        html = _restore(html, tokens)
+    return ANSWER_PREFIX + html
+
+
+def _wrap(pattern: "re.Pattern[str]", text: str, open_tag: str, close_tag: str) -> str:
+    """Replace the first and third group of every ``pattern`` match by the tags."""
+    parts = pattern.split(text)  # text, opening, content, closing, text, ...
+    count = len(parts) // 4
+    if count:
+        parts[1::4] = [open_tag] * count
+        parts[3::4] = [close_tag] * count
+        text = "".join(parts)
+    return text
+
+
+def _restore(text: str, tokens: List[str]) -> str:
+    """Put the code HTML back in place of its token characters."""
+    parts = _TOKEN_RE.split(text)
+    parts[1::2] = [tokens[ord(char) - _TOKEN_BASE] for char in parts[1::2]]
+    return "".join(parts)
+
+
+def _render_blocks(lines: List[str]) -> List[str]:
+    """Headings, horizontal rules and tables; bold, italic and lists are applied to the joined text."""
+    out: List[str] = []
+    # out[kept:] are blank lines that a following heading or rule removes.
+    kept = 0
+    after_rule = False
+    merge_rule = False
+    index = 0
+    count = len(lines)
+    while index < count:
+        line = lines[index]
+        index += 1
+        if not line:
+            if after_rule:
+                # Blank lines after a rule merge into the rule's empty line; so
+                # does the next rule if the last of those lines is empty.
+                merge_rule = True
+            else:
+                out.append(line)
+            continue
+        first = line[0]
+        if first not in _BLOCK_STARTS and not first.isspace():
+            out.append(line)
+            kept = len(out)
+            after_rule = False
+            continue
+
+        stripped = line.strip()
+        if not stripped:
+            if after_rule:
+                merge_rule = False
+            else:
+                out.append(line)
+            continue
+
+        first = stripped[0]
+        if first == "#":
+            heading = _HEADING_RE.fullmatch(line)
+            if heading:
+                del out[kept:]
+                out.append(f"<b>{heading.group(1)}</b>")
+                kept = len(out)
+                after_rule = False
+                continue
+        elif first in "-*_" and _RULE_RE.fullmatch(line):
+            del out[kept:]
+            if not (after_rule and merge_rule):
+                out.append("")
+            kept = len(out)
+            after_rule = True
+            merge_rule = False
+            continue
+        elif first == "|" and stripped[-1] == "|" and index < count:
+            if _TABLE_SEPARATOR_RE.fullmatch(lines[index].strip()):
+                index = _render_table(stripped, lines, index + 1, out)
+                kept = len(out)
+                after_rule = False
+                continue
+
+        out.append(line)
+        kept = len(out)
+        after_rule = False
+    return out
+
+
+def _render_table(header: str, lines: List[str], index: int, out: List[str]) -> int:
+    """Append one bullet per table row (``Header: value`` lines); return the index after the table."""
+    headers = [cell.strip() for cell in header.strip("|").split("|")]
+    headers = [name for name in headers if name]
+    while index < len(lines):
+        row = lines[index].strip()
+        if not (row.startswith("|") and row.endswith("|")):
+            break
+        pairs = []
+        for position, cell in enumerate(cell.strip() for cell in row.strip("|").split("|")):
+            content = cell or "—"
+            if position < len(headers):
+                if "<" in content or "&lt;" in content:
+                    content = f"<code>{content}</code>"
+                pairs.append(f"<b>{headers[position]}:</b> {content}")
+            elif cell:
+                if "<" in cell or "&lt;" in cell:
+                    cell = f"<code>{cell}</code>"
+                pairs.append(cell)
+        if pairs:
+            out.append(BULLET + "\n".join(pairs))
+        index += 1
+    return index
+
+
+def iter_message_chunks(text: str, limit: int = MAX_MESSAGE_LENGTH, *, html: bool = True) -> Iterator[str]:
+    """Yield pieces of ``text`` that each fit in one Telegram message of ``limit`` characters.
+
+    Pieces are cut at a paragraph break, else a line break, else a space in
+    the second half of the room left, and only mid-word when there is none.
+    With ``html`` the text is Telegram HTML: a cut never falls inside a tag
+    or entity, tags open at the cut are closed at the end of the piece and
+    re-opened at the start of the next one, and a ``<pre>`` block is moved
+    to the next piece whole unless it alone is longer than a message.
+
+    Only the window of the piece being cut is searched (cut points with
+    ``rfind``, tags with one compiled scan), so the work is linear in the
+    length of the text and the first piece is ready before the rest is read.
+    """
+    if len(text) <= limit:
+        if text.strip():
+            yield text
+        return
+
+    opened: List[Tuple[str, str]] = []  # tags open at ``start``: name, opening tag
+    start = 0
+    while start < len(text):
+        prefix = "".join(tag for _, tag in opened)
+        end, skip, stack = _next_cut(text, start, limit - len(prefix), opened, html)
+        body = text[start:end]
+        if (_TAG_RE.sub("", body) if html and "<" in body else body).strip():
+            yield prefix + body + "".join(f"</{name}>" for name, _ in reversed(stack))
+        opened, start = stack, end + skip
+
+
+def _next_cut(
+    text: str, start: int, room: int, opened: List[Tuple[str, str]], html: bool
+) -> Tuple[int, int, List[Tuple[str, str]]]:
+    """End of the piece starting at ``start``, separator length to drop there, tags open at the end."""
+    reserve = 0  # room for the closing tags of the piece
+    while True:
+        high = start + max(room - reserve, 1)
+        end, skip = _cut_point(text, start, high, html)
+        stack = _open_tags(text, start, end, opened) if html else opened
+        if any(name == "pre" for name, _ in stack):
+            # A code block that starts in this piece is moved to the next one rather than cut
+            block = text.rfind("<pre", start, end)
+            if block > start:
+                end, skip = block, 0
+                stack = _open_tags(text, start, end, opened)
+        closing = sum(len(name) + 3 for name, _ in stack)
+        if closing <= reserve or end - start <= 1:
+            return end, skip, stack
+        reserve = closing
+
+
+def _cut_point(text: str, start: int, high: int, html: bool) -> Tuple[int, int]:
+    """Best cut in ``text[start:high]`` and the length of the separator dropped there."""
+    if high >= len(text):
+        return len(text), 0
+    low = start + (high - start) // 2
+    for separator, skip in _BREAKS:
+        position = text.rfind(separator, low, high)
+        # Whitespace inside a tag (between attributes) is not a cut point
+        while html and position > start and text.rfind("<", start, position) > text.rfind(">", start, position):
+            position = text.rfind(separator, low, text.rfind("<", start, position))
+        if position > start:
+            return position, skip
+    position = high
+    if html:
+        # A mid-word cut goes before a tag or entity it would split
+        tag = text.rfind("<", start, position)
+        if tag > text.rfind(">", start, position):
+            return (tag if tag > start else text.index(">", tag) + 1), 0
+        entity = text.rfind("&", max(start, position - 10), position)
+        if entity > start and ";" not in text[entity:position] and _ENTITY_RE.match(text, entity):
+            return entity, 0
+    return position, 0
+
+
+def _open_tags(text: str, start: int, end: int, opened: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """Tags open at ``end`` (name, opening tag as written), given the tags ``opened`` at ``start``."""
+    stack = list(opened)
+    for tag, closing, name in _OPEN_CLOSE_RE.findall(text, start, end):
+        name = name.lower()
+        if not closing:
+            stack.append((name, tag))
+        elif stack and stack[-1][0] == name:
+            stack.pop()
+        else:
+            for depth in range(len(stack) - 2, -1, -1):
+                if stack[depth][0] == name:
+                    del stack[depth:]
+                    break
+    return stack
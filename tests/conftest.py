@@ -0,0 +1,12 @@
+import os
+import sys
+from pathlib import Path
+
+# Ensure project root is on sys.path
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+# config.py requires the bot credentials; the tests never reach Telegram or Groq
+for name in ("TELEGRAM_TOKEN", "GROQ_API_KEY", "HUGGING_FACE_TOKEN"):
+    os.environ.setdefault(name, "test")
@@ -0,0 +1,109 @@
+"""ContextStore write-behind against an in-memory spill tier."""
+
+import asyncio
+import json
+
+from context_store import ContextStore
+
+
+class Context:
+    def __init__(self, level="beginner"):
+        self.level = level
+
+    def to_state(self):
+        return {"level": self.level}
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(state["level"])
+
+
+class MemorySpill:
+    def __init__(self):
+        self.data = {}
+        self.loads = 0
+        self.fail_writes = 0
+
+    def load(self, user_id):
+        self.loads += 1
+        return self.data.get(user_id)
+
+    def save_many(self, items):
+        if self.fail_writes:
+            self.fail_writes -= 1
+            raise OSError("disk full")
+        self.data.update(items)
+
+    def close(self):
+        pass
+
+
+def store_with(spill, **kwargs):
+    return ContextStore(Context, spill=spill, **kwargs)
+
+
+def test_evicted_context_is_rehydrated_from_the_batch_being_written():
+    spill = MemorySpill()
+    spill.data[1] = json.dumps({"level": "beginner"})
+    store = store_with(spill, max_entries=1)
+    store.get(1).level = "advanced"
+    store.get(2)  # evicts user 1 with its change queued
+    batch = store.collect_dirty()
+    assert batch == [(1, json.dumps({"level": "advanced"}, separators=(",", ":")))]
+    # The writer has not stored the batch yet: the spill still has the old state
+    assert store.get(1).level == "advanced"
+    assert store.metrics()["writes_in_flight"] == 1
+    store.complete_write(batch, store.write(batch))
+    assert store.metrics()["writes_in_flight"] == 0
+    assert json.loads(spill.data[1])["level"] == "advanced"
+
+
+def test_write_only_touches_the_spill_and_failures_are_requeued():
+    spill = MemorySpill()
+    store = store_with(spill, max_entries=1)
+    store.get(1).level = "advanced"
+    store.get(2)
+    batch = store.collect_dirty()
+    spill.fail_writes = 1
+    assert store.write(batch) is False
+    assert store.metrics()["spill_errors"] == 0  # recorded by complete_write, on the owner's thread
+    store.complete_write(batch, False)
+    assert store.metrics()["spill_errors"] == 1
+    assert store.metrics()["pending_writes"] == 1
+    retry = store.collect_dirty()
+    assert retry == batch
+    store.complete_write(retry, store.write(retry))
+    assert store.metrics()["written"] == 1
+    assert store.get(1).level == "advanced"
+
+
+def test_get_async_loads_the_spill_off_the_loop():
+    spill = MemorySpill()
+    spill.data[7] = json.dumps({"level": "expert"})
+    store = store_with(spill)
+
+    async def scenario():
+        first = await store.get_async(7)
+        second = await store.get_async(7)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first is second and first.level == "expert"
+    assert spill.loads == 1
+    assert store.metrics()["rehydrated"] == 1
+
+
+def test_get_async_prefers_a_state_queued_while_it_was_loading():
+    spill = MemorySpill()
+    spill.data[1] = json.dumps({"level": "beginner"})
+    store = store_with(spill, max_entries=1)
+
+    async def scenario():
+        loading = asyncio.ensure_future(store.get_async(1))
+        await asyncio.sleep(0)
+        # While the read runs in its thread, the loop loads user 1, changes it and evicts it
+        store.get(1).level = "advanced"
+        store.get(2)
+        return await loading
+
+    assert asyncio.run(scenario()).level == "advanced"
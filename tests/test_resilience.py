@@ -0,0 +1,232 @@
+"""ResilientCaller with an injected clock and sleep."""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from resilience import (
+    MIN_HEDGE_SAMPLES,
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientCaller,
+    RetryPolicy,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+        await asyncio.sleep(0)
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+def caller(clock, *, policy=None, breaker=None, **kwargs):
+    return ResilientCaller(
+        policy=policy or RetryPolicy(rng=lambda: 1.0),
+        breaker=breaker or CircuitBreaker(clock=clock),
+        sleep=clock.sleep,
+        clock=clock,
+        **kwargs,
+    )
+
+
+def outcomes(*results):
+    """Factory returning or raising ``results`` one call at a time."""
+    remaining = list(results)
+    calls = []
+
+    async def factory():
+        calls.append(len(calls))
+        result = remaining.pop(0)
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    factory.calls = calls
+    return factory
+
+
+async def hang():
+    await asyncio.sleep(60)
+
+
+def test_retry_after_is_honoured():
+    clock = FakeClock()
+    factory = outcomes(StatusError(429, {"retry-after": "7"}), StatusError(503, {"retry-after-ms": "250"}), "ok")
+    assert asyncio.run(caller(clock).call(factory)) == "ok"
+    assert clock.sleeps == [7.0, 0.25]
+
+
+def test_retry_after_beyond_the_budget_is_not_waited_for():
+    clock = FakeClock()
+    factory = outcomes(StatusError(429, {"retry-after": "60"}), "ok")
+    with pytest.raises(StatusError):
+        asyncio.run(caller(clock).call(factory))
+    assert clock.sleeps == [] and len(factory.calls) == 1
+
+
+def test_client_errors_are_not_retried_and_do_not_open_the_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker(min_calls=1, failure_ratio=0.5, clock=clock)
+    with pytest.raises(StatusError):
+        asyncio.run(caller(clock, breaker=breaker).call(outcomes(StatusError(400))))
+    assert breaker.state == STATE_CLOSED
+
+
+def test_breaker_opens_and_lets_one_probe_through_after_the_pause():
+    clock = FakeClock()
+    breaker = CircuitBreaker(min_calls=2, failure_ratio=0.5, open_seconds=30, clock=clock)
+    resilient = caller(clock, policy=RetryPolicy(attempts=1), breaker=breaker)
+
+    async def scenario():
+        for _ in range(2):
+            with pytest.raises(ConnectionError):
+                await resilient.call(outcomes(ConnectionError()))
+        assert breaker.state == STATE_OPEN
+        untouched = outcomes("ok")
+        with pytest.raises(CircuitOpenError):
+            await resilient.call(untouched)
+        assert untouched.calls == []
+
+        clock.now += 30
+        release = asyncio.Event()
+
+        async def probe():
+            await release.wait()
+            return "probe"
+
+        probing = asyncio.ensure_future(resilient.call(probe))
+        await asyncio.sleep(0)
+        assert breaker.state == STATE_HALF_OPEN
+        # Only the probe goes out while the circuit is half-open
+        with pytest.raises(CircuitOpenError):
+            await resilient.call(outcomes("ok"))
+        release.set()
+        assert await probing == "probe"
+        assert breaker.state == STATE_CLOSED
+
+    asyncio.run(scenario())
+    assert resilient.metrics()["short_circuited"] == 2
+
+
+def test_failed_probe_reopens_the_circuit():
+    clock = FakeClock()
+    breaker = CircuitBreaker(min_calls=1, failure_ratio=0.5, open_seconds=30, clock=clock)
+    resilient = caller(clock, breaker=breaker)
+
+    async def scenario():
+        with pytest.raises(ConnectionError):
+            await resilient.call(outcomes(ConnectionError()))
+        clock.now += 30
+        probe = outcomes(ConnectionError(), "not retried")
+        with pytest.raises(ConnectionError):
+            await resilient.call(probe)
+        assert len(probe.calls) == 1
+
+    asyncio.run(scenario())
+    assert breaker.state == STATE_OPEN and breaker.opened == 2
+
+
+def test_hedge_fires_after_the_latency_percentile_and_the_faster_request_wins():
+    clock = FakeClock()
+    resilient = caller(clock, hedge_percentile=0.5)
+
+    async def quick():
+        clock.now += 0.01
+        return "quick"
+
+    requests = []
+
+    async def slow_then_fast():
+        requests.append(len(requests))
+        if len(requests) == 1:
+            await hang()
+        return f"request {len(requests)}"
+
+    async def scenario():
+        for _ in range(MIN_HEDGE_SAMPLES):
+            await resilient.call(quick)
+        return await resilient.call(slow_then_fast)
+
+    assert asyncio.run(scenario()) == "request 2"
+    assert resilient.metrics()["hedges"] == 1 and resilient.metrics()["hedge_wins"] == 1
+
+
+def test_hedge_waits_for_capacity():
+    clock = FakeClock()
+    resilient = caller(clock, hedge_percentile=0.5, hedge_allowed=lambda: False)
+
+    async def quick():
+        clock.now += 0.01
+        return "quick"
+
+    async def scenario():
+        for _ in range(MIN_HEDGE_SAMPLES):
+            await resilient.call(quick)
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "slow"
+
+        return await resilient.call(slow)
+
+    assert asyncio.run(scenario()) == "slow"
+    assert resilient.metrics()["hedges"] == 0
+
+
+def test_timed_out_attempts_count_as_failures_before_retrying():
+    clock = FakeClock()
+    breaker = CircuitBreaker(min_calls=2, failure_ratio=1.0, clock=clock)
+    policy = RetryPolicy(attempts=3, attempt_timeout=0.02, rng=lambda: 0.0)
+    attempts = []
+
+    async def stuck():
+        attempts.append(len(attempts))
+        await hang()
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(caller(clock, policy=policy, breaker=breaker).call(stuck))
+    # The second timeout trips the breaker, so the third attempt is never made
+    assert len(attempts) == 2
+    assert breaker.state == STATE_OPEN
+
+
+def test_attempts_never_outlive_the_retry_budget():
+    policy = RetryPolicy(attempts=5, attempt_timeout=20.0, max_elapsed=0.2, min_attempt=0.05, rng=lambda: 0.0)
+    resilient = ResilientCaller(policy=policy)
+    started = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(resilient.call(hang))
+    assert time.monotonic() - started < 1.0
+
+
+def test_a_call_cancelled_by_its_callers_deadline_is_a_failure():
+    clock = FakeClock()
+    breaker = CircuitBreaker(min_calls=1, failure_ratio=0.5, clock=clock)
+    resilient = caller(clock, breaker=breaker)
+
+    async def scenario():
+        await asyncio.wait_for(resilient.call(hang), timeout=0.02)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(scenario())
+    assert breaker.state == STATE_OPEN
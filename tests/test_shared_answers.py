@@ -0,0 +1,116 @@
+"""Answers shared through the response cache and single-flight carry nothing personal."""
+
+import asyncio
+import functools
+from types import SimpleNamespace
+
+import pytest
+
+import enhanced_ai_handler as handler_module
+from cache_keys import build_cache_key, shared_answer_key
+from enhanced_ai_handler import EnhancedAIHandler
+from singleflight import SingleFlight
+
+QUESTION = "Как работает декоратор в Python и зачем он нужен?"
+PREFERENCES = {"language": "python", "explanation_style": "detailed", "favorite_languages": [], "learning_goals": []}
+NAMES = {1: "Иван", 2: "Мария"}
+
+
+class EchoGroq:
+    """Answers with the prompt it got, so anything personal in the prompt shows up in the answer."""
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, *, messages, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        message = SimpleNamespace(content="Ответ. " + messages[-1]["content"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+class Users:
+    def peek_user_snapshot(self, user_id):
+        return {"user_id": user_id, "first_name": NAMES[user_id], "favorite_topics": []}
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    monkeypatch.setattr(handler_module, "user_db", Users())
+    instance = EnhancedAIHandler()
+    instance.groq_client = EchoGroq(delay=0.05)
+    return instance
+
+
+def context(user_id, history=()):
+    return SimpleNamespace(user_id=user_id, history=list(history), skill_level="beginner", preferences=PREFERENCES)
+
+
+def earlier_dialog(user_id):
+    return [
+        {"role": "user", "content": f"Меня интересует ООП, пример {user_id}: классы и наследование"},
+        {"role": "assistant", "content": f"Ответ про классы номер {user_id}"},
+    ]
+
+
+async def answer(handler, flights, user_context):
+    """The path of ``main.handle_message``: shared answers go through single-flight, personal ones do not."""
+    question_key = build_cache_key(QUESTION, user_context.skill_level, user_context.preferences)
+    share_key = shared_answer_key(question_key, user_context.history)
+    generate = functools.partial(
+        handler.get_specialized_response,
+        QUESTION,
+        user_context=user_context,
+        skill_level=user_context.skill_level,
+        preferences=user_context.preferences,
+        shared=share_key is not None,
+    )
+    if share_key:
+        (response, _), _ = await flights.do(share_key, generate)
+    else:
+        response, _ = await generate()
+    return share_key, response
+
+
+def test_different_names_never_share_a_cached_answer_with_personal_content(handler):
+    async def scenario():
+        flights = SingleFlight()
+        return [await answer(handler, flights, context(user_id)) for user_id in NAMES]
+
+    (key_ivan, answer_ivan), (key_maria, answer_maria) = asyncio.run(scenario())
+    # Same question and settings: one cache entry, and it holds no name
+    assert key_ivan == key_maria is not None
+    for response in (answer_ivan, answer_maria):
+        assert "Иван" not in response and "Мария" not in response
+
+
+def test_users_with_history_get_no_cache_key_and_a_personal_answer(handler):
+    async def scenario():
+        flights = SingleFlight()
+        return [await answer(handler, flights, context(user_id, earlier_dialog(user_id))) for user_id in NAMES]
+
+    (key_ivan, answer_ivan), (key_maria, answer_maria) = asyncio.run(scenario())
+    assert key_ivan is None and key_maria is None
+    assert "Иван" in answer_ivan and "Мария" not in answer_ivan
+    assert "Мария" in answer_maria and "Иван" not in answer_maria
+
+
+def test_concurrent_users_with_different_names_each_get_their_own_answer(handler):
+    async def scenario():
+        flights = SingleFlight()
+        personal = [context(user_id, earlier_dialog(user_id)) for user_id in NAMES]
+        fresh = [context(user_id) for user_id in NAMES]
+        results = await asyncio.gather(*(answer(handler, flights, item) for item in personal + fresh))
+        return results, flights.metrics()
+
+    results, flights = asyncio.run(scenario())
+    (_, ivan), (_, maria), (_, fresh_ivan), (_, fresh_maria) = results
+    assert "Иван" in ivan and "Мария" not in ivan
+    assert "Мария" in maria and "Иван" not in maria
+    # Only the impersonal request was coalesced, and its answer names nobody
+    assert flights["coalesced"] == 1
+    assert fresh_ivan == fresh_maria
+    assert "Иван" not in fresh_ivan and "Мария" not in fresh_ivan
+    assert handler.groq_client.calls == 3
@@ -0,0 +1,118 @@
+"""SheetsSyncEngine against an in-memory worksheet."""
+
+import threading
+
+from sheets_sync import MAX_RANGES_PER_BATCH, SheetsSyncEngine
+
+HEADERS = ["user_id", "name"]
+
+
+class FakeWorksheet:
+    """The part of ``gspread.Worksheet`` the engine uses, backed by a dict of rows."""
+
+    def __init__(self, rows=None, row_count=1000):
+        self.rows = {number: list(values) for number, values in (rows or {}).items()}
+        self.row_count = row_count
+        self.batches = []
+        self.fail_reads = 0
+        self.fail_writes = 0
+
+    def col_values(self, column):
+        if self.fail_reads:
+            self.fail_reads -= 1
+            raise ConnectionError("read failed")
+        last = max(self.rows, default=0)
+        return [self.rows.get(number, [""])[column - 1] for number in range(1, last + 1)]
+
+    def batch_update(self, data):
+        if self.fail_writes:
+            self.fail_writes -= 1
+            raise ConnectionError("write failed")
+        self.batches.append(data)
+        for item in data:
+            row_number = int(item["range"].split(":")[0][1:])
+            self.rows[row_number] = list(item["values"][0])
+
+    def add_rows(self, count):
+        self.row_count += count
+
+
+def existing_sheet():
+    return FakeWorksheet({1: HEADERS, 2: ["10", "Ann"], 3: ["20", "Bob"]})
+
+
+def engine(worksheet, names):
+    return SheetsSyncEngine(
+        worksheet, HEADERS, lambda key: [key, names[key]] if key in names else None, threading.RLock()
+    )
+
+
+def sent_ranges(worksheet):
+    return [item["range"] for batch in worksheet.batches for item in batch]
+
+
+def test_only_dirty_rows_are_sent():
+    sheet = existing_sheet()
+    sync = engine(sheet, {"10": "Ann", "20": "Robert"})
+    sync.mark_dirty("20")
+    assert sync.flush() == 1
+    assert sent_ranges(sheet) == ["A3:B3"]
+    assert sheet.rows[2] == ["10", "Ann"] and sheet.rows[3] == ["20", "Robert"]
+    assert sync.flush() == 0
+
+
+def test_new_rows_are_appended_after_the_last_known_row():
+    sheet = existing_sheet()
+    sync = engine(sheet, {"30": "Cid", "40": "Dee"})
+    sync.mark_dirty("40")
+    sync.mark_dirty("30")
+    sync.flush()
+    assert sheet.rows[4] == ["30", "Cid"] and sheet.rows[5] == ["40", "Dee"]
+    assert sheet.rows[2] == ["10", "Ann"] and sheet.rows[3] == ["20", "Bob"]
+
+
+def test_empty_sheet_gets_a_header_and_grows_its_grid():
+    sheet = FakeWorksheet(row_count=2)
+    sync = engine(sheet, {"1": "A", "2": "B", "3": "C"})
+    for key in ("1", "2", "3"):
+        sync.mark_dirty(key)
+    sync.flush()
+    assert sheet.rows[1] == HEADERS
+    assert [sheet.rows[number][0] for number in (2, 3, 4)] == ["1", "2", "3"]
+    assert sheet.row_count >= 4
+
+
+def test_ranges_are_batched():
+    sheet = existing_sheet()
+    names = {str(key): f"user {key}" for key in range(100, 100 + MAX_RANGES_PER_BATCH + 20)}
+    sync = engine(sheet, names)
+    for key in names:
+        sync.mark_dirty(key)
+    assert sync.flush() == len(names)
+    assert [len(batch) for batch in sheet.batches] == [MAX_RANGES_PER_BATCH, 20]
+
+
+def test_failed_flush_requeues_its_keys():
+    sheet = existing_sheet()
+    sync = engine(sheet, {"20": "Robert", "30": "Cid"})
+    sync.mark_dirty("20")
+    sync.mark_dirty("30")
+    sheet.fail_writes = 1
+    assert sync.flush() == 0
+    assert sync.pending() == 2
+    assert sync.flush() == 2
+    assert sheet.rows[3] == ["20", "Robert"] and sheet.rows[4] == ["30", "Cid"]
+
+
+def test_unreadable_index_holds_writes_until_the_column_is_read():
+    sheet = existing_sheet()
+    sheet.fail_reads = 2
+    sync = engine(sheet, {"20": "Robert", "30": "Cid"})
+    sync.mark_dirty("30")
+    sync.mark_dirty("20")
+    # The retry on this flush fails too: nothing is written over the existing rows
+    assert sync.flush() == 0
+    assert sheet.batches == [] and sync.pending() == 2
+    assert sync.flush() == 2
+    assert sheet.rows[2] == ["10", "Ann"]
+    assert sheet.rows[3] == ["20", "Robert"] and sheet.rows[4] == ["30", "Cid"]
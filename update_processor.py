@@ -0,0 +1,142 @@
+"""Concurrent update processing that keeps each user's updates in order."""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+from telegram.ext import BaseUpdateProcessor
+
+DEFAULT_WORKERS = 16
+DEFAULT_MAX_PENDING = 1024
+WAIT_SAMPLES = 500
+
+
+def update_key(update: object) -> Optional[Hashable]:
+    """Whose updates must not overlap: the sender's, else the chat's; None for neither."""
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return ("user", user.id)
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return ("chat", chat.id)
+    return None
+
+
+class _Lane:
+    __slots__ = ("lock", "users")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Run updates of different users in parallel on at most ``workers`` at a time.
+
+    Updates with the same :func:`update_key` run one after another, in the
+    order they arrived, so a user's context (history, skill level) is never
+    changed by two handlers at once and replies follow the questions.  An
+    update waits for the previous update of its user *before* taking a worker,
+    so a user who sends many messages at once holds a single worker while the
+    others keep serving everyone else.  ``max_pending`` bounds the updates
+    accepted but not finished (the library's own limit); beyond it the
+    application stops taking new ones until some complete.
+
+    Plug it in with ``Application.builder().concurrent_updates(processor)``.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        *,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.workers = max(int(workers), 1)
+        super().__init__(max(int(max_pending), self.workers))
+        self._clock = clock
+        self._worker_slots: Optional[asyncio.Semaphore] = None
+        self._lanes: Dict[Hashable, _Lane] = {}
+        self._in_flight = 0
+        self._waiting = 0
+        self._waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self._stats = {"processed": 0, "failed": 0, "max_waiting": 0}
+
+    async def initialize(self) -> None:
+        """Nothing to set up: locks are created on first use."""
+
+    async def shutdown(self) -> None:
+        """Nothing to release; the application waits for running updates itself."""
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = update_key(update)
+        queued_at = self._clock()
+        self._waiting += 1
+        self._stats["max_waiting"] = max(self._stats["max_waiting"], self._waiting)
+        lane = None
+        if key is not None:
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = _Lane()
+            lane.users += 1
+        started = False
+        try:
+            if lane is not None:
+                await lane.lock.acquire()
+            try:
+                if self._worker_slots is None:
+                    self._worker_slots = asyncio.Semaphore(self.workers)
+                async with self._worker_slots:
+                    started = True
+                    self._waiting -= 1
+                    self._waits.append(self._clock() - queued_at)
+                    await self._run(coroutine)
+            finally:
+                if lane is not None:
+                    lane.lock.release()
+        finally:
+            if not started:
+                self._waiting -= 1
+                # Cancelled while waiting: the handler never ran, close it so it is not reported as never awaited
+                close = getattr(coroutine, "close", None)
+                if close is not None:
+                    close()
+            if lane is not None:
+                lane.users -= 1
+                if not lane.users and self._lanes.get(key) is lane:
+                    del self._lanes[key]
+
+    def metrics(self) -> Dict[str, Any]:
+        waits: List[float] = sorted(self._waits)
+
+        def percentile(fraction: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(len(waits) * fraction))] * 1000, 1)
+
+        return {
+            "workers": self.workers,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "active_keys": len(self._lanes),
+            "wait_p50_ms": percentile(0.5),
+            "wait_p95_ms": percentile(0.95),
+            **self._stats,
+        }
+
+    # ------------------------------------------------------------------ #
+    # Internals
+    # ------------------------------------------------------------------ #
+    async def _run(self, coroutine: Awaitable[Any]) -> None:
+        self._in_flight += 1
+        try:
+            await coroutine
+            self._stats["processed"] += 1
+        except BaseException:
+            self._stats["failed"] += 1
+            raise
+        finally:
+            self._in_flight -= 1
@@ -8,7 +8,11 @@ import logging
 from datetime import datetime, timedelta
 from typing import Dict, Optional, List
 import asyncio
-from threading import Lock
+from threading import RLock
+
+from activity_index import ActivityIndex
+from records import ProgressRecord, records_from_mapping, records_to_mapping
+from sqlite_store import get_default_store
 
 logger = logging.getLogger(__name__)
 
@@ -17,13 +21,26 @@ class UserProgressManager:
     
     def __init__(self, progress_file: str = "user_progress.json"):
         self.progress_file = progress_file
-        self.progress_data = self.load_progress()
-        self.lock = Lock()  # Защита от одновременного доступа
+        self.store = get_default_store()  # SQLite при STORAGE_BACKEND=sqlite
+        self.lock = RLock()  # Защита от одновременного доступа (реентерабельная: save внутри lock)
+        # Компактные записи ProgressRecord с ключом int user_id
+        self.progress_data: Dict[int, ProgressRecord] = records_from_mapping(ProgressRecord, self.load_progress())
+        # Индекс по времени активности и счётчик уроков для get_group_stats без полного прохода
+        self.activity = ActivityIndex(
+            (user_id, data.last_activity_ts or 0) for user_id, data in self.progress_data.items()
+        )
+        self.total_lessons = sum(data.total_lessons_requested or 0 for data in self.progress_data.values())
         self.last_activity = {}  # Кэш последней активности
         self.rate_limit = {}  # Защита от спама
         
     def load_progress(self) -> Dict:
         """Загрузить данные о прогрессе пользователей"""
+        if self.store is not None:
+            try:
+                return self.store.load_progress()
+            except Exception as e:
+                logger.error(f"Ошибка загрузки прогресса из SQLite: {e}")
+                return {}
         try:
             if os.path.exists(self.progress_file):
                 with open(self.progress_file, 'r', encoding='utf-8') as f:
@@ -33,13 +50,35 @@ class UserProgressManager:
         return {}
     
     def save_progress(self):
-        """Сохранить данные о прогрессе пользователей"""
+        """Сохранить данные о прогрессе всех пользователей"""
         try:
             with self.lock:
+                payload = records_to_mapping(self.progress_data.items())
+                if self.store is not None:
+                    self.store.upsert_progress_many(payload)
+                    return
                 with open(self.progress_file, 'w', encoding='utf-8') as f:
-                    json.dump(self.progress_data, f, ensure_ascii=False, indent=2)
+                    json.dump(payload, f, ensure_ascii=False, indent=2)
         except Exception as e:
             logger.error(f"Ошибка сохранения прогресса: {e}")
+
+    def save_user_progress(self, user_id: int):
+        """Сохранить прогресс одного пользователя (одна строка в SQLite)"""
+        user_id = int(user_id)
+        with self.lock:
+            record = self.progress_data.get(user_id)
+            if record is not None:
+                self.activity.touch(user_id, record.last_activity_ts or 0)
+        if self.store is None:
+            self.save_progress()
+            return
+        try:
+            with self.lock:
+                record = self.progress_data.get(user_id)
+                if record is not None:
+                    self.store.upsert_progress(user_id, record.to_dict())
+        except Exception as e:
+            logger.error(f"Ошибка сохранения прогресса пользователя {user_id}: {e}")
     
     def is_rate_limited(self, user_id: int, action: str = "lesson") -> bool:
         """Проверить, не превышен ли лимит запросов"""
@@ -61,48 +100,49 @@ class UserProgressManager:
         self.rate_limit[key] = now
         return False
     
-    def get_user_progress(self, user_id: int) -> Dict:
+    def get_user_progress(self, user_id: int) -> ProgressRecord:
         """Получить прогресс пользователя"""
+        user_id = int(user_id)
         with self.lock:
-            if str(user_id) not in self.progress_data:
-                self.progress_data[str(user_id)] = {
-                    "current_lesson": 0,
-                    "completed_lessons": [],
-                    "started_at": datetime.now().isoformat(),
-                    "last_activity": datetime.now().isoformat(),
-                    "total_lessons_requested": 0,
-                    "last_lesson_time": None
-                }
-                self.save_progress()
+            if user_id not in self.progress_data:
+                self.progress_data[user_id] = self._new_record()
+                self.save_user_progress(user_id)
             
-            return self.progress_data[str(user_id)]
+            return self.progress_data[user_id]
+
+    @staticmethod
+    def _new_record() -> ProgressRecord:
+        now = int(datetime.now().timestamp())
+        return ProgressRecord(started_at=now, last_activity=now)
     
     def update_user_progress(self, user_id: int, lesson_index: int, completed: bool = False):
         """Обновить прогресс пользователя"""
         user_data = self.get_user_progress(user_id)
         
         if completed:
-            if lesson_index not in user_data["completed_lessons"]:
-                user_data["completed_lessons"].append(lesson_index)
+            user_data.mark_completed(lesson_index)
         
-        user_data["current_lesson"] = lesson_index
-        user_data["last_activity"] = datetime.now().isoformat()
-        user_data["total_lessons_requested"] = user_data.get("total_lessons_requested", 0) + 1
-        user_data["last_lesson_time"] = datetime.now().isoformat()
+        now = int(datetime.now().timestamp())
+        user_data.current_lesson = lesson_index
+        user_data.last_activity_ts = now
+        user_data.total_lessons_requested = (user_data.total_lessons_requested or 0) + 1
+        with self.lock:
+            self.total_lessons += 1
+        user_data.last_lesson_ts = now
         
-        self.save_progress()
+        self.save_user_progress(user_id)
     
     def get_next_lesson(self, user_id: int) -> int:
         """Получить следующий урок для пользователя"""
         user_data = self.get_user_progress(user_id)
-        return user_data["current_lesson"]
+        return user_data.current_lesson
     
     def get_user_stats(self, user_id: int) -> Dict:
         """Получить статистику пользователя"""
         user_data = self.get_user_progress(user_id)
         return {
             "current_lesson": user_data["current_lesson"],
-            "completed_count": len(user_data["completed_lessons"]),
+            "completed_count": len(user_data.completed),
             "started_at": user_data["started_at"],
             "last_activity": user_data["last_activity"],
             "total_lessons_requested": user_data.get("total_lessons_requested", 0),
@@ -111,25 +151,22 @@ class UserProgressManager:
     
     def reset_user_progress(self, user_id: int):
         """Сбросить прогресс пользователя"""
+        user_id = int(user_id)
         with self.lock:
-            self.progress_data[str(user_id)] = {
-                "current_lesson": 0,
-                "completed_lessons": [],
-                "started_at": datetime.now().isoformat(),
-                "last_activity": datetime.now().isoformat(),
-                "total_lessons_requested": 0,
-                "last_lesson_time": None
-            }
-            self.save_progress()
+            previous = self.progress_data.get(user_id)
+            if previous is not None:
+                self.total_lessons -= previous.total_lessons_requested or 0
+            self.progress_data[user_id] = self._new_record()
+            self.save_user_progress(user_id)
     
     def get_all_users(self) -> List[Dict]:
         """Получить список всех пользователей"""
         users = []
         for user_id, data in self.progress_data.items():
             users.append({
-                "user_id": int(user_id),
-                "current_lesson": data["current_lesson"],
-                "completed_count": len(data["completed_lessons"]),
+                "user_id": user_id,
+                "current_lesson": data.current_lesson,
+                "completed_count": len(data.completed),
                 "started_at": data["started_at"],
                 "last_activity": data["last_activity"],
                 "total_lessons_requested": data.get("total_lessons_requested", 0)
@@ -138,16 +175,12 @@ class UserProgressManager:
     
     def get_group_stats(self) -> Dict:
         """Получить статистику по всей группе"""
-        total_users = len(self.progress_data)
-        active_users = 0
-        total_lessons = 0
-        
-        for user_id, data in self.progress_data.items():
-            total_lessons += data.get("total_lessons_requested", 0)
-            # Активный пользователь - тот, кто был активен в последние 7 дней
-            last_activity = datetime.fromisoformat(data["last_activity"])
-            if datetime.now() - last_activity < timedelta(days=7):
-                active_users += 1
+        # Активный пользователь - тот, кто был активен в последние 7 дней
+        cutoff = int((datetime.now() - timedelta(days=7)).timestamp())
+        with self.lock:
+            total_users = len(self.progress_data)
+            active_users = self.activity.count_since(cutoff)
+            total_lessons = self.total_lessons
         
         return {
             "total_users": total_users,
@@ -8,63 +8,21 @@ import logging
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 
-logger = logging.getLogger(__name__)
+from message_analysis import MessageAnalysis, language_from_keywords, language_from_syntax
+from message_keywords import MESSAGE_KEYWORDS, PROGRAMMING_LANGUAGES  # noqa: F401 (PROGRAMMING_LANGUAGES re-exported)
+from telegram_format import iter_message_chunks
 
-# Расширенный список языков программирования
-PROGRAMMING_LANGUAGES = {
-    'python': ['python', 'py', 'питон', 'пайтон'],
-    'javascript': ['javascript', 'js', 'джаваскрипт', 'node'],
-    'typescript': ['typescript', 'ts', 'тайпскрипт'],
-    'java': ['java', 'джава'],
-    'cpp': ['c++', 'cpp', 'c plus plus', 'си плюс плюс'],
-    'c': ['c', 'си'],
-    'rust': ['rust', 'раст'],
-    'go': ['go', 'golang', 'гоу'],
-    'php': ['php', 'пхп'],
-    'ruby': ['ruby', 'руби'],
-    'swift': ['swift', 'свифт'],
-    'kotlin': ['kotlin', 'котлин'],
-    'sql': ['sql', 'mysql', 'postgresql', 'sqlite'],
-    'html': ['html', 'хтмл'],
-    'css': ['css', 'стили'],
-    'bash': ['bash', 'shell', 'terminal', 'терминал']
-}
+logger = logging.getLogger(__name__)
 
 
 def extract_programming_language(text: str) -> Optional[str]:
-    """Определить язык программирования из текста"""
-    text_lower = text.lower()
-
-    for lang, keywords in PROGRAMMING_LANGUAGES.items():
-        if any(keyword in text_lower for keyword in keywords):
-            return lang
-
-    # Проверяем по синтаксису кода
-    if 'def ' in text and ':' in text:
-        return 'python'
-    elif 'function' in text and '{' in text:
-        return 'javascript'
-    elif 'public class' in text:
-        return 'java'
-    elif '#include' in text:
-        return 'cpp'
-
-    return None
+    """Определить язык программирования из текста (по таблице PROGRAMMING_LANGUAGES, затем по синтаксису)"""
+    return language_from_keywords(MESSAGE_KEYWORDS.find(text.lower())) or language_from_syntax(text)
 
 
 def is_code_question(text: str) -> bool:
-    """Определить является ли вопрос связанным с программированием"""
-    programming_indicators = [
-        'код', 'функция', 'переменная', 'массив', 'объект', 'класс',
-        'алгоритм', 'ошибка', 'баг', 'отладка', 'программа',
-        'code', 'function', 'variable', 'array', 'object', 'class',
-        'algorithm', 'error', 'bug', 'debug', 'program',
-        '```', 'import', 'from', 'def ', 'function', 'var ', 'let ',
-        'const ', 'class ', 'interface', 'type', 'struct'
-    ]
-
-    text_lower = text.lower()
-    return any(indicator in text_lower for indicator in programming_indicators)
+    """Определить является ли вопрос связанным с программированием (признаки: CODE_INDICATORS)"""
+    return "code" in MESSAGE_KEYWORDS.find(text.lower())
 
 
 def format_code_response(response: str) -> str:
@@ -104,44 +62,8 @@ def clean_response(response: str) -> str:
 
 
 def split_long_message(text: str, max_length: int = 4000) -> List[str]:
-    """Разделить длинное сообщение на части с умным разбиением"""
-    if len(text) <= max_length:
-        return [text]
-
-    parts = []
-    current_part = ""
-
-    # Разбиваем по абзацам
-    paragraphs = text.split('\n\n')
-
-    for paragraph in paragraphs:
-        # Если абзац слишком длинный, разбиваем по предложениям
-        if len(paragraph) > max_length:
-            sentences = paragraph.split('. ')
-            for sentence in sentences:
-                if len(current_part + sentence) > max_length:
-                    if current_part:
-                        parts.append(current_part.strip())
-                        current_part = sentence + '. '
-                    else:
-                        # Если даже одно предложение слишком длинное
-                        parts.append(sentence[:max_length] + "...")
-                else:
-                    current_part += sentence + '. '
-        else:
-            if len(current_part + paragraph) > max_length:
-                if current_part:
-                    parts.append(current_part.strip())
-                    current_part = paragraph + '\n\n'
-                else:
-                    parts.append(paragraph)
-            else:
-                current_part += paragraph + '\n\n'
-
-    if current_part:
-        parts.append(current_part.strip())
-
-    return parts
+    """Разделить длинное сообщение на части: по абзацам, строкам или словам, за один проход"""
+    return list(iter_message_chunks(text, max_length, html=False))
 
 
 def analyze_code_complexity(code: str) -> Dict[str, any]:
@@ -190,16 +112,18 @@ def generate_code_suggestions(code: str, language: str) -> List[str]:
     return suggestions
 
 
-def log_user_interaction(user_id: int, username: str, message: str, response_length: int):
-    """Расширенное логирование взаимодействий"""
+def log_user_interaction(user_id: int, username: str, message: str, response_length: int, analysis=None):
+    """Расширенное логирование взаимодействий (analysis — уже готовый MessageAnalysis сообщения)"""
+    if analysis is None:
+        analysis = MessageAnalysis(message)
     interaction_data = {
         'timestamp': datetime.now().isoformat(),
         'user_id': user_id,
         'username': username,
         'message_length': len(message),
         'response_length': response_length,
-        'language': extract_programming_language(message),
-        'is_code_related': is_code_question(message)
+        'language': analysis.language,
+        'is_code_related': analysis.is_code_question
     }
 
     logger.info(f"User interaction: {json.dumps(interaction_data)}")
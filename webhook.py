@@ -0,0 +1,77 @@
+"""Telegram webhook receiver for the bot's aiohttp server."""
+
+from __future__ import annotations
+
+import hmac
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict
+
+from aiohttp import web
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+ACK_SAMPLES = 500
+
+
+class WebhookReceiver:
+    """Accept updates posted by Telegram and hand them to ``application.update_queue``.
+
+    A request without the ``secret`` in the ``X-Telegram-Bot-Api-Secret-Token``
+    header gets 403.  A valid one is answered with 200 as soon as the update is
+    queued: handlers run later in the application's own update loop, so a slow
+    answer never holds the HTTP request and Telegram never redelivers because
+    of it.  Malformed bodies get 400 (Telegram would retry anything else).
+    """
+
+    def __init__(self, application: Any, secret: str) -> None:
+        self.application = application
+        self._secret = secret.encode("utf-8")
+        self._acks: Deque[float] = deque(maxlen=ACK_SAMPLES)
+        self._stats = {"received": 0, "rejected": 0, "malformed": 0}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        started = time.perf_counter()
+        token = request.headers.get(SECRET_HEADER, "").encode("utf-8")
+        if not hmac.compare_digest(token, self._secret):
+            self._stats["rejected"] += 1
+            return web.Response(status=403)
+        try:
+            update = Update.de_json(json.loads(await request.read()), self.application.bot)
+        except (ValueError, TypeError, KeyError) as error:
+            self._stats["malformed"] += 1
+            logger.warning("Malformed webhook update: %s", error)
+            return web.Response(status=400)
+        if update is None:
+            self._stats["malformed"] += 1
+            return web.Response(status=400)
+        self.application.update_queue.put_nowait(update)
+        self._stats["received"] += 1
+        self._acks.append(time.perf_counter() - started)
+        return web.Response()
+
+    def metrics(self) -> Dict[str, Any]:
+        acks = sorted(self._acks)
+
+        def percentile(fraction: float) -> float:
+            if not acks:
+                return 0.0
+            return round(acks[min(len(acks) - 1, int(len(acks) * fraction))] * 1000, 2)
+
+        return {
+            **self._stats,
+            "update_queue": self.application.update_queue.qsize(),
+            "ack_p50_ms": percentile(0.5),
+            "ack_p95_ms": percentile(0.95),
+        }
+
+
+def setup_webhook(app: web.Application, application: Any, path: str, secret: str) -> WebhookReceiver:
+    """Register ``POST path`` on ``app`` and return the receiver behind it."""
+    receiver = WebhookReceiver(application, secret)
+    app.router.add_post(path, receiver.handle)
+    return receiver